@@ -19,6 +19,11 @@ done
 # Apply Django migrations
 python manage.py migrate
 
+# Share the media URL signing secret with Nginx so it can serve signed media links itself
+MEDIA_SIGNING_SECRET=$(python manage.py shell -c "from django.conf import settings; print(settings.MEDIA_SIGNING_SECRET)")
+echo "set \$media_signing_secret \"$MEDIA_SIGNING_SECRET\";" > /etc/nginx/media_signing.conf
+nginx -s reload || >&2 echo "WARNING: Could not reload Nginx, signed media URLs will be served through Django"
+
 # Create superuser if environment variables are set and there are no users present at all.
 if [ -n "$DJANGO_ADMIN_USERNAME" ] && [ -n "$DJANGO_ADMIN_PASSWORD" ] && [ -n "$DJANGO_ADMIN_EMAIL" ]; then
   echo "Creating superuser..."
@@ -60,6 +65,11 @@ if [ $? -eq 137 ]; then
   exit 1
 fi
 
+# Every hour (and right away): generate renditions for images that were not processed yet, e.g.
+# after an upgrade or when their background task was lost or failed, and delete abandoned
+# resumable uploads and old account exports. Images claimed by a running task are skipped.
+(while true; do python manage.py process-images; python manage.py cleanup-uploads; python manage.py cleanup-exports; sleep 3600; done) &
+
 cat /code/adventurelog.txt
 
 # Start Gunicorn in foreground
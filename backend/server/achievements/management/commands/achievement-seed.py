@@ -1,6 +1,8 @@
 import json
+from django.contrib.auth import get_user_model
 from django.core.management.base import BaseCommand
 from achievements.models import Achievement
+from achievements.utils.evaluator import evaluate_achievements
 
 US_STATE_CODES = [
     'US-AL', 'US-AK', 'US-AZ', 'US-AR', 'US-CA', 'US-CO', 'US-CT', 'US-DE', 
@@ -64,3 +66,9 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS(f"✅ Created: {achievement.name}"))
             else:
                 self.stdout.write(self.style.WARNING(f"🔄 Updated: {achievement.name}"))
+
+        # New achievements are only checked on new events, award what existing users already qualify for
+        awarded = 0
+        for user_id in get_user_model().objects.values_list('id', flat=True).iterator():
+            awarded += len(evaluate_achievements(user_id))
+        self.stdout.write(self.style.SUCCESS(f"🏆 Awarded {awarded} achievements to existing users"))
@@ -0,0 +1,36 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from achievements.models import Achievement
+from achievements.utils.evaluator import achievement_index, evaluate_achievements
+from adventures.models import Adventure, TravelStats
+from adventures.utils.stats import travel_stats_refreshed
+from worldtravel.models import VisitedRegion
+
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def invalidate_achievement_index(sender, **kwargs):
+    achievement_index.invalidate()
+
+
+# Evaluated after commit so the travel stats counters are already up to date
+
+@receiver(post_save, sender=Adventure)
+def check_adventure_achievements(sender, instance, created, **kwargs):
+    if created:
+        user_id = instance.user_id_id
+        transaction.on_commit(lambda: evaluate_achievements(user_id, ['adventure_count']))
+
+
+@receiver(post_save, sender=VisitedRegion)
+def check_region_achievements(sender, instance, created, **kwargs):
+    if created:
+        user_id = instance.user_id_id
+        transaction.on_commit(lambda: evaluate_achievements(user_id, ['country_count']))
+
+
+@receiver(travel_stats_refreshed, sender=TravelStats)
+def check_all_achievements(sender, user_id, stats, **kwargs):
+    transaction.on_commit(lambda: evaluate_achievements(user_id, stats=stats))
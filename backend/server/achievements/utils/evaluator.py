@@ -0,0 +1,102 @@
+import json
+import time
+from dataclasses import dataclass
+
+from achievements.models import VALID_ACHIEVEMENT_TYPES, Achievement, UserAchievement
+from adventures.models import TravelStats
+from adventures.utils.stats import refresh_travel_stats
+from worldtravel.models import VisitedRegion
+
+# Achievement type -> TravelStats counter its "value" is compared against
+COUNTERS = {
+    'adventure_count': 'adventure_count',
+    'country_count': 'visited_country_count',
+}
+
+# Other processes (e.g. achievement-seed) can change achievements, so the index is rebuilt
+# regularly even when this process did not see a change
+INDEX_TTL = 5 * 60
+
+
+@dataclass(frozen=True)
+class Rule:
+    achievement_id: int
+    # TravelStats field compared against value
+    counter: str
+    value: int = 0
+    # Region ids that all have to be visited, e.g. every US state
+    items: frozenset = frozenset()
+
+
+class AchievementIndex:
+    """
+    Achievements grouped by the type of counter they depend on, with their conditions parsed
+    once. An event only has to look at the rules of its own type.
+    """
+
+    def __init__(self):
+        self._rules = None
+        self._built_at = 0
+
+    def invalidate(self):
+        self._rules = None
+
+    def rules(self, achievement_type):
+        if self._rules is None or time.monotonic() - self._built_at > INDEX_TTL:
+            self._rules = self._build()
+            self._built_at = time.monotonic()
+        return self._rules.get(achievement_type, [])
+
+    def _build(self):
+        rules = {}
+        for achievement_id, achievement_type, condition in Achievement.objects.values_list('id', 'type', 'condition'):
+            # achievement-seed stores the condition as a JSON encoded string
+            if isinstance(condition, str):
+                condition = json.loads(condition)
+            if achievement_type not in COUNTERS:
+                continue
+            rules.setdefault(achievement_type, []).append(Rule(
+                achievement_id=achievement_id,
+                counter=COUNTERS[achievement_type],
+                value=int(condition.get('value') or 0),
+                items=frozenset(condition.get('items') or ()),
+            ))
+        return rules
+
+
+achievement_index = AchievementIndex()
+
+
+def evaluate_achievements(user_id, types=VALID_ACHIEVEMENT_TYPES, stats=None):
+    """
+    Awards every achievement of the given types the user has newly qualified for and returns
+    the ids of the awarded achievements. Achievements are never taken away again.
+    """
+    if stats is None:
+        stats = TravelStats.objects.filter(user_id=user_id).first() or refresh_travel_stats(user_id)
+
+    # Counter thresholds need no query, most events end here
+    candidates = [
+        rule for achievement_type in types for rule in achievement_index.rules(achievement_type)
+        if getattr(stats, rule.counter) >= rule.value
+    ]
+    if not candidates:
+        return []
+    earned = set(UserAchievement.objects.filter(
+        user_id=user_id, achievement_id__in=[rule.achievement_id for rule in candidates],
+    ).values_list('achievement_id', flat=True))
+    pending = [rule for rule in candidates if rule.achievement_id not in earned]
+
+    # Only the regions some pending rule asks for are loaded
+    wanted = frozenset().union(*(rule.items for rule in pending))
+    visited = frozenset()
+    if wanted:
+        visited = frozenset(VisitedRegion.objects.filter(user_id=user_id, region_id__in=wanted).values_list('region_id', flat=True))
+
+    awarded = [rule.achievement_id for rule in pending if rule.items <= visited]
+    if awarded:
+        UserAchievement.objects.bulk_create(
+            [UserAchievement(user_id=user_id, achievement_id=achievement_id) for achievement_id in awarded],
+            ignore_conflicts=True,
+        )
+    return awarded
@@ -34,10 +34,14 @@ class CountryAdmin(admin.ModelAdmin):
     list_filter = ('subregion',)
     search_fields = ('name', 'country_code')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counts()
+
     def number_of_regions(self, obj):
-        return Region.objects.filter(country=obj).count()
+        return obj.num_regions
 
     number_of_regions.short_description = 'Number of Regions'
+    number_of_regions.admin_order_field = 'num_regions'
 
 
 class RegionAdmin(admin.ModelAdmin):
@@ -46,16 +50,22 @@ class RegionAdmin(admin.ModelAdmin):
     search_fields = ('name', 'country__name')
     # list_filter = ('country', 'number_of_visits')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_counts(num_visits=True)
+
     def number_of_visits(self, obj):
-        return VisitedRegion.objects.filter(region=obj).count()
+        return obj.num_visits
     
     number_of_visits.short_description = 'Number of Visits'
+    number_of_visits.admin_order_field = 'num_visits'
 
 class CityAdmin(admin.ModelAdmin):
     list_display = ('name', 'region', 'country')
     list_filter = ('region', 'region__country')
     search_fields = ('name', 'region__name', 'region__country__name')
 
+    list_select_related = ('region__country',)
+
     def country(self, obj):
         return obj.region.country.name
 
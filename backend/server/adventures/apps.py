@@ -3,4 +3,7 @@ from django.conf import settings
 
 class AdventuresConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'adventures'
\ No newline at end of file
+    name = 'adventures'
+
+    def ready(self):
+        import adventures.signals  # noqa: F401
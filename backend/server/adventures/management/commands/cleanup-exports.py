@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from adventures.utils.export import delete_stale_exports
+
+
+class Command(BaseCommand):
+    help = 'Deletes account exports that were built longer than EXPORT_TTL ago'
+
+    def handle(self, **options):
+        deleted = delete_stale_exports()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} old exports'))
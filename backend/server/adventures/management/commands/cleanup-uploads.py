@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from adventures.views.resumable_upload_mixin import delete_stale_uploads
+
+
+class Command(BaseCommand):
+    help = 'Deletes resumable uploads that were abandoned for longer than UPLOAD_SESSION_TTL'
+
+    def handle(self, **options):
+        deleted = delete_stale_uploads()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} abandoned uploads'))
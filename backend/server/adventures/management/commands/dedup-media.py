@@ -0,0 +1,118 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from adventures.models import AdventureImage, Attachment
+from adventures.signals import delete_blob_if_unreferenced
+from adventures.utils.content_storage import content_addressed_storage, hash_file, hashed_name, is_hashed_name, lock_blob
+from adventures.utils.image_processing import rendition_dir
+
+
+class Command(BaseCommand):
+    help = 'Renames stored images and attachments to their content hash so identical files are only stored once'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be done')
+        parser.add_argument('--prune', action='store_true', help='Also delete files no image or attachment refers to')
+
+    def handle(self, **options):
+        self.dry_run = options['dry_run']
+        self.storage = content_addressed_storage
+        self.saved_bytes = 0
+
+        renamed = self.dedup(AdventureImage, 'image', 'images')
+        renamed += self.dedup(Attachment, 'file', 'attachments')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Would rename" if self.dry_run else "Renamed"} {renamed} files, '
+            f'{self.saved_bytes / (1024 * 1024):.1f} MB freed by duplicates'
+        ))
+
+        if options['prune']:
+            pruned = self.prune(AdventureImage, 'image', 'images') + self.prune(Attachment, 'file', 'attachments')
+            self.stdout.write(self.style.SUCCESS(f'{"Would delete" if self.dry_run else "Deleted"} {pruned} unreferenced files'))
+
+    def dedup(self, model, field, directory):
+        names = (
+            model.objects.exclude(**{field: ''})
+            .values_list(field, flat=True).distinct().order_by(field)
+        )
+        renamed = 0
+        for name in names.iterator():
+            if is_hashed_name(name):
+                continue
+            path = self.storage.path(name)
+            if not os.path.exists(path):
+                self.stdout.write(self.style.WARNING(f'Missing file {name}, skipping'))
+                continue
+
+            target = hashed_name(directory, hash_file(path), name)
+            size = os.path.getsize(path)
+            renamed += 1
+            if self.dry_run:
+                if self.storage.exists(target):
+                    self.saved_bytes += size
+                continue
+
+            with transaction.atomic():
+                # Held until the rows point at target, so a concurrent cleanup of target either
+                # ran before the exists check or counts these rows
+                lock_blob(target)
+                duplicate = self.storage.exists(target)
+                if duplicate:
+                    self.saved_bytes += size
+                if field == 'image':
+                    self.move_renditions(name, target)
+                model.objects.filter(**{field: name}).update(**{field: target})
+                if duplicate:
+                    os.remove(path)
+                else:
+                    os.replace(path, self.storage.path(target))
+        return renamed
+
+    def move_renditions(self, name, target):
+        """
+        Renditions live in a directory named after the original, so they follow it to its new
+        name. Rendition file names within the directory are fixed, so the stored paths only need
+        their directory replaced.
+        """
+        old_dir, new_dir = rendition_dir(name), rendition_dir(target)
+        old_path, new_path = self.storage.path(old_dir), self.storage.path(new_dir)
+        if os.path.isdir(old_path):
+            if os.path.isdir(new_path):
+                shutil.rmtree(old_path)
+            else:
+                os.replace(old_path, new_path)
+
+        images = list(AdventureImage.objects.filter(image=name).exclude(renditions={}))
+        for adventure_image in images:
+            adventure_image.renditions = {
+                rendition: {
+                    key: value.replace(f'{old_dir}/', f'{new_dir}/', 1) if isinstance(value, str) else value
+                    for key, value in entry.items()
+                }
+                for rendition, entry in adventure_image.renditions.items()
+            }
+        AdventureImage.objects.bulk_update(images, ['renditions'], batch_size=500)
+
+    def prune(self, model, field, directory):
+        if not self.storage.exists(directory):
+            return 0
+        # Only narrows down the candidates, rows committed after this are counted again under the
+        # blob lock before anything is deleted
+        referenced = set(model.objects.values_list(field, flat=True))
+        pruned = 0
+        for filename in self.storage.listdir(directory)[1]:
+            name = f'{directory}/{filename}'
+            # Skip uploads that are still being written
+            if filename.startswith('.') or name in referenced:
+                continue
+            if self.dry_run:
+                pruned += 1
+            elif delete_blob_if_unreferenced(name):
+                pruned += 1
+                if directory == 'images':
+                    rendition_path = self.storage.path(rendition_dir(name))
+                    if os.path.isdir(rendition_path):
+                        shutil.rmtree(rendition_path)
+        return pruned
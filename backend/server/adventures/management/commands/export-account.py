@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from adventures.utils.export import export_filename, iter_account_export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Exports the adventures, collections, notes, media and other data of a user as a ZIP archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User to export')
+        parser.add_argument('--output', help='Path of the archive (defaults to adventurelog-export-<username>-<date>.zip)')
+
+    def handle(self, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User with username "{options["username"]}" does not exist.')
+
+        output = options['output'] or export_filename(user)
+        size = 0
+        with open(output, 'wb') as f:
+            for chunk in iter_account_export(user):
+                f.write(chunk)
+                size += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(f'Exported {user.username} to {output} ({size / (1024 * 1024):.1f} MB)'))
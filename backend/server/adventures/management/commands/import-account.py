@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from adventures.utils.importer import DEFAULT_BATCH_SIZE, AdventureImporter, ImportFormatError
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Imports an account export (.zip), a CSV file or a GeoJSON FeatureCollection into a user account'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User to import into')
+        parser.add_argument('path', help='File to import')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count without saving anything')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows inserted per query')
+
+    def handle(self, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User with username "{options["username"]}" does not exist.')
+
+        started = time.monotonic()
+        last_report = [started]
+
+        def progress(report):
+            # At most one progress line per second
+            now = time.monotonic()
+            if now - last_report[0] >= 1:
+                last_report[0] = now
+                created = ', '.join(f'{count} {key}' for key, count in report['created'].items())
+                self.stdout.write(f'{created} ({report["skipped"]} skipped)')
+
+        importer = AdventureImporter(user, dry_run=options['dry_run'], batch_size=max(1, options['batch_size']), progress=progress)
+        try:
+            with open(options['path'], 'rb') as f:
+                report = importer.run(f, options['path'])
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stdout.write(self.style.WARNING(f'Line {error["line"]}: {error["error"]}'))
+        created = ', '.join(f'{count} {key}' for key, count in report['created'].items()) or 'nothing'
+        prefix = 'Dry run, would have imported' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix} {created} in {time.monotonic() - started:.1f}s ({report["skipped"]} rows skipped)'
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from adventures.utils.importer import ImportFormatError
+from adventures.utils.location_history import LocationHistoryImporter
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Creates adventures and visits from the stays found in a Google Takeout or Polarsteps location history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='User to import into')
+        parser.add_argument('path', help='Records.json / Timeline.json (Google) or locations.json / trip.json (Polarsteps)')
+        parser.add_argument('--dry-run', action='store_true', help='Cluster and count without saving anything')
+
+    def handle(self, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User with username "{options["username"]}" does not exist.')
+
+        started = time.monotonic()
+
+        def progress(report):
+            if 'points' in report:
+                self.stdout.write(f'Read {report["points"]} points', ending='\r')
+
+        importer = LocationHistoryImporter(user, dry_run=options['dry_run'], progress=progress)
+        try:
+            with open(options['path'], 'rb') as f:
+                report = importer.run(f)
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        self.stdout.write('')
+        if report.get('frequent_places_skipped'):
+            self.stdout.write(f'Skipped {report["frequent_places_skipped"]} frequently visited places (home, work)')
+        created = ', '.join(f'{count} {key}' for key, count in report['created'].items()) or 'nothing'
+        prefix = 'Dry run, would have imported' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {created} in {time.monotonic() - started:.1f}s'))
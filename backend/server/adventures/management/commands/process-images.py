@@ -0,0 +1,75 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.models import Q
+from adventures.models import AdventureImage
+from adventures.utils.image_processing import claim_image, process_image, release_image
+
+# Images missing their renditions or their placeholder and size
+PENDING = Q(is_processed=False) | Q(placeholder__isnull=True)
+
+
+def _process_batch(image_ids, regenerate):
+    """
+    Runs in a worker process. Images that already have renditions only get their placeholder
+    and size filled in unless `regenerate` is set. Returns (processed, [(id, error), ...]).
+    """
+    processed = 0
+    errors = []
+    condition = Q() if regenerate else PENDING
+    try:
+        for image_id in image_ids:
+            # Images the request thread pool is working on (or has finished meanwhile) are skipped
+            claimed_at = claim_image(image_id, condition)
+            if claimed_at is None:
+                continue
+            try:
+                adventure_image = AdventureImage.objects.get(id=image_id)
+                process_image(adventure_image, renditions=regenerate or not adventure_image.is_processed)
+                processed += 1
+            except Exception as e:
+                errors.append((str(image_id), str(e)))
+            finally:
+                release_image(image_id, claimed_at)
+    finally:
+        connection.close()
+    return processed, errors
+
+
+class Command(BaseCommand):
+    help = 'Generates the renditions, placeholders and sizes of adventure images that are missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Regenerate the renditions of every image')
+        parser.add_argument('--batch-size', type=int, default=50, help='Number of images handed to a worker at once')
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes (0 to process in this process)')
+
+    def handle(self, **options):
+        images = AdventureImage.objects.exclude(image='')
+        if not options['all']:
+            images = images.filter(PENDING)
+        image_ids = list(images.values_list('id', flat=True))
+        batch_size = max(1, options['batch_size'])
+        batches = [image_ids[i:i + batch_size] for i in range(0, len(image_ids), batch_size)]
+
+        processed = 0
+        failed = 0
+        if options['workers'] > 0 and len(batches) > 1:
+            # Forked workers must not share the parent's database connection
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                results = executor.map(_process_batch, batches, [options['all']] * len(batches))
+                for batch_processed, errors in results:
+                    processed, failed = self._report(processed, failed, batch_processed, errors)
+        else:
+            for batch in batches:
+                batch_processed, errors = _process_batch(batch, options['all'])
+                processed, failed = self._report(processed, failed, batch_processed, errors)
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images ({failed} failed)'))
+
+    def _report(self, processed, failed, batch_processed, errors):
+        for image_id, error in errors:
+            self.stdout.write(self.style.ERROR(f'Error processing image {image_id}: {error}'))
+        return processed + batch_processed, failed + len(errors)
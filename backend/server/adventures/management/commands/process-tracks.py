@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from adventures.models import Attachment
+from adventures.utils.gpx import process_gpx_attachment
+
+
+class Command(BaseCommand):
+    help = 'Parses the tracks of GPX attachments that have not been processed yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Reparse every GPX attachment')
+
+    def handle(self, **options):
+        attachments = Attachment.objects.filter(file__iendswith='.gpx')
+        if not options['all']:
+            attachments = attachments.filter(tracks__isnull=True)
+        processed = 0
+        failed = 0
+        for attachment_id in attachments.values_list('id', flat=True).iterator():
+            try:
+                process_gpx_attachment(attachment_id)
+                processed += 1
+            except Exception as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f'Error processing attachment {attachment_id}: {e}'))
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} GPX attachments ({failed} failed)'))
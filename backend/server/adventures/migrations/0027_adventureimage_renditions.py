@@ -0,0 +1,29 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:05
+
+import adventures.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0026_adventureimage_immich_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adventureimage',
+            name='is_processed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='adventureimage',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='adventureimage',
+            name='image',
+            field=models.ImageField(upload_to=adventures.models.PathAndRename('images/')),
+        ),
+    ]
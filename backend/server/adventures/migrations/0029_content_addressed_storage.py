@@ -0,0 +1,25 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:08
+
+import adventures.models
+import adventures.utils.content_storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0028_adventureimage_placeholder'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adventureimage',
+            name='image',
+            field=models.ImageField(storage=adventures.utils.content_storage.get_content_addressed_storage, upload_to=adventures.models.PathAndRename('images/')),
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='file',
+            field=models.FileField(storage=adventures.utils.content_storage.get_content_addressed_storage, upload_to=adventures.models.PathAndRename('attachments/'), validators=[adventures.models.validate_file_extension]),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:11
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0030_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GpxTrack',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False, unique=True)),
+                ('name', models.CharField(blank=True, max_length=200, null=True)),
+                ('geometry', django.contrib.gis.db.models.fields.LineStringField(srid=4326)),
+                ('geometry_medium', django.contrib.gis.db.models.fields.LineStringField(spatial_index=False, srid=4326)),
+                ('geometry_low', django.contrib.gis.db.models.fields.LineStringField(spatial_index=False, srid=4326)),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('distance', models.FloatField(default=0)),
+                ('elevation_gain', models.FloatField(blank=True, null=True)),
+                ('elevation_loss', models.FloatField(blank=True, null=True)),
+                ('start_time', models.DateTimeField(blank=True, null=True)),
+                ('end_time', models.DateTimeField(blank=True, null=True)),
+                ('attachment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tracks', to='adventures.attachment')),
+            ],
+        ),
+    ]
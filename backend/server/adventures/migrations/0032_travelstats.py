@@ -0,0 +1,31 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0031_gpxtrack'),
+        ('users', '0004_customuser_disable_password'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TravelStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='travel_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('adventure_count', models.PositiveIntegerField(default=0)),
+                ('collection_count', models.PositiveIntegerField(default=0)),
+                ('visited_region_count', models.PositiveIntegerField(default=0)),
+                ('visited_city_count', models.PositiveIntegerField(default=0)),
+                ('visited_country_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Travel stats',
+            },
+        ),
+    ]
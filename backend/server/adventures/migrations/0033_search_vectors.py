@@ -0,0 +1,126 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:24
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.operations import TrigramExtension, UnaccentExtension
+from django.db import migrations
+
+# unaccent() is only STABLE because its dictionary can change, so it can't be used in index
+# expressions. The wrapper pins the dictionary and is what main.utils.SearchName calls.
+UNACCENT_FUNCTION = """
+CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text
+AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT;
+"""
+
+# Table -> (column, weight) that make up its search_vector
+SEARCH_DOCUMENTS = {
+    'adventures_adventure': [('name', 'A'), ('location', 'B'), ('activity_types', 'B'), ('description', 'C')],
+    'adventures_collection': [('name', 'A'), ('description', 'B')],
+    'adventures_note': [('name', 'A'), ('content', 'B')],
+    'adventures_checklist': [('name', 'A')],
+    'adventures_lodging': [('name', 'A'), ('location', 'B'), ('description', 'C')],
+    'adventures_transportation': [
+        ('name', 'A'), ('flight_number', 'B'), ('from_location', 'B'), ('to_location', 'B'), ('description', 'C'),
+    ],
+}
+ARRAY_COLUMNS = {'activity_types'}
+
+
+def trigger_sql(table, document):
+    parts = []
+    for column, weight in document:
+        value = f"array_to_string(NEW.{column}, ' ')" if column in ARRAY_COLUMNS else f'NEW.{column}'
+        parts.append(f"setweight(to_tsvector('simple', immutable_unaccent(coalesce({value}, ''))), '{weight}')")
+    columns = ', '.join(column for column, _ in document)
+    return f"""
+CREATE OR REPLACE FUNCTION {table}_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := {' || '.join(parts)};
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER {table}_search_vector BEFORE INSERT OR UPDATE OF {columns} ON {table}
+    FOR EACH ROW EXECUTE FUNCTION {table}_search_vector();
+UPDATE {table} SET name = name;
+"""
+
+
+def drop_trigger_sql(table):
+    return f"""
+DROP TRIGGER IF EXISTS {table}_search_vector ON {table};
+DROP FUNCTION IF EXISTS {table}_search_vector();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0032_travelstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        UnaccentExtension(),
+        migrations.RunSQL(UNACCENT_FUNCTION, 'DROP FUNCTION IF EXISTS immutable_unaccent(text);'),
+        migrations.AddField(
+            model_name='adventure',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='checklist',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='collection',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lodging',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='note',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='transportation',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='adventure',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='adventure_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='checklist',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='checklist_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='collection',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='collection_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='lodging',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='lodging_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='note',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='note_search_vector'),
+        ),
+        migrations.AddIndex(
+            model_name='transportation',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='transportation_search_vector'),
+        ),
+    ] + [
+        # The UPDATE in trigger_sql fills the column for existing rows
+        migrations.RunSQL(trigger_sql(table, document), drop_trigger_sql(table))
+        for table, document in SEARCH_DOCUMENTS.items()
+    ]
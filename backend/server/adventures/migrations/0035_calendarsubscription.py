@@ -0,0 +1,25 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:49
+
+import adventures.models
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0034_adventureimage_processing_started_at'),
+        ('users', '0005_customuser_name_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CalendarSubscription',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='calendar_subscription', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('token', models.CharField(default=adventures.models.generate_calendar_token, max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
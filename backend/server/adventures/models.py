@@ -1,20 +1,24 @@
 from django.core.exceptions import ValidationError
 import os
+import secrets
 from typing import Iterable
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.contrib.gis.db import models as gis_models
 from django.utils.deconstruct import deconstructible
 from adventures.managers import AdventureManager
+from adventures.utils.content_storage import get_content_addressed_storage
 from django.contrib.auth import get_user_model
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.forms import ValidationError
-from django_resized import ResizedImageField
 
 def validate_file_extension(value):
     import os
     from django.core.exceptions import ValidationError
     ext = os.path.splitext(value.name)[1]  # [0] returns path+filename
-    valid_extensions = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.mov', '.avi', '.mkv', '.mp3', '.wav', '.flac', '.ogg', '.m4a', '.wma', '.aac', '.opus', '.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.zst', '.lz4', '.lzma', '.lzo', '.z', '.tar.gz', '.tar.bz2', '.tar.xz', '.tar.zst', '.tar.lz4', '.tar.lzma', '.tar.lzo', '.tar.z', 'gpx', 'md', 'pdf']
+    valid_extensions = ['.pdf', '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.txt', '.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.mov', '.avi', '.mkv', '.mp3', '.wav', '.flac', '.ogg', '.m4a', '.wma', '.aac', '.opus', '.zip', '.rar', '.7z', '.tar', '.gz', '.bz2', '.xz', '.zst', '.lz4', '.lzma', '.lzo', '.z', '.tar.gz', '.tar.bz2', '.tar.xz', '.tar.zst', '.tar.lz4', '.tar.lzma', '.tar.lzo', '.tar.z', '.gpx', '.md']
     if not ext.lower() in valid_extensions:
         raise ValidationError('Unsupported file extension.')
 
@@ -109,6 +113,11 @@ class Adventure(models.Model):
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger, see migration 0033
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='adventure_search_vector')]
 
     objects = AdventureManager()
 
@@ -167,6 +176,11 @@ class Collection(models.Model):
     is_archived = models.BooleanField(default=False)
     shared_with = models.ManyToManyField(User, related_name='shared_with', blank=True)
     link = models.URLField(blank=True, null=True, max_length=2083)
+    # Maintained by a database trigger, see migration 0033
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='collection_search_vector')]
 
 
     # if connected adventures are private and collection is public, raise an error
@@ -202,6 +216,11 @@ class Transportation(models.Model):
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger, see migration 0033
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='transportation_search_vector')]
 
     def clean(self):
         print(self.date)
@@ -230,6 +249,11 @@ class Note(models.Model):
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger, see migration 0033
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='note_search_vector')]
 
     def clean(self):
         if self.collection:
@@ -252,6 +276,11 @@ class Checklist(models.Model):
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger, see migration 0033
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='checklist_search_vector')]
 
     def clean(self):
         if self.collection:
@@ -298,13 +327,30 @@ class AdventureImage(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     user_id = models.ForeignKey(
         User, on_delete=models.CASCADE, default=default_user_id)
-    image = ResizedImageField(
-        force_format="WEBP",
-        quality=75,
-        upload_to=PathAndRename('images/')  # Use the callable class here
+    # Stored as uploaded, resized copies are generated in the background (see adventures.utils.image_processing)
+    # Files are stored once per distinct content, see adventures.utils.content_storage
+    image = models.ImageField(
+        upload_to=PathAndRename('images/'),  # Use the callable class here
+        storage=get_content_addressed_storage,
     )
+    renditions = models.JSONField(default=dict, blank=True)
+    is_processed = models.BooleanField(default=False)
+    # Set while a worker generates the renditions, see adventures.utils.image_processing.claim_image
+    processing_started_at = models.DateTimeField(null=True, blank=True, editable=False)
+    # Intrinsic size and a tiny inline preview so clients can lay out and paint before loading the image
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    placeholder = models.TextField(null=True, blank=True)
     adventure = models.ForeignKey(Adventure, related_name='images', on_delete=models.CASCADE)
     is_primary = models.BooleanField(default=False)
+    # Set for images linked from Immich; `image` then only holds a cached preview and the
+    # original is streamed from the owner's Immich server on demand
+    immich_id = models.CharField(max_length=200, null=True, blank=True)
+
+    def save(self, *args, **kwargs):
+        # The blob lock taken while storing the file is held until the row is committed
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.image.url
@@ -313,13 +359,67 @@ class Attachment(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     user_id = models.ForeignKey(
         User, on_delete=models.CASCADE, default=default_user_id)
-    file = models.FileField(upload_to=PathAndRename('attachments/'),validators=[validate_file_extension])
+    file = models.FileField(upload_to=PathAndRename('attachments/'),validators=[validate_file_extension], storage=get_content_addressed_storage)
     adventure = models.ForeignKey(Adventure, related_name='attachments', on_delete=models.CASCADE)
     name = models.CharField(max_length=200, null=True, blank=True)
 
+    def save(self, *args, **kwargs):
+        # The blob lock taken while storing the file is held until the row is committed
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return self.file.url
 
+class GpxTrack(models.Model):
+    """
+    A track or route parsed from a GPX attachment (see adventures.utils.gpx). The geometry is
+    kept at full resolution and at two Douglas-Peucker simplification levels for previews.
+    """
+    id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
+    attachment = models.ForeignKey(Attachment, related_name='tracks', on_delete=models.CASCADE)
+    name = models.CharField(max_length=200, null=True, blank=True)
+    geometry = gis_models.LineStringField(srid=4326)
+    geometry_medium = gis_models.LineStringField(srid=4326, spatial_index=False)
+    geometry_low = gis_models.LineStringField(srid=4326, spatial_index=False)
+    point_count = models.PositiveIntegerField(default=0)
+    # Meters
+    distance = models.FloatField(default=0)
+    elevation_gain = models.FloatField(null=True, blank=True)
+    elevation_loss = models.FloatField(null=True, blank=True)
+    start_time = models.DateTimeField(null=True, blank=True)
+    end_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name or str(self.attachment)
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of an image or attachment. Chunks are appended to a temporary file
+    (see adventures.views.resumable_upload_mixin) until `offset` reaches `size`.
+    """
+    KIND_CHOICES = [
+        ('image', 'Image'),
+        ('attachment', 'Attachment'),
+    ]
+
+    id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
+    user_id = models.ForeignKey(
+        User, on_delete=models.CASCADE, default=default_user_id)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    adventure = models.ForeignKey(Adventure, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    name = models.CharField(max_length=200, null=True, blank=True)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    # Optional SHA-256 of the whole file provided by the client, verified once the upload is complete
+    checksum = models.CharField(max_length=64, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.filename} ({self.offset}/{self.size})'
+
 class Category(models.Model):
     id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True, primary_key=True)
     user_id = models.ForeignKey(
@@ -361,6 +461,11 @@ class Lodging(models.Model):
     collection = models.ForeignKey('Collection', on_delete=models.CASCADE, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by a database trigger, see migration 0033
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'], name='lodging_search_vector')]
 
     def clean(self):
         if self.date and self.end_date and self.date > self.end_date:
@@ -373,4 +478,40 @@ class Lodging(models.Model):
                 raise ValidationError('Lodging must be associated with collections owned by the same user. Collection owner: ' + self.collection.user_id.username + ' Lodging owner: ' + self.user_id.username)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class TravelStats(models.Model):
+    """
+    Per-user counters shown on profiles, kept up to date by adventures.signals and
+    recomputed by adventures.utils.stats.refresh_travel_stats after bulk changes.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='travel_stats')
+    adventure_count = models.PositiveIntegerField(default=0)
+    collection_count = models.PositiveIntegerField(default=0)
+    visited_region_count = models.PositiveIntegerField(default=0)
+    visited_city_count = models.PositiveIntegerField(default=0)
+    visited_country_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'Travel stats'
+
+    def __str__(self):
+        return f'Travel stats of {self.user}'
+
+
+def generate_calendar_token():
+    return secrets.token_urlsafe(32)
+
+
+class CalendarSubscription(models.Model):
+    """
+    Secret token in the URL of a user's calendar feed (adventures.views.ics_calendar_view).
+    Regenerating it revokes the previous URL.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='calendar_subscription')
+    token = models.CharField(max_length=64, unique=True, default=generate_calendar_token)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'Calendar subscription of {self.user}'
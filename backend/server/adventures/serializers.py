@@ -1,45 +1,111 @@
 from django.utils import timezone
 import os
-from .models import Adventure, AdventureImage, ChecklistItem, Collection, Note, Transportation, Checklist, Visit, Category, Attachment, Lodging
+import uuid
+from .models import Adventure, AdventureImage, ChecklistItem, Collection, Note, Transportation, Checklist, Visit, Category, Attachment, Lodging, GpxTrack
 from rest_framework import serializers
 from main.utils import CustomModelSerializer
 from users.serializers import CustomUserDetailsSerializer
+from adventures.utils.signed_media import get_signed_media_url
+from adventures.utils.gpx import is_gpx
 
 
 class AdventureImageSerializer(CustomModelSerializer):
     class Meta:
         model = AdventureImage
-        fields = ['id', 'image', 'adventure', 'is_primary', 'user_id']
-        read_only_fields = ['id', 'user_id']
+        fields = ['id', 'image', 'adventure', 'is_primary', 'user_id', 'immich_id', 'is_processed', 'width', 'height', 'placeholder']
+        read_only_fields = ['id', 'user_id', 'is_processed', 'width', 'height', 'placeholder']
+        extra_kwargs = {'image': {'required': False}}
+
+    def validate_immich_id(self, value):
+        # Interpolated into Immich URLs, so anything but an asset UUID is rejected
+        if not value:
+            return None
+        try:
+            return str(uuid.UUID(value))
+        except ValueError:
+            raise serializers.ValidationError('Immich asset IDs are UUIDs.')
+
+    def validate(self, data):
+        if not self.instance and not data.get('image') and not data.get('immich_id'):
+            raise serializers.ValidationError('An image file or an Immich asset ID is required.')
+        return data
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
+        public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
+        #print(public_url)
+        # remove any  ' from the url
+        public_url = public_url.replace("'", "")
         if instance.image:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            #print(public_url)
-            # remove any  ' from the url
-            public_url = public_url.replace("'", "")
-            representation['image'] = f"{public_url}/media/{instance.image.name}"
+            representation['image'] = get_signed_media_url(instance.image.name)
+        # Linked Immich images only store a preview, the original is proxied from Immich
+        if instance.immich_id:
+            representation['original_url'] = f"{public_url}/api/integrations/immich/original/{instance.id}"
+        else:
+            representation['original_url'] = representation['image']
+
+        representation['srcset'] = None
+        representation['avif_srcset'] = None
+        if instance.is_processed and instance.renditions:
+            # Serve the largest rendition instead of the (possibly huge) original upload
+            representation['image'] = get_signed_media_url(instance.renditions['full']['webp'])
+            representation['srcset'] = self.get_srcset(instance, 'webp')
+            representation['avif_srcset'] = self.get_srcset(instance, 'avif')
         return representation
+
+    def get_srcset(self, instance, fmt):
+        candidates = [
+            f"{get_signed_media_url(rendition[fmt])} {rendition['width']}w"
+            for rendition in instance.renditions.values() if fmt in rendition
+        ]
+        return ', '.join(candidates) or None
     
+GPX_TRACK_RESOLUTIONS = {
+    'full': 'geometry',
+    'medium': 'geometry_medium',
+    'low': 'geometry_low',
+}
+
+class GpxTrackSerializer(serializers.ModelSerializer):
+    geometry = serializers.SerializerMethodField()
+
+    class Meta:
+        model = GpxTrack
+        fields = ['id', 'attachment', 'name', 'point_count', 'distance', 'elevation_gain', 'elevation_loss', 'start_time', 'end_time', 'geometry']
+        read_only_fields = fields
+
+    def get_geometry(self, obj):
+        field = GPX_TRACK_RESOLUTIONS.get(self.context.get('resolution'), 'geometry_low')
+        line = getattr(obj, field)
+        return {'type': 'LineString', 'coordinates': line.coords}
+
 class AttachmentSerializer(CustomModelSerializer):
     extension = serializers.SerializerMethodField()
+    tracks = serializers.SerializerMethodField()
     class Meta:
         model = Attachment
-        fields = ['id', 'file', 'adventure', 'extension', 'name', 'user_id']
-        read_only_fields = ['id', 'user_id']
+        fields = ['id', 'file', 'adventure', 'extension', 'name', 'user_id', 'tracks']
+        read_only_fields = ['id', 'user_id', 'tracks']
 
     def get_extension(self, obj):
         return obj.file.name.split('.')[-1]
 
+    def get_tracks(self, obj):
+        # GPX attachments carry a simplified preview of their tracks, the full geometry is
+        # available from the tracks endpoint
+        if not is_gpx(obj.file.name):
+            return []
+        if 'tracks' in getattr(obj, '_prefetched_objects_cache', {}):
+            # Prefetched with preview_tracks() by the adventure querysets
+            tracks = obj.tracks.all()
+        else:
+            tracks = GpxTrack.objects.filter(attachment=obj).defer('geometry', 'geometry_medium')
+        return GpxTrackSerializer(tracks, many=True, context={'resolution': 'low'}).data
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         if instance.file:
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            #print(public_url)
-            # remove any  ' from the url
-            public_url = public_url.replace("'", "")
-            representation['file'] = f"{public_url}/media/{instance.file.name}"
+            representation['file'] = get_signed_media_url(instance.file.name)
         return representation
     
 class CategorySerializer(serializers.ModelSerializer):
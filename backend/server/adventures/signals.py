@@ -0,0 +1,97 @@
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from adventures.models import Adventure, AdventureImage, Attachment, Collection
+from adventures.utils.content_storage import lock_blob
+from adventures.utils.image_processing import rendition_dir
+from adventures.utils.stats import adjust_travel_stats, recount_visited_countries
+from worldtravel.models import VisitedCity, VisitedRegion
+
+
+def media_reference_count(name):
+    """
+    Number of rows pointing at a stored blob. Uploads are content addressed, so several images
+    or attachments can share one file.
+    """
+    return AdventureImage.objects.filter(image=name).count() + Attachment.objects.filter(file=name).count()
+
+
+def delete_blob_if_unreferenced(name):
+    """Deletes a stored blob (and its renditions) unless a row refers to it, returns whether it did."""
+    if not name:
+        return False
+    # Under the blob lock, a concurrent upload of the same content either committed its row
+    # (and is counted) or waits and writes the file again after it was deleted
+    with transaction.atomic():
+        lock_blob(name)
+        if media_reference_count(name):
+            return False
+        default_storage.delete(name)
+        if name.startswith('images/'):
+            directory = rendition_dir(name)
+            if default_storage.exists(directory):
+                for filename in default_storage.listdir(directory)[1]:
+                    default_storage.delete(f'{directory}/{filename}')
+    return True
+
+
+@receiver(post_delete, sender=AdventureImage)
+def delete_image_blob(sender, instance, **kwargs):
+    name = instance.image.name
+    transaction.on_commit(lambda: delete_blob_if_unreferenced(name))
+
+
+@receiver(post_delete, sender=Attachment)
+def delete_attachment_blob(sender, instance, **kwargs):
+    name = instance.file.name
+    transaction.on_commit(lambda: delete_blob_if_unreferenced(name))
+
+
+# Travel stats counters (adventures.models.TravelStats)
+
+@receiver(post_save, sender=Adventure)
+def count_adventure(sender, instance, created, **kwargs):
+    if created:
+        adjust_travel_stats(instance.user_id_id, adventure_count=1)
+
+
+@receiver(post_delete, sender=Adventure)
+def uncount_adventure(sender, instance, **kwargs):
+    adjust_travel_stats(instance.user_id_id, adventure_count=-1)
+
+
+@receiver(post_save, sender=Collection)
+def count_collection(sender, instance, created, **kwargs):
+    if created:
+        adjust_travel_stats(instance.user_id_id, collection_count=1)
+
+
+@receiver(post_delete, sender=Collection)
+def uncount_collection(sender, instance, **kwargs):
+    adjust_travel_stats(instance.user_id_id, collection_count=-1)
+
+
+@receiver(post_save, sender=VisitedRegion)
+def count_visited_region(sender, instance, created, **kwargs):
+    if created:
+        adjust_travel_stats(instance.user_id_id, visited_region_count=1)
+        recount_visited_countries(instance.user_id_id)
+
+
+@receiver(post_delete, sender=VisitedRegion)
+def uncount_visited_region(sender, instance, **kwargs):
+    adjust_travel_stats(instance.user_id_id, visited_region_count=-1)
+    recount_visited_countries(instance.user_id_id)
+
+
+@receiver(post_save, sender=VisitedCity)
+def count_visited_city(sender, instance, created, **kwargs):
+    if created:
+        adjust_travel_stats(instance.user_id_id, visited_city_count=1)
+
+
+@receiver(post_delete, sender=VisitedCity)
+def uncount_visited_city(sender, instance, **kwargs):
+    adjust_travel_stats(instance.user_id_id, visited_city_count=-1)
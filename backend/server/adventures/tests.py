@@ -1,3 +1,90 @@
-from django.test import TestCase
+import hashlib
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from users.models import CustomUser
+from .models import Adventure, Attachment, UploadSession
+
+
+class ResumableUploadTestCase(APITestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        settings = override_settings(MEDIA_ROOT=f'{self.directory}/media', UPLOAD_TEMP_DIR=f'{self.directory}/uploads')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+        self.user = CustomUser.objects.create_user(username='uploader', email='uploader@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.adventure = Adventure.objects.create(user_id=self.user, name='Trip')
+        self.content = b'AdventureLog resumable upload\n' * 1000
+
+    def start(self, **data):
+        response = self.client.post('/api/attachments/uploads/', {
+            'adventure': str(self.adventure.id),
+            'filename': 'notes.txt',
+            'size': len(self.content),
+            **data,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def send(self, upload_id, offset, chunk):
+        return self.client.generic(
+            'PATCH', f'/api/attachments/uploads/{upload_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_001_upload_in_chunks(self):
+        upload_id = self.start(checksum=hashlib.sha256(self.content).hexdigest())
+        middle = len(self.content) // 2
+
+        response = self.send(upload_id, 0, self.content[:middle])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], str(middle))
+
+        # The client lost track of the offset and asks for it before resuming
+        response = self.client.get(f'/api/attachments/uploads/{upload_id}/')
+        self.assertEqual(response.json()['offset'], middle)
+
+        response = self.send(upload_id, middle, self.content[middle:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['offset'], len(self.content))
+
+        response = self.client.post(f'/api/attachments/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 201)
+        attachment = Attachment.objects.get(id=response.json()['id'])
+        with attachment.file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertFalse(UploadSession.objects.filter(id=upload_id).exists())
+
+    def test_002_offset_mismatch(self):
+        upload_id = self.start()
+        self.send(upload_id, 0, self.content[:100])
+
+        # A chunk sent again after a lost response is refused with the offset to resume from
+        response = self.send(upload_id, 0, self.content[:100])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '100')
+
+        response = self.send(upload_id, 100, self.content[100:] + b'too much')
+        self.assertEqual(response.status_code, 400)
+
+    def test_003_complete_too_early(self):
+        upload_id = self.start()
+        self.send(upload_id, 0, self.content[:100])
+        response = self.client.post(f'/api/attachments/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 100)
+
+    def test_004_checksum_mismatch(self):
+        upload_id = self.start(checksum='0' * 64)
+        self.send(upload_id, 0, self.content)
+        response = self.client.post(f'/api/attachments/uploads/{upload_id}/complete/')
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(UploadSession.objects.filter(id=upload_id).exists())
+        self.assertFalse(Attachment.objects.exists())
@@ -19,6 +19,9 @@ router.register(r'overpass', OverpassViewSet, basename='overpass')
 router.register(r'search', GlobalSearchView, basename='search')
 router.register(r'attachments', AttachmentViewSet, basename='attachments')
 router.register(r'lodging', LodgingViewSet, basename='lodging')
+router.register(r'tracks', GpxTrackViewSet, basename='tracks')
+router.register(r'export', ExportViewSet, basename='export')
+router.register(r'import', ImportViewSet, basename='import')
 
 
 urlpatterns = [
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import connection
+
+HASH_NAME_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hashed_name(directory, digest, filename):
+    """
+    Storage name of a blob: <directory>/<sha256 of the content><original extension>.
+    """
+    ext = os.path.splitext(filename)[1].lower()
+    return f'{directory}/{digest}{ext}' if directory else f'{digest}{ext}'
+
+
+def lock_blob(name):
+    """
+    Serializes writers and the cleanup of one blob (adventures.signals.delete_blob_if_unreferenced)
+    with a transaction level advisory lock. A writer holds it until the row pointing at the blob
+    is committed, so the cleanup can't count zero references and delete a blob that is about
+    to be referenced.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [name])
+
+
+def is_hashed_name(name):
+    return bool(HASH_NAME_RE.match(os.path.splitext(os.path.basename(name))[0]))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the SHA-256 of its content, keeping the directory and extension
+    of the name it was saved with. Saving content that is already stored returns the existing
+    name, so identical uploads share one blob on disk. Blobs are removed once no row refers to
+    them any more (see adventures.signals).
+    """
+
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        full_dir = self.path(directory)
+        os.makedirs(full_dir, exist_ok=True)
+
+        if hasattr(content, 'temporary_file_path'):
+            # Large uploads are already on disk: hash them in place and move them instead of copying
+            source = content.temporary_file_path()
+            final_name = hashed_name(directory, hash_file(source), filename)
+            lock_blob(final_name)
+            if not self.exists(final_name):
+                file_move_safe(source, self.path(final_name))
+                self._set_permissions(self.path(final_name))
+            return final_name
+
+        tmp_path, digest = self.write_temporary(directory, content)
+        return self.store_temporary(tmp_path, directory, digest, filename)
+
+    def write_temporary(self, directory, content):
+        """
+        Streams `content` to a temporary file next to its destination while hashing it and returns
+        (path, sha256). Needs no database, so it can run on any thread.
+        """
+        digest = hashlib.sha256()
+        full_dir = self.path(directory)
+        os.makedirs(full_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=full_dir, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest()
+
+    def store_temporary(self, tmp_path, directory, digest, filename):
+        """
+        Renames a file from write_temporary() into place and returns its name. Takes the blob
+        lock on the current connection, so call it in the transaction that saves the rows.
+        """
+        final_name = hashed_name(directory, digest, filename)
+        try:
+            lock_blob(final_name)
+            if self.exists(final_name):
+                os.remove(tmp_path)
+            else:
+                self._set_permissions(tmp_path)
+                os.replace(tmp_path, self.path(final_name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return final_name
+
+    def _set_permissions(self, path):
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(path, 0o666 & ~umask)
+
+
+def get_content_addressed_storage():
+    return content_addressed_storage
+
+
+content_addressed_storage = ContentAddressedStorage()
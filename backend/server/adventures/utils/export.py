@@ -0,0 +1,209 @@
+import fcntl
+import io
+import json
+import os
+import time
+import zipfile
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from adventures.models import (
+    Adventure, AdventureImage, Attachment, Category, Checklist, ChecklistItem, Collection,
+    Lodging, Note, Transportation, Visit,
+)
+from worldtravel.models import VisitedCity, VisitedRegion
+
+EXPORT_FORMAT_VERSION = 1
+QUERY_CHUNK_SIZE = 500
+FILE_CHUNK_SIZE = 1024 * 1024
+
+# File in the archive -> rows of the user that go into it, one JSON object per line
+EXPORT_FILES = [
+    ('categories.ndjson', lambda user: Category.objects.filter(user_id=user)),
+    ('collections.ndjson', lambda user: Collection.objects.filter(user_id=user)),
+    ('adventures.ndjson', lambda user: Adventure.objects.filter(user_id=user)),
+    ('visits.ndjson', lambda user: Visit.objects.filter(adventure__user_id=user)),
+    ('images.ndjson', lambda user: AdventureImage.objects.filter(adventure__user_id=user)),
+    ('attachments.ndjson', lambda user: Attachment.objects.filter(adventure__user_id=user)),
+    ('notes.ndjson', lambda user: Note.objects.filter(user_id=user)),
+    ('checklists.ndjson', lambda user: Checklist.objects.filter(user_id=user)),
+    ('checklist_items.ndjson', lambda user: ChecklistItem.objects.filter(checklist__user_id=user)),
+    ('lodging.ndjson', lambda user: Lodging.objects.filter(user_id=user)),
+    ('transportation.ndjson', lambda user: Transportation.objects.filter(user_id=user)),
+    ('visited_regions.ndjson', lambda user: VisitedRegion.objects.filter(user_id=user)),
+    ('visited_cities.ndjson', lambda user: VisitedCity.objects.filter(user_id=user)),
+]
+
+# Media files referenced by the export, stored in the archive under media/<storage name>
+MEDIA_FILES = [
+    lambda user: AdventureImage.objects.filter(adventure__user_id=user).exclude(image='').values_list('image', flat=True),
+    lambda user: Attachment.objects.filter(adventure__user_id=user).exclude(file='').values_list('file', flat=True),
+]
+
+
+class _StreamBuffer(io.RawIOBase):
+    """
+    Write-only, unseekable file for ZipFile that hands out what has been written so far.
+    ZipFile falls back to data descriptors for unseekable files, so entries never need to be
+    rewritten and nothing has to be kept in memory once it has been passed on.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _rows(queryset):
+    # Search vectors are derived by the database and rebuilt when the rows are imported
+    fields = [field.attname for field in queryset.model._meta.concrete_fields if not isinstance(field, SearchVectorField)]
+    for row in queryset.values(*fields).iterator(chunk_size=QUERY_CHUNK_SIZE):
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode() + b'\n'
+
+
+def iter_account_export(user):
+    """
+    Yields the bytes of a ZIP archive holding everything `user` owns: one NDJSON file per model,
+    a manifest.json and the referenced images and attachments under media/. Rows are read in
+    chunks and files in FILE_CHUNK_SIZE pieces, so memory use does not depend on the export size.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=6) as archive:
+        counts = {}
+        for filename, get_queryset in EXPORT_FILES:
+            count = 0
+            with archive.open(filename, 'w', force_zip64=True) as entry:
+                for line in _rows(get_queryset(user)):
+                    entry.write(line)
+                    count += 1
+                    if count % QUERY_CHUNK_SIZE == 0:
+                        yield buffer.pop()
+            counts[filename] = count
+            yield buffer.pop()
+
+        media = 0
+        for get_names in MEDIA_FILES:
+            # Identical uploads share one stored file named after its content hash, the database
+            # hands out every name once so nothing has to be remembered here
+            names = get_names(user).order_by().distinct()
+            for name in names.iterator(chunk_size=QUERY_CHUNK_SIZE):
+                if not default_storage.exists(name):
+                    continue
+                info = zipfile.ZipInfo(f'media/{name}', date_time=timezone.now().timetuple()[:6])
+                # Images and most attachments are already compressed
+                info.compress_type = zipfile.ZIP_STORED
+                with default_storage.open(name, 'rb') as source, archive.open(info, 'w', force_zip64=True) as entry:
+                    for chunk in iter(lambda: source.read(FILE_CHUNK_SIZE), b''):
+                        entry.write(chunk)
+                        yield buffer.pop()
+                media += 1
+
+        manifest = {
+            'format': 'adventurelog-export',
+            'version': EXPORT_FORMAT_VERSION,
+            'exported_at': timezone.now().isoformat(),
+            'username': user.username,
+            'counts': counts,
+            'media_files': media,
+        }
+        archive.writestr('manifest.json', json.dumps(manifest, indent=2))
+    yield buffer.pop()
+
+
+def export_filename(user):
+    return f"adventurelog-export-{user.username}-{timezone.now().strftime('%Y-%m-%d')}.zip"
+
+
+def export_path(user):
+    # One archive per user, a new export replaces the previous one
+    return os.path.join(settings.EXPORT_DIR, f'{user.uuid}.zip')
+
+
+def export_status(user):
+    """
+    Returns ('ready', path), ('building', None) or (None, None) for the export of `user`.
+    Archives are kept for EXPORT_TTL seconds after they have been built.
+    """
+    path = export_path(user)
+    if _is_building(path):
+        return 'building', None
+    try:
+        if os.path.getmtime(path) > time.time() - settings.EXPORT_TTL:
+            return 'ready', path
+    except FileNotFoundError:
+        pass
+    return None, None
+
+
+def _is_building(path):
+    # Builds hold an exclusive lock on <archive>.lock, the file is never removed so every
+    # build of a user locks the same file
+    try:
+        with open(f'{path}.lock', 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except FileNotFoundError:
+        return False
+    except BlockingIOError:
+        return True
+    return False
+
+
+def build_account_export(user):
+    """
+    Writes the export of `user` to export_path(user). The archive is built next to it and
+    renamed into place once complete, so a download never sees a partial file. Returns False
+    if a build for the user is already running (in any worker on this host).
+    """
+    path = export_path(user)
+    os.makedirs(settings.EXPORT_DIR, exist_ok=True)
+    with open(f'{path}.lock', 'ab') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            with open(f'{path}.part', 'wb') as f:
+                for chunk in iter_account_export(user):
+                    f.write(chunk)
+            os.replace(f'{path}.part', path)
+        except BaseException:
+            if os.path.exists(f'{path}.part'):
+                os.remove(f'{path}.part')
+            raise
+    return True
+
+
+def delete_stale_exports():
+    """
+    Deletes archives older than EXPORT_TTL seconds and what builds that died left behind.
+    Returns the number of archives deleted. Run periodically by the cleanup-exports command.
+    """
+    if not os.path.isdir(settings.EXPORT_DIR):
+        return 0
+    deleted = 0
+    for entry in os.scandir(settings.EXPORT_DIR):
+        if entry.name.endswith('.zip') and entry.stat().st_mtime < time.time() - settings.EXPORT_TTL:
+            os.remove(entry.path)
+            deleted += 1
+        elif entry.name.endswith('.part'):
+            with open(f"{entry.path[:-len('.part')]}.lock", 'ab') as lock:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                os.remove(entry.path)
+    return deleted
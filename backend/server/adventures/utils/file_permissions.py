@@ -2,40 +2,35 @@ from adventures.models import AdventureImage, Attachment
 
 protected_paths = ['images/', 'attachments/']
 
+def canViewAdventure(adventure, user):
+    if adventure.is_public:
+        return True
+    elif adventure.user_id == user:
+        return True
+    elif adventure.collection:
+        if adventure.collection.shared_with.filter(id=user.id).exists():
+            return True
+    return False
+
 def checkFilePermission(fileId, user, mediaType):
     if mediaType not in protected_paths:
         return True
+    # Files are content addressed, so several images or attachments can share the same file.
+    # Access is granted if the user can see any of the adventures it belongs to. This relies on
+    # every row pointing at a blob having stored those bytes itself: rows never take a file
+    # name from user input (the importer drops names without a file in the archive).
     if mediaType == 'images/':
-        try:
+        if fileId.startswith('renditions/'):
+            # Renditions are stored under images/renditions/<original file stem>/
+            stem = fileId.split('/')[1]
+            images = AdventureImage.objects.filter(image__startswith=f"images/{stem}.")
+        else:
             # Construct the full relative path to match the database field
             image_path = f"images/{fileId}"
-            # Fetch the AdventureImage object
-            adventure = AdventureImage.objects.get(image=image_path).adventure
-            if adventure.is_public:
-                return True
-            elif adventure.user_id == user:
-                return True
-            elif adventure.collection:
-                if adventure.collection.shared_with.filter(id=user.id).exists():
-                    return True
-            else:
-                return False
-        except AdventureImage.DoesNotExist:
-            return False
+            images = AdventureImage.objects.filter(image=image_path)
+        return any(canViewAdventure(image.adventure, user) for image in images.select_related('adventure__collection'))
     elif mediaType == 'attachments/':
-        try:
-            # Construct the full relative path to match the database field
-            attachment_path = f"attachments/{fileId}"
-            # Fetch the Attachment object
-            attachment = Attachment.objects.get(file=attachment_path).adventure
-            if attachment.is_public:
-                return True
-            elif attachment.user_id == user:
-                return True
-            elif attachment.collection:
-                if attachment.collection.shared_with.filter(id=user.id).exists():
-                    return True
-            else:
-                return False
-        except Attachment.DoesNotExist:
-            return False
\ No newline at end of file
+        # Construct the full relative path to match the database field
+        attachment_path = f"attachments/{fileId}"
+        attachments = Attachment.objects.filter(file=attachment_path).select_related('adventure__collection')
+        return any(canViewAdventure(attachment.adventure, user) for attachment in attachments)
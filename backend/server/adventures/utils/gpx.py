@@ -0,0 +1,159 @@
+import math
+
+import defusedxml.ElementTree as ET
+from django.contrib.gis.geos import LineString
+from django.db.models import Prefetch
+from django.utils.dateparse import parse_datetime
+
+# Douglas-Peucker tolerances in degrees (roughly 10 m and 100 m)
+SIMPLIFY_TOLERANCES = {
+    'geometry_medium': 0.0001,
+    'geometry_low': 0.001,
+}
+
+# Elevation changes smaller than this are treated as GPS noise
+ELEVATION_THRESHOLD = 3
+
+EARTH_RADIUS = 6371008.8
+
+
+def _tag(element):
+    return element.tag.rsplit('}', 1)[-1]
+
+
+def iter_gpx_tracks(file):
+    """
+    Stream-parses a GPX file and yields (name, points) for every track and route, with the
+    segments of a track joined together. Points are (longitude, latitude, elevation, time) tuples.
+    Parsed elements are cleared as soon as they have been read so large files do not build up a tree.
+    The files are uploaded by users, defusedxml refuses entity expansion and external references.
+    """
+    root = None
+    name = None
+    points = []
+    in_point = False
+    for event, element in ET.iterparse(file, events=('start', 'end')):
+        tag = _tag(element)
+        if event == 'start':
+            if root is None:
+                root = element
+            elif tag in ('trk', 'rte'):
+                name = None
+                points = []
+            elif tag in ('trkpt', 'rtept'):
+                in_point = True
+            continue
+
+        if tag in ('trkpt', 'rtept'):
+            in_point = False
+            try:
+                lat = float(element.get('lat'))
+                lon = float(element.get('lon'))
+            except (TypeError, ValueError):
+                element.clear()
+                continue
+            elevation = time = None
+            for child in element:
+                child_tag = _tag(child)
+                if child_tag == 'ele' and child.text:
+                    try:
+                        elevation = float(child.text)
+                    except ValueError:
+                        pass
+                elif child_tag == 'time' and child.text:
+                    time = parse_datetime(child.text.strip())
+            points.append((lon, lat, elevation, time))
+            element.clear()
+        elif tag == 'name' and not in_point and name is None:
+            name = (element.text or '').strip()[:200] or None
+        elif tag in ('trk', 'rte'):
+            if len(points) >= 2:
+                yield name, points
+            points = []
+            root.clear()
+
+
+def haversine(lon1, lat1, lon2, lat2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def elevation_change(elevations):
+    """
+    Returns (gain, loss) in meters, only counting changes larger than ELEVATION_THRESHOLD.
+    """
+    gain = loss = 0.0
+    reference = None
+    for elevation in elevations:
+        if elevation is None:
+            continue
+        if reference is None:
+            reference = elevation
+            continue
+        delta = elevation - reference
+        if delta >= ELEVATION_THRESHOLD:
+            gain += delta
+            reference = elevation
+        elif delta <= -ELEVATION_THRESHOLD:
+            loss -= delta
+            reference = elevation
+    return gain, loss
+
+
+def simplify(line, tolerance):
+    simplified = line.simplify(tolerance, preserve_topology=False)
+    if simplified.geom_type != 'LineString' or len(simplified) < 2:
+        # Very short tracks can collapse, keep at least the endpoints
+        return LineString([line[0], line[-1]], srid=line.srid)
+    return simplified
+
+
+def build_track(name, points):
+    """
+    Returns the GpxTrack field values for a parsed track.
+    """
+    line = LineString([(lon, lat) for lon, lat, _, _ in points], srid=4326)
+    distance = sum(
+        haversine(a[0], a[1], b[0], b[1]) for a, b in zip(points, points[1:])
+    )
+    has_elevation = any(point[2] is not None for point in points)
+    gain, loss = elevation_change(point[2] for point in points)
+    times = [point[3] for point in points if point[3] is not None]
+
+    values = {
+        'name': name,
+        'geometry': line,
+        'point_count': len(points),
+        'distance': distance,
+        'elevation_gain': gain if has_elevation else None,
+        'elevation_loss': loss if has_elevation else None,
+        'start_time': min(times) if times else None,
+        'end_time': max(times) if times else None,
+    }
+    for field, tolerance in SIMPLIFY_TOLERANCES.items():
+        values[field] = simplify(line, tolerance)
+    return values
+
+
+def is_gpx(name):
+    return bool(name) and name.lower().endswith('.gpx')
+
+
+def preview_tracks(lookup='attachments__tracks'):
+    """Prefetches the tracks of attachments for the previews in adventure payloads, without the geometry they do not use."""
+    from adventures.models import GpxTrack
+
+    return Prefetch(lookup, queryset=GpxTrack.objects.defer('geometry', 'geometry_medium'))
+
+
+def process_gpx_attachment(attachment_id):
+    from adventures.models import Attachment, GpxTrack
+
+    attachment = Attachment.objects.filter(id=attachment_id).first()
+    if not attachment or not is_gpx(attachment.file.name):
+        return
+    with attachment.file.open('rb') as f:
+        tracks = [GpxTrack(attachment=attachment, **build_track(name, points)) for name, points in iter_gpx_tracks(f)]
+    GpxTrack.objects.filter(attachment=attachment).delete()
+    GpxTrack.objects.bulk_create(tracks)
@@ -0,0 +1,130 @@
+import hashlib
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+from icalendar import Event, vCalAddress, vText
+
+from adventures.models import Adventure, CalendarSubscription, Lodging, Transportation, Visit, generate_calendar_token
+
+PRODID = '-//AdventureLog//adventurelog.app//'
+QUERY_CHUNK_SIZE = 500
+
+
+def subscription_token(user):
+    subscription, _ = CalendarSubscription.objects.get_or_create(user=user)
+    return subscription.token
+
+
+def regenerate_subscription_token(user):
+    """Replaces the user's feed token, the previous subscription URL stops working."""
+    subscription, _ = CalendarSubscription.objects.update_or_create(user=user, defaults={'token': generate_calendar_token()})
+    return subscription.token
+
+
+def user_for_token(token):
+    subscription = CalendarSubscription.objects.select_related('user').filter(token=token, user__is_active=True).first()
+    return subscription.user if subscription else None
+
+
+def calendar_version(user):
+    """
+    Changes whenever anything that ends up in the user's calendar changes. A single query over
+    the row counts (catching deletes) and latest updated_at of every table the feed reads.
+    """
+    visit, adventure = Visit._meta, Adventure._meta
+    sql = f"""
+        SELECT count(*), max(updated_at) FROM (
+            SELECT v.updated_at FROM {visit.db_table} v
+                JOIN {adventure.db_table} a ON a.id = v.adventure_id WHERE a.user_id_id = %s
+            UNION ALL SELECT updated_at FROM {adventure.db_table} WHERE user_id_id = %s
+            UNION ALL SELECT updated_at FROM {Lodging._meta.db_table} WHERE user_id_id = %s
+            UNION ALL SELECT updated_at FROM {Transportation._meta.db_table} WHERE user_id_id = %s
+        ) rows
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user.pk] * 4)
+        count, last_updated = cursor.fetchone()
+    key = f'{user.pk}:{count}:{last_updated}:{user.email}:{user.first_name}:{user.last_name}'
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _organizer(user):
+    organizer = vCalAddress(f'MAILTO:{user.email}')
+    organizer.params['cn'] = vText(f"{user.first_name} {user.last_name}")
+    return organizer
+
+
+def _event(uid, summary, start, end, updated_at, organizer, description=None, location=None, url=None):
+    event = Event()
+    event.add('uid', f'{uid}@adventurelog')
+    event.add('summary', summary)
+    event.add('dtstart', start)
+    event.add('dtend', end)
+    event.add('dtstamp', updated_at or timezone.now())
+    event.add('last-modified', updated_at or timezone.now())
+    event.add('transp', 'TRANSPARENT')
+    event.add('class', 'PUBLIC')
+    if description:
+        event.add('description', description)
+    if location:
+        event.add('location', location)
+    if url:
+        event.add('url', url)
+    event.add('organizer', organizer)
+    return event.to_ical()
+
+
+def iter_calendar(user):
+    """
+    Yields the user's calendar as iCalendar bytes: one all-day event per adventure visit and
+    timed events for lodging stays and transportation. Rows are read with values() so no
+    model instances or serializers are involved.
+    """
+    organizer = _organizer(user)
+    yield f'BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:{PRODID}\r\nX-WR-CALNAME:AdventureLog\r\n'.encode()
+
+    visits = (
+        Visit.objects.filter(adventure__user_id=user, start_date__isnull=False)
+        .values('id', 'start_date', 'end_date', 'updated_at', 'adventure__name', 'adventure__description', 'adventure__location', 'adventure__link')
+        .order_by('start_date')
+    )
+    for visit in visits.iterator(chunk_size=QUERY_CHUNK_SIZE):
+        start = visit['start_date'].date()
+        end = (visit['end_date'].date() if visit['end_date'] else start) + timedelta(days=1)
+        yield _event(
+            f"visit-{visit['id']}", visit['adventure__name'], start, end, visit['updated_at'], organizer,
+            description=visit['adventure__description'], location=visit['adventure__location'], url=visit['adventure__link'],
+        )
+
+    lodgings = (
+        Lodging.objects.filter(user_id=user, check_in__isnull=False)
+        .values('id', 'name', 'description', 'location', 'link', 'check_in', 'check_out', 'reservation_number', 'updated_at')
+        .order_by('check_in')
+    )
+    for lodging in lodgings.iterator(chunk_size=QUERY_CHUNK_SIZE):
+        description = lodging['description'] or ''
+        if lodging['reservation_number']:
+            description = f"{description}\n\nReservation: {lodging['reservation_number']}".strip()
+        yield _event(
+            f"lodging-{lodging['id']}", f"🏨 {lodging['name']}", lodging['check_in'], lodging['check_out'] or lodging['check_in'],
+            lodging['updated_at'], organizer, description=description, location=lodging['location'], url=lodging['link'],
+        )
+
+    transportations = (
+        Transportation.objects.filter(user_id=user, date__isnull=False)
+        .values('id', 'type', 'name', 'description', 'link', 'date', 'end_date', 'flight_number', 'from_location', 'to_location', 'updated_at')
+        .order_by('date')
+    )
+    for transportation in transportations.iterator(chunk_size=QUERY_CHUNK_SIZE):
+        description = transportation['description'] or ''
+        if transportation['flight_number']:
+            description = f"{description}\n\nFlight: {transportation['flight_number']}".strip()
+        route = ' → '.join(part for part in (transportation['from_location'], transportation['to_location']) if part)
+        yield _event(
+            f"transportation-{transportation['id']}", f"{transportation['type'].title()}: {transportation['name']}",
+            transportation['date'], transportation['end_date'] or transportation['date'], transportation['updated_at'], organizer,
+            description=description, location=route, url=transportation['link'],
+        )
+
+    yield b'END:VCALENDAR\r\n'
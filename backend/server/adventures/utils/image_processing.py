@@ -0,0 +1,162 @@
+import base64
+import os
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+# Rendition name -> maximum width in pixels. Images are never upscaled.
+RENDITION_WIDTHS = {
+    'thumb': 400,
+    'card': 800,
+    'full': 1920,
+}
+
+# Width of the inline placeholder image, it is blurred by the client when scaled up
+PLACEHOLDER_WIDTH = 16
+
+# A claim older than this belongs to a worker that died, the image can be claimed again
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+FORMAT_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 75, 'method': 4},
+    'avif': {'format': 'AVIF', 'quality': 60},
+}
+
+
+def _check_feature(feature):
+    try:
+        return features.check(feature)
+    except ValueError:
+        # Older Pillow versions don't know about the feature at all
+        return False
+
+
+def rendition_formats():
+    return [fmt for fmt in ('webp', 'avif') if _check_feature(fmt)]
+
+
+def rendition_dir(name):
+    """
+    Renditions live next to the original under images/renditions/<original file stem>/.
+    """
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'images/renditions/{stem}'
+
+
+def open_image(field_file):
+    with field_file.open('rb') as f:
+        image = Image.open(f)
+        # Apply the EXIF orientation so phone photos are not rendered sideways
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return image
+
+
+def build_renditions(image, name, storage):
+    """
+    Writes every rendition of `image` to storage and returns the rendition map stored on
+    AdventureImage.renditions: {rendition: {'width', 'height', <format>: <storage name>}}.
+    """
+    directory = rendition_dir(name)
+    formats = rendition_formats()
+    renditions = {}
+    for rendition, max_width in RENDITION_WIDTHS.items():
+        resized = image
+        if image.width > max_width:
+            resized = image.copy()
+            resized.thumbnail((max_width, image.height), Image.LANCZOS)
+        entry = {'width': resized.width, 'height': resized.height}
+        for fmt in formats:
+            buffer = BytesIO()
+            resized.save(buffer, **FORMAT_OPTIONS[fmt])
+            path = f'{directory}/{rendition}.{fmt}'
+            if storage.exists(path):
+                storage.delete(path)
+            entry[fmt] = storage.save(path, ContentFile(buffer.getvalue()))
+        renditions[rendition] = entry
+    return renditions
+
+
+def build_placeholder(image):
+    """
+    Returns a data URI of a tiny WEBP version of the image (usually a few hundred bytes).
+    """
+    small = image.copy()
+    small.thumbnail((PLACEHOLDER_WIDTH, PLACEHOLDER_WIDTH * 4))
+    buffer = BytesIO()
+    small.save(buffer, format='WEBP', quality=40)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def claim_image(image_id, condition=Q(is_processed=False)):
+    """
+    Marks an image matching `condition` as being processed by this worker in a single UPDATE.
+    Returns the claim timestamp, or None when the image does not match or another worker (the
+    request thread pool or process-images) is processing it already.
+    """
+    from adventures.models import AdventureImage
+
+    now = timezone.now()
+    claimed = AdventureImage.objects.filter(condition, id=image_id).filter(
+        Q(processing_started_at__isnull=True) | Q(processing_started_at__lt=now - CLAIM_TIMEOUT)
+    ).update(processing_started_at=now)
+    return now if claimed else None
+
+
+def release_image(image_id, claimed_at):
+    from adventures.models import AdventureImage
+
+    AdventureImage.objects.filter(id=image_id, processing_started_at=claimed_at).update(processing_started_at=None)
+
+
+def process_image(adventure_image, renditions=True):
+    """
+    Computes the placeholder and intrinsic size of an image and, unless `renditions` is False,
+    (re)generates its resized renditions.
+    """
+    image = open_image(adventure_image.image)
+    adventure_image.width = image.width
+    adventure_image.height = image.height
+    adventure_image.placeholder = build_placeholder(image)
+    update_fields = ['width', 'height', 'placeholder']
+    if renditions:
+        # Renditions keep their fixed names, so they go through the default storage rather than the
+        # content addressed one the original is stored in
+        adventure_image.renditions = build_renditions(image, adventure_image.image.name, default_storage)
+        adventure_image.is_processed = True
+        update_fields += ['renditions', 'is_processed']
+    adventure_image.save(update_fields=update_fields)
+
+
+def process_image_by_id(image_id):
+    from adventures.models import AdventureImage
+
+    claimed_at = claim_image(image_id)
+    if claimed_at is None:
+        return
+    try:
+        adventure_image = AdventureImage.objects.filter(id=image_id).first()
+        if not adventure_image or not adventure_image.image:
+            return
+        # The same file uploaded again shares its blob and renditions with the existing image
+        twin = AdventureImage.objects.filter(
+            image=adventure_image.image.name, is_processed=True, placeholder__isnull=False
+        ).exclude(id=adventure_image.id).first()
+        if twin:
+            adventure_image.renditions = twin.renditions
+            adventure_image.width = twin.width
+            adventure_image.height = twin.height
+            adventure_image.placeholder = twin.placeholder
+            adventure_image.is_processed = True
+            adventure_image.save(update_fields=['renditions', 'width', 'height', 'placeholder', 'is_processed'])
+        else:
+            process_image(adventure_image)
+    finally:
+        release_image(image_id, claimed_at)
@@ -0,0 +1,494 @@
+import csv
+import io
+import json
+import os
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+import ijson
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from adventures.models import (
+    Adventure, AdventureImage, Attachment, Category, Checklist, ChecklistItem, Collection,
+    Lodging, Note, Transportation, Visit,
+)
+from adventures.utils.content_storage import content_addressed_storage
+from adventures.utils.gpx import is_gpx, process_gpx_attachment
+from adventures.utils.image_processing import process_image_by_id
+from adventures.utils.stats import refresh_travel_stats
+from adventures.utils.tasks import run_in_background
+from worldtravel.models import City, Region, VisitedCity, VisitedRegion
+
+DEFAULT_BATCH_SIZE = 1000
+MEDIA_WORKERS = 4
+MAX_REPORTED_ERRORS = 100
+COORDINATE = Decimal('0.000001')
+MAX_RATING = 5
+
+# Start and end fields of each model that model.clean() keeps in order, bulk_create skips clean()
+DATE_RANGES = {
+    Collection: ('start_date', 'end_date'),
+    Visit: ('start_date', 'end_date'),
+    Transportation: ('date', 'end_date'),
+    Lodging: ('check_in', 'check_out'),
+}
+
+# Columns (CSV) or properties (GeoJSON) accepted for each adventure field
+COLUMN_ALIASES = {
+    'name': ('name', 'title'),
+    'description': ('description', 'notes_text'),
+    'location': ('location', 'address'),
+    'latitude': ('latitude', 'lat'),
+    'longitude': ('longitude', 'lon', 'lng'),
+    'category': ('category',),
+    'collection': ('collection',),
+    'activity_types': ('activity_types', 'tags'),
+    'rating': ('rating',),
+    'link': ('link', 'url'),
+    'is_public': ('is_public', 'public'),
+    'start_date': ('start_date', 'date', 'visited_on'),
+    'end_date': ('end_date',),
+    'notes': ('notes', 'visit_notes'),
+}
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def _get(row, field):
+    for key in COLUMN_ALIASES[field]:
+        value = row.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def _coordinate(value, limit):
+    if value in (None, ''):
+        return None
+    try:
+        coordinate = Decimal(str(value)).quantize(COORDINATE)
+    except InvalidOperation:
+        raise ValueError(f'Invalid coordinate "{value}"')
+    if abs(coordinate) > limit:
+        raise ValueError(f'Coordinate {value} is out of range')
+    return coordinate
+
+
+def _rating(value):
+    rating = float(value)
+    if not 0 <= rating <= MAX_RATING:
+        raise ValueError(f'The rating must be between 0 and {MAX_RATING}')
+    return rating
+
+
+def _datetime(value):
+    if value in (None, ''):
+        return None
+    parsed = parse_datetime(str(value))
+    if parsed is None:
+        date = parse_date(str(value))
+        if date is None:
+            raise ValueError(f'Invalid date "{value}"')
+        parsed = datetime.combine(date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+
+def _list(value):
+    if value in (None, ''):
+        return None
+    if isinstance(value, (list, tuple)):
+        return [str(item).strip()[:100] for item in value if str(item).strip()]
+    separator = ';' if ';' in value else ','
+    return [item.strip()[:100] for item in value.split(separator) if item.strip()] or None
+
+
+def _concrete_fields(model):
+    return {field.attname for field in model._meta.concrete_fields}
+
+
+class AdventureImporter:
+    """
+    Imports adventures into a user's account from one of:
+
+    - an account export produced by adventures.utils.export (.zip)
+    - a CSV file with one adventure (and optionally one visit) per row (.csv)
+    - a GeoJSON FeatureCollection of Point features (.geojson/.json)
+
+    Input is stream-parsed and rows are written with bulk_create in batches, categories and
+    collections are looked up once per batch and media from exports is stored from a thread
+    pool. With `dry_run` everything is validated and counted inside a transaction that is
+    rolled back, and no media is written.
+    """
+
+    def __init__(self, user, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        self.user = user
+        self.dry_run = dry_run
+        self.batch_size = batch_size
+        self.progress = progress
+        self.report = {'dry_run': dry_run, 'created': {}, 'skipped': 0, 'errors': []}
+        self.categories = {}
+        self.collections = {}
+        self.public_collections = set()
+        self.pending = []
+        self.image_ids = []
+        self.gpx_ids = []
+
+    def run(self, file, filename):
+        ext = os.path.splitext(filename.lower())[1]
+        with transaction.atomic():
+            if ext == '.zip':
+                self.import_export(file)
+            elif ext == '.csv':
+                self.import_rows(csv.DictReader(io.TextIOWrapper(file, encoding='utf-8-sig', newline='')), start=2)
+            elif ext in ('.geojson', '.json'):
+                self.import_rows(self._iter_features(file), start=1)
+            else:
+                raise ImportFormatError('Unsupported file type, expected a .zip export, .csv or .geojson file')
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+        if not self.dry_run:
+            # bulk_create does not send the signals that keep the counters up to date
+            refresh_travel_stats(self.user.id)
+            # Renditions and tracks are generated in the background, like for regular uploads
+            for image_id in self.image_ids:
+                run_in_background(process_image_by_id, image_id)
+            for attachment_id in self.gpx_ids:
+                run_in_background(process_gpx_attachment, attachment_id)
+        return self.report
+
+    # Reporting
+
+    def _count(self, key, amount):
+        self.report['created'][key] = self.report['created'].get(key, 0) + amount
+        if self.progress:
+            self.progress(self.report)
+
+    def _error(self, line, message):
+        self.report['skipped'] += 1
+        if len(self.report['errors']) < MAX_REPORTED_ERRORS:
+            self.report['errors'].append({'line': line, 'error': str(message)})
+
+    # Lookups, resolved once per batch
+
+    def _resolve_categories(self, names, details=None):
+        missing = {name for name in names if name not in self.categories}
+        if not missing:
+            return
+        for category in Category.objects.filter(user_id=self.user, name__in=missing):
+            self.categories[category.name] = category
+        new = []
+        for name in missing - self.categories.keys():
+            display_name, icon = (details or {}).get(name, (name.title(), '🌍'))
+            new.append(Category(user_id=self.user, name=name, display_name=display_name, icon=icon))
+        Category.objects.bulk_create(new)
+        for category in new:
+            self.categories[category.name] = category
+        if new:
+            self._count('categories', len(new))
+
+    def _resolve_collections(self, names):
+        missing = {name for name in names if name not in self.collections}
+        if not missing:
+            return
+        for collection in Collection.objects.filter(user_id=self.user, name__in=missing).order_by('created_at'):
+            self.collections.setdefault(collection.name, collection)
+        new = [Collection(user_id=self.user, name=name) for name in missing - self.collections.keys()]
+        Collection.objects.bulk_create(new)
+        for collection in new:
+            self.collections[collection.name] = collection
+        if new:
+            self._count('collections', len(new))
+
+    # CSV and GeoJSON
+
+    def _iter_features(self, file):
+        try:
+            for feature in ijson.items(file, 'features.item', use_float=True):
+                properties = dict(feature.get('properties') or {})
+                geometry = feature.get('geometry') or {}
+                if geometry.get('type') == 'Point' and len(geometry.get('coordinates') or []) >= 2:
+                    properties['longitude'], properties['latitude'] = geometry['coordinates'][:2]
+                yield properties
+        except ijson.JSONError as e:
+            raise ImportFormatError(f'Invalid GeoJSON: {e}')
+
+    def _parse_row(self, row):
+        name = _get(row, 'name')
+        if not name:
+            raise ValueError('Missing name')
+        start_date = _datetime(_get(row, 'start_date'))
+        end_date = _datetime(_get(row, 'end_date')) or start_date
+        if start_date and end_date and start_date > end_date:
+            raise ValueError('The start date must be before or equal to the end date')
+        rating = _get(row, 'rating')
+        return {
+            'fields': {
+                'name': str(name)[:200],
+                'description': _get(row, 'description'),
+                'location': (str(_get(row, 'location'))[:200] if _get(row, 'location') else None),
+                'latitude': _coordinate(_get(row, 'latitude'), 90),
+                'longitude': _coordinate(_get(row, 'longitude'), 180),
+                'activity_types': _list(_get(row, 'activity_types')),
+                'rating': _rating(rating) if rating is not None else None,
+                'link': _get(row, 'link'),
+                'is_public': _bool(_get(row, 'is_public') or False),
+            },
+            'category': str(_get(row, 'category') or 'general').strip().lower()[:200],
+            'collection': (str(_get(row, 'collection')).strip()[:200] if _get(row, 'collection') else None),
+            'visits': [{'start_date': start_date, 'end_date': end_date, 'notes': _get(row, 'notes')}] if start_date else [],
+        }
+
+    def import_rows(self, rows, start):
+        for line, row in enumerate(rows, start=start):
+            try:
+                self.pending.append(self._parse_row(row))
+            except (ValueError, TypeError) as e:
+                self._error(line, e)
+                continue
+            if len(self.pending) >= self.batch_size:
+                self._flush_rows()
+        self._flush_rows()
+
+    def _flush_rows(self):
+        rows, self.pending = self.pending, []
+        if not rows:
+            return
+        self._resolve_categories({row['category'] for row in rows})
+        self._resolve_collections({row['collection'] for row in rows if row['collection']})
+
+        adventures = []
+        visits = []
+        for row in rows:
+            collection = self.collections.get(row['collection'])
+            fields = row['fields']
+            if collection and collection.is_public:
+                fields['is_public'] = True
+            adventure = Adventure(user_id=self.user, category=self.categories[row['category']], collection=collection, **fields)
+            adventures.append(adventure)
+            visits += [Visit(adventure=adventure, **visit) for visit in row['visits']]
+        Adventure.objects.bulk_create(adventures)
+        Visit.objects.bulk_create(visits)
+        self._count('adventures', len(adventures))
+        self._count('visits', len(visits))
+
+    # Account exports
+
+    def import_export(self, file):
+        try:
+            archive = zipfile.ZipFile(file)
+        except zipfile.BadZipFile:
+            raise ImportFormatError('The file is not a valid ZIP archive')
+        with archive:
+            try:
+                manifest = json.loads(archive.read('manifest.json'))
+            except (KeyError, ValueError):
+                raise ImportFormatError('The archive is not an AdventureLog export')
+            if manifest.get('format') != 'adventurelog-export':
+                raise ImportFormatError('The archive is not an AdventureLog export')
+
+            self.archive = archive
+            self.media_names = set(name for name in archive.namelist() if name.startswith('media/'))
+            ids = {}
+
+            category_ids = {}
+            for batch in self._export_batches('categories.ndjson'):
+                details = {row['name']: (row.get('display_name') or row['name'], row.get('icon') or '🌍') for _, row in batch}
+                self._resolve_categories(details.keys(), details)
+                for _, row in batch:
+                    category_ids[row['id']] = self.categories[row['name']].id
+            ids['category_id'] = category_ids
+
+            ids['collection_id'] = self._import_model('collections.ndjson', Collection, {}, 'collections')
+            ids['adventure_id'] = self._import_model('adventures.ndjson', Adventure, ids, 'adventures')
+            self._import_model('visits.ndjson', Visit, ids, 'visits')
+            self._import_model('images.ndjson', AdventureImage, ids, 'images', media_field='image')
+            self._import_model('attachments.ndjson', Attachment, ids, 'attachments', media_field='file')
+            self._import_model('notes.ndjson', Note, ids, 'notes')
+            ids['checklist_id'] = self._import_model('checklists.ndjson', Checklist, ids, 'checklists')
+            self._import_model('checklist_items.ndjson', ChecklistItem, ids, 'checklist_items')
+            self._import_model('lodging.ndjson', Lodging, ids, 'lodging')
+            self._import_model('transportation.ndjson', Transportation, ids, 'transportation')
+            self._import_visited('visited_regions.ndjson', VisitedRegion, Region, 'region_id', 'visited_regions')
+            self._import_visited('visited_cities.ndjson', VisitedCity, City, 'city_id', 'visited_cities')
+
+    def _export_batches(self, filename):
+        if filename not in self.archive.namelist():
+            return
+        batch = []
+        with self.archive.open(filename) as f:
+            for line, text in enumerate(io.TextIOWrapper(f, encoding='utf-8'), start=1):
+                if not text.strip():
+                    continue
+                try:
+                    batch.append((line, json.loads(text)))
+                except ValueError as e:
+                    self._error(f'{filename}:{line}', e)
+                    continue
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _import_model(self, filename, model, ids, key, media_field=None):
+        """
+        Recreates the rows of `model` from an export file with new primary keys. Foreign keys
+        are translated with `ids` ({attname: {old id: new id}}). Returns the id translation
+        for this model.
+        """
+        fields = _concrete_fields(model)
+        translated = {}
+        for batch in self._export_batches(filename):
+            objects = []
+            for line, row in batch:
+                old_id = row.pop('id', None)
+                values = {name: value for name, value in row.items() if name in fields}
+                values.pop('id', None)
+                if 'user_id_id' in fields:
+                    values['user_id_id'] = self.user.id
+                missing = False
+                for field in model._meta.concrete_fields:
+                    if not field.is_relation or field.attname == 'user_id_id' or values.get(field.attname) is None:
+                        continue
+                    # Only rows created by this import can be referred to, so whatever a row points
+                    # at (collection, category, ...) belongs to the user
+                    values[field.attname] = ids.get(field.attname, {}).get(values[field.attname])
+                    if values[field.attname] is None and not field.null:
+                        missing = True
+                if missing:
+                    self._error(f'{filename}:{line}', 'Refers to a row that was not imported')
+                    continue
+                try:
+                    self._check_values(model, values)
+                except (ValueError, TypeError, ValidationError) as e:
+                    self._error(f'{filename}:{line}', e.messages[0] if isinstance(e, ValidationError) else e)
+                    continue
+                if model is Adventure and not values.get('category_id'):
+                    self._resolve_categories({'general'})
+                    values['category_id'] = self.categories['general'].id
+                if model is AdventureImage:
+                    # Renditions are not part of exports, they are generated again
+                    values.update(renditions={}, is_processed=False)
+                obj = model(**values)
+                objects.append(obj)
+                if old_id is not None:
+                    translated[old_id] = obj.pk
+
+            if media_field:
+                objects = self._store_media(objects, media_field, filename)
+            model.objects.bulk_create(objects)
+            if model is Collection:
+                self.public_collections.update(obj.pk for obj in objects if obj.is_public)
+            elif model is AdventureImage:
+                # Images linked to Immich without a file have nothing to process
+                self.image_ids += [obj.pk for obj in objects if obj.image]
+            elif model is Attachment:
+                self.gpx_ids += [obj.pk for obj in objects if is_gpx(obj.file.name)]
+            self._count(key, len(objects))
+        return translated
+
+    def _check_values(self, model, values):
+        """The checks of the models' clean(), on the values of one row from an export."""
+        if values.get('rating') is not None:
+            values['rating'] = _rating(values['rating'])
+        if model in DATE_RANGES:
+            start, end = (model._meta.get_field(name) for name in DATE_RANGES[model])
+            start_value = start.to_python(values.get(start.attname))
+            end_value = end.to_python(values.get(end.attname))
+            if start_value and end_value and start_value > end_value:
+                raise ValueError('The start date must be before or equal to the end date')
+        if values.get('collection_id') in self.public_collections:
+            # Everything in a public collection has to be public
+            values['is_public'] = True
+        if values.get('immich_id'):
+            # Interpolated into Immich URLs, like in AdventureImageSerializer
+            values['immich_id'] = str(uuid.UUID(str(values['immich_id'])))
+
+    def _store_media(self, objects, field, filename):
+        """
+        Copies the media files of a batch from the archive into storage. A thread pool only reads
+        and hashes the files, they are moved into place on the importing connection so the blob
+        locks are held until the import commits (see content_storage.lock_blob).
+        Rows whose file is missing from the archive are skipped unless they are linked to Immich.
+        The names come from the uploaded file, so they are only used to find the archive member:
+        files are stored under the field's own directory and rows never keep a name that was not
+        stored by this import (it could be another user's blob).
+        """
+        directory = objects[0]._meta.get_field(field).upload_to.path.strip('/') if objects else ''
+
+        def read(name):
+            member = f'media/{name}'
+            if member not in self.media_names:
+                return None
+            if self.dry_run:
+                return name
+            with self.archive.open(member) as f:
+                return content_addressed_storage.write_temporary(directory, File(f))
+
+        names = [getattr(obj, field).name for obj in objects]
+        with ThreadPoolExecutor(max_workers=MEDIA_WORKERS) as executor:
+            futures = [executor.submit(read, name) for name in names]
+
+        stored = []
+        try:
+            for name, future in zip(names, futures):
+                result = future.result()
+                if result is None or self.dry_run:
+                    stored.append(result)
+                    continue
+                tmp_path, digest = result
+                # The stored name is derived from the content, only the extension is kept
+                stored.append(content_addressed_storage.store_temporary(tmp_path, directory, digest, os.path.basename(name)))
+        finally:
+            # Files read for rows that were not stored because of an error
+            for future in futures:
+                if not future.exception() and isinstance(future.result(), tuple) and os.path.exists(future.result()[0]):
+                    os.remove(future.result()[0])
+
+        kept = []
+        for obj, name in zip(objects, stored):
+            if name:
+                setattr(obj, field, name)
+                kept.append(obj)
+            elif getattr(obj, 'immich_id', None):
+                setattr(obj, field, '')
+                kept.append(obj)
+            else:
+                self._error(filename, f'Missing media file {getattr(obj, field).name}')
+        if not self.dry_run:
+            self._count('media', sum(1 for name in stored if name))
+        return kept
+
+    def _import_visited(self, filename, model, target_model, attname, key):
+        for batch in self._export_batches(filename):
+            target_ids = {row.get(attname) for _, row in batch}
+            # Only world data that exists on this server, and nothing the user already marked
+            known = set(target_model.objects.filter(id__in=target_ids).values_list('id', flat=True))
+            existing = set(model.objects.filter(user_id=self.user, **{f'{attname}__in': known}).values_list(attname, flat=True))
+            objects = []
+            for _, row in batch:
+                target_id = row.get(attname)
+                if target_id in known and target_id not in existing:
+                    existing.add(target_id)
+                    # Keep when it was marked, exports without the date leave it unknown
+                    objects.append(model(user_id=self.user, created_at=row.get('created_at'), **{attname: target_id}))
+            model.objects.bulk_create(objects)
+            self._count(key, len(objects))
@@ -0,0 +1,353 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import ijson
+import numpy as np
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from adventures.utils.importer import COORDINATE, AdventureImporter, ImportFormatError
+from adventures.utils.stats import refresh_travel_stats
+from worldtravel.models import City, VisitedCity, VisitedRegion
+
+# Points are read and clustered this many at a time, which bounds memory use
+CHUNK_SIZE = 50000
+# Consecutive points further apart than this (meters) or moving faster than MAX_STAY_SPEED
+# (m/s, ignored for jumps under STAY_JITTER meters of GPS noise) end a stay
+STAY_RADIUS = 200
+STAY_JITTER = 50
+MAX_STAY_SPEED = 0.8
+# A gap in the recording longer than this (seconds) ends a stay
+MAX_GAP = 3 * 60 * 60
+# Stays shorter than this (seconds) are ignored
+MIN_STAY = 30 * 60
+# Stays are grouped into places on a grid of this size (degrees, about 500 m)
+PLACE_GRID = 0.005
+# Visits to the same place closer together than this (seconds) are merged
+MERGE_GAP = 60 * 60
+# Places visited more often than this are most likely home or work and are not imported
+MAX_VISITS_PER_PLACE = 30
+# Places are marked as visiting the nearest city within this distance (meters)
+CITY_RADIUS = 15000
+
+CATEGORY = 'location-history'
+CATEGORY_DETAILS = {CATEGORY: ('Location History', '📍')}
+
+EARTH_RADIUS = 6371008.8
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Vectorized great-circle distance in meters.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1)))
+
+
+def _timestamp(value):
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    return parsed.timestamp() if parsed else None
+
+
+def _lat_lng(value):
+    # Google Timeline stores positions as "48.1374°, 11.5755°"
+    try:
+        lat, lon = (float(part.strip().rstrip('°')) for part in value.split(','))
+        return lat, lon
+    except (AttributeError, ValueError):
+        return None
+
+
+def _google_records(file):
+    for location in ijson.items(file, 'locations.item'):
+        if 'latitudeE7' not in location or 'longitudeE7' not in location:
+            continue
+        if 'timestampMs' in location:
+            t = int(location['timestampMs']) / 1000
+        else:
+            t = _timestamp(location.get('timestamp'))
+        if t is not None:
+            yield t, location['latitudeE7'] / 1e7, location['longitudeE7'] / 1e7
+
+
+def _google_timeline(file):
+    for segment in ijson.items(file, 'semanticSegments.item'):
+        for point in segment.get('timelinePath') or []:
+            position, t = _lat_lng(point.get('point')), _timestamp(point.get('time'))
+            if position and t is not None:
+                yield (t, *position)
+        visit = segment.get('visit')
+        if visit:
+            # Visits only have a place and a time span, emit the place at both ends
+            position = _lat_lng(((visit.get('topCandidate') or {}).get('placeLocation') or {}).get('latLng'))
+            start, end = _timestamp(segment.get('startTime')), _timestamp(segment.get('endTime'))
+            if position and start is not None and end is not None:
+                yield (start, *position)
+                yield (end, *position)
+
+
+def _polarsteps_locations(file):
+    for location in ijson.items(file, 'locations.item', use_float=True):
+        if location.get('time') is not None and location.get('lat') is not None and location.get('lon') is not None:
+            yield float(location['time']), float(location['lat']), float(location['lon'])
+
+
+def detect_format(file):
+    """
+    Sniffs the beginning of a location history file. Returns 'google-records' (Takeout
+    Records.json), 'google-timeline' (on-device Timeline.json), 'polarsteps-locations'
+    (locations.json) or 'polarsteps-trip' (trip.json).
+    """
+    head = file.read(1024 * 1024)
+    file.seek(0)
+    if isinstance(head, bytes):
+        head = head.decode('utf-8', errors='ignore')
+    if '"semanticSegments"' in head:
+        return 'google-timeline'
+    if '"latitudeE7"' in head:
+        return 'google-records'
+    if '"all_steps"' in head:
+        return 'polarsteps-trip'
+    if '"locations"' in head and '"lat"' in head:
+        return 'polarsteps-locations'
+    raise ImportFormatError('Unrecognized location history, expected a Google Takeout or Polarsteps export')
+
+
+POINT_READERS = {
+    'google-records': _google_records,
+    'google-timeline': _google_timeline,
+    'polarsteps-locations': _polarsteps_locations,
+}
+
+
+def iter_point_chunks(points, chunk_size=CHUNK_SIZE):
+    """
+    Groups (time, lat, lon) tuples into arrays of at most `chunk_size` points sorted by time.
+    """
+    buffer = []
+    for point in points:
+        buffer.append(point)
+        if len(buffer) >= chunk_size:
+            yield _to_arrays(buffer)
+            buffer = []
+    if buffer:
+        yield _to_arrays(buffer)
+
+
+def _to_arrays(points):
+    data = np.array(points, dtype=np.float64)
+    data = data[np.argsort(data[:, 0], kind='stable')]
+    return data[:, 0], data[:, 1], data[:, 2]
+
+
+class StayDetector:
+    """
+    Splits a time-ordered stream of points into stays: runs of consecutive points that stay
+    close together. Each chunk is processed with vectorized NumPy operations; only a summary
+    of the stay that is still open at the end of a chunk is carried over to the next one.
+    """
+
+    def __init__(self):
+        # [start, end, lat sum, lon sum, count, last lat, last lon]
+        self.open = None
+
+    def feed(self, t, lat, lon):
+        """
+        Returns the stays closed by this chunk as (start, end, lat, lon) arrays.
+        """
+        n = len(t)
+        breaks = np.empty(n, dtype=bool)
+        if self.open is None:
+            breaks[0] = True
+        else:
+            jump = haversine(self.open[5], self.open[6], lat[0], lon[0])
+            gap = t[0] - self.open[1]
+            breaks[0] = jump > STAY_RADIUS or gap > MAX_GAP or (jump > STAY_JITTER and jump / max(gap, 1) > MAX_STAY_SPEED)
+        if n > 1:
+            jumps = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+            gaps = np.diff(t)
+            speeds = jumps / np.maximum(gaps, 1)
+            breaks[1:] = (jumps > STAY_RADIUS) | (gaps > MAX_GAP) | ((jumps > STAY_JITTER) & (speeds > MAX_STAY_SPEED))
+
+        starts = np.flatnonzero(breaks)
+        if len(starts) == 0 or starts[0] != 0:
+            starts = np.r_[0, starts]
+        ends = np.r_[starts[1:] - 1, n - 1]
+        run_start, run_end = t[starts], t[ends]
+        lat_sum, lon_sum = np.add.reduceat(lat, starts), np.add.reduceat(lon, starts)
+        counts = np.diff(np.r_[starts, n]).astype(np.float64)
+
+        if not breaks[0]:
+            # The first run continues the stay left open by the previous chunk
+            run_start[0] = self.open[0]
+            lat_sum[0] += self.open[2]
+            lon_sum[0] += self.open[3]
+            counts[0] += self.open[4]
+        elif self.open is not None:
+            run_start = np.r_[self.open[0], run_start]
+            run_end = np.r_[self.open[1], run_end]
+            lat_sum = np.r_[self.open[2], lat_sum]
+            lon_sum = np.r_[self.open[3], lon_sum]
+            counts = np.r_[self.open[4], counts]
+
+        # The last run can continue in the next chunk
+        self.open = [run_start[-1], run_end[-1], lat_sum[-1], lon_sum[-1], counts[-1], lat[-1], lon[-1]]
+        return self._closed(run_start[:-1], run_end[:-1], lat_sum[:-1], lon_sum[:-1], counts[:-1])
+
+    def finish(self):
+        if self.open is None:
+            return self._closed(*(np.empty(0) for _ in range(5)))
+        start, end, lat_sum, lon_sum, count = (np.array([value]) for value in self.open[:5])
+        self.open = None
+        return self._closed(start, end, lat_sum, lon_sum, count)
+
+    def _closed(self, start, end, lat_sum, lon_sum, count):
+        keep = (end - start) >= MIN_STAY
+        return start[keep], end[keep], lat_sum[keep] / count[keep], lon_sum[keep] / count[keep]
+
+
+class CityIndex:
+    """
+    Nearest city lookup over all cities with coordinates, sorted by latitude so each lookup
+    only compares the cities in a narrow latitude band.
+    """
+
+    def __init__(self):
+        rows = list(
+            City.objects.exclude(latitude=None).exclude(longitude=None)
+            .order_by('latitude').values_list('id', 'region_id', 'name', 'latitude', 'longitude')
+        )
+        self.cities = [{'id': row[0], 'region_id': row[1], 'name': row[2]} for row in rows]
+        self.lats = np.array([float(row[3]) for row in rows])
+        self.lons = np.array([float(row[4]) for row in rows])
+        # Latitude band that can contain a city within CITY_RADIUS
+        self.band = CITY_RADIUS / 111000
+
+    def nearest(self, lat, lon):
+        low, high = np.searchsorted(self.lats, [lat - self.band, lat + self.band])
+        if low == high:
+            return None
+        distances = haversine(lat, lon, self.lats[low:high], self.lons[low:high])
+        index = int(np.argmin(distances))
+        if distances[index] > CITY_RADIUS:
+            return None
+        return self.cities[low + index]
+
+
+class LocationHistoryImporter(AdventureImporter):
+    """
+    Imports a Google Takeout or Polarsteps location history. Raw points are clustered into
+    stays (see StayDetector), stays are grouped into places and every place becomes an
+    adventure with one visit per stay. The nearest cities and their regions are marked
+    as visited. Polarsteps trips already contain named steps, which are imported as they are.
+    """
+
+    def run(self, file, filename=None):
+        history_format = detect_format(file)
+        with transaction.atomic():
+            self._resolve_categories({CATEGORY}, CATEGORY_DETAILS)
+            if history_format == 'polarsteps-trip':
+                self.import_rows(self._polarsteps_steps(file), start=1)
+            else:
+                self.import_places(POINT_READERS[history_format](file))
+            if self.dry_run:
+                transaction.set_rollback(True)
+        if not self.dry_run:
+            refresh_travel_stats(self.user.id)
+        return self.report
+
+    def _polarsteps_steps(self, file):
+        for step in ijson.items(file, 'all_steps.item', use_float=True):
+            location = step.get('location') or {}
+            start, end = step.get('start_time'), step.get('end_time')
+            yield {
+                'name': step.get('display_name') or step.get('name') or location.get('name'),
+                'description': step.get('description'),
+                'location': location.get('detail') or location.get('name'),
+                'latitude': location.get('lat'),
+                'longitude': location.get('lon'),
+                'category': CATEGORY,
+                'start_date': _epoch_to_iso(start),
+                'end_date': _epoch_to_iso(end),
+            }
+
+    def import_places(self, points):
+        detector = StayDetector()
+        places = {}
+        for t, lat, lon in iter_point_chunks(points):
+            self._add_stays(places, *detector.feed(t, lat, lon))
+            self.report['points'] = self.report.get('points', 0) + len(t)
+            if self.progress:
+                self.progress(self.report)
+        self._add_stays(places, *detector.finish())
+
+        frequent = [key for key, place in places.items() if len(place['visits']) > MAX_VISITS_PER_PLACE]
+        for key in frequent:
+            del places[key]
+        self.report['frequent_places_skipped'] = len(frequent)
+        if not places:
+            return
+
+        city_index = CityIndex()
+        # City/region id -> first stay there (epoch seconds), recorded as when it was visited
+        visited_cities = {}
+        visited_regions = {}
+        for place in places.values():
+            lat, lon = place['lat_sum'] / place['count'], place['lon_sum'] / place['count']
+            name = f'Stay at {lat:.4f}, {lon:.4f}'
+            nearest = city_index.nearest(lat, lon)
+            if nearest:
+                first = place['visits'][0][0]
+                visited_cities[nearest['id']] = min(first, visited_cities.get(nearest['id'], first))
+                visited_regions[nearest['region_id']] = min(first, visited_regions.get(nearest['region_id'], first))
+                name = f"Stay in {nearest['name']}"
+            self.pending.append({
+                'fields': {
+                    'name': name[:200],
+                    'latitude': Decimal(lat).quantize(COORDINATE),
+                    'longitude': Decimal(lon).quantize(COORDINATE),
+                    'is_public': False,
+                },
+                'category': CATEGORY,
+                'collection': None,
+                'visits': [
+                    {'start_date': _epoch_to_datetime(start), 'end_date': _epoch_to_datetime(end)}
+                    for start, end in place['visits']
+                ],
+            })
+            if len(self.pending) >= self.batch_size:
+                self._flush_rows()
+        self._flush_rows()
+        self._mark_visited(VisitedCity, 'city_id', visited_cities, 'visited_cities')
+        self._mark_visited(VisitedRegion, 'region_id', visited_regions, 'visited_regions')
+
+    def _add_stays(self, places, starts, ends, lats, lons):
+        for start, end, lat, lon in zip(starts.tolist(), ends.tolist(), lats.tolist(), lons.tolist()):
+            key = (round(lat / PLACE_GRID), round(lon / PLACE_GRID))
+            place = places.setdefault(key, {'lat_sum': 0.0, 'lon_sum': 0.0, 'count': 0, 'visits': []})
+            place['lat_sum'] += lat
+            place['lon_sum'] += lon
+            place['count'] += 1
+            visits = place['visits']
+            if visits and start - visits[-1][1] < MERGE_GAP:
+                visits[-1][1] = max(visits[-1][1], end)
+            else:
+                visits.append([start, end])
+
+    def _mark_visited(self, model, attname, first_visits, key):
+        existing = set(model.objects.filter(user_id=self.user, **{f'{attname}__in': first_visits}).values_list(attname, flat=True))
+        objects = [
+            model(user_id=self.user, created_at=_epoch_to_datetime(first), **{attname: target_id})
+            for target_id, first in first_visits.items() if target_id not in existing
+        ]
+        model.objects.bulk_create(objects, batch_size=self.batch_size)
+        self._count(key, len(objects))
+
+
+def _epoch_to_datetime(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+
+
+def _epoch_to_iso(value):
+    return _epoch_to_datetime(float(value)).isoformat() if value is not None else None
@@ -0,0 +1,159 @@
+import re
+import unicodedata
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, Q
+
+from adventures.models import Adventure, Checklist, Collection, Lodging, Note, Transportation
+from adventures.serializers import (
+    AdventureSerializer, ChecklistSerializer, CollectionSerializer, LodgingSerializer, NoteSerializer,
+    TransportationSerializer,
+)
+from adventures.utils.gpx import preview_tracks
+from main.utils import SearchName
+from users.models import CustomUser as User
+from users.serializers import CustomUserDetailsSerializer as UserSerializer
+from worldtravel.models import City, Country, Region, VisitedCity, VisitedRegion
+from worldtravel.serializers import (
+    CitySerializer, CountrySerializer, RegionSerializer, VisitedCitySerializer, VisitedRegionSerializer,
+)
+
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Letters unaccent() rewrites that Unicode does not decompose into a base letter and accents
+UNACCENT_LETTERS = str.maketrans({
+    'ß': 'ss', 'æ': 'ae', 'œ': 'oe', 'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'þ': 'th', 'ı': 'i',
+})
+
+
+def normalize(text):
+    """Python equivalent of immutable_unaccent(lower(text)), the expression of the name indexes."""
+    decomposed = unicodedata.normalize('NFKD', text.lower().translate(UNACCENT_LETTERS))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class SearchTerm:
+    """
+    The search input in the two forms the indexes need: normalized text for the trigram
+    indexes on names and a prefix tsquery for the stored search vectors.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.normalized = normalize(text)
+        words = re.findall(r'[^\W_]+', self.normalized)
+        self.query = None
+        if words:
+            self.query = SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config='simple')
+
+
+def search_documents(queryset, term):
+    """Rows whose search_vector matches the term, best ranked first."""
+    if term.query is None:
+        return queryset.none()
+    return (
+        queryset.filter(search_vector=term.query)
+        .annotate(rank=SearchRank(F('search_vector'), term.query))
+        .order_by('-rank', 'pk')
+    )
+
+
+def search_names(queryset, term, *fields, extra=Q()):
+    """
+    Rows whose (unaccented, lowercased) name contains the term or has a word similar to it,
+    or that match `extra`, most similar first.
+    """
+    name = SearchName(*fields)
+    return (
+        queryset.alias(search_name=name)
+        .filter(Q(search_name__contains=term.normalized) | Q(search_name__trigram_word_similar=term.normalized) | extra)
+        .annotate(rank=TrigramWordSimilarity(term.normalized, name))
+        .order_by('-rank', 'pk')
+    )
+
+
+def _page(queryset, limit, offset):
+    # One row more than asked for tells whether there is a next page without a COUNT
+    rows = list(queryset[offset:offset + limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def _search_owned(key, model, serializer_class, select=(), prefetch=()):
+    def search(user, term, limit, offset, context):
+        queryset = search_documents(model.objects.filter(user_id=user).defer('search_vector'), term)
+        rows, has_more = _page(queryset.select_related(*select).prefetch_related(*prefetch), limit, offset)
+        return {key: (serializer_class(rows, many=True, context=context).data, has_more)}
+    return search
+
+
+def _search_users(user, term, limit, offset, context):
+    queryset = search_names(User.objects.filter(public_profile=True), term, 'username', 'first_name', 'last_name')
+    rows, has_more = _page(queryset, limit, offset)
+    return {'users': (UserSerializer(rows, many=True, context=context).data, has_more)}
+
+
+def _search_countries(user, term, limit, offset, context):
+    queryset = search_names(Country.objects.with_counts(user), term, 'name', extra=Q(country_code__iexact=term.text))
+    rows, has_more = _page(queryset, limit, offset)
+    return {'countries': (CountrySerializer(rows, many=True, context=context).data, has_more)}
+
+
+def _search_regions(user, term, limit, offset, context):
+    queryset = search_names(Region.objects.with_counts(), term, 'name')
+    rows, has_more = _page(queryset, limit, offset)
+    # Only the visits of the regions on this page, the client needs them to mark results
+    visited = VisitedRegion.objects.filter(user_id=user, region__in=rows).select_related('region', 'user_id')
+    return {
+        'regions': (RegionSerializer(rows, many=True, context=context).data, has_more),
+        'visited_regions': (VisitedRegionSerializer(visited, many=True, context=context).data, False),
+    }
+
+
+def _search_cities(user, term, limit, offset, context):
+    queryset = search_names(City.objects.select_related('region__country'), term, 'name')
+    rows, has_more = _page(queryset, limit, offset)
+    visited = VisitedCity.objects.filter(user_id=user, city__in=rows).select_related('city', 'user_id')
+    return {
+        'cities': (CitySerializer(rows, many=True, context=context).data, has_more),
+        'visited_cities': (VisitedCitySerializer(visited, many=True, context=context).data, False),
+    }
+
+
+# Result type -> function returning {key: (serialized rows, has_more)}
+SEARCHES = {
+    'adventures': _search_owned(
+        'adventures', Adventure, AdventureSerializer, select=['category', 'user_id'], prefetch=['images', 'visits', 'attachments', preview_tracks()],
+    ),
+    'collections': _search_owned(
+        'collections', Collection, CollectionSerializer, select=['user_id'], prefetch=[
+            'adventure_set__images', 'adventure_set__visits', 'adventure_set__attachments', 'adventure_set__category',
+            preview_tracks('adventure_set__attachments__tracks'),
+            'transportation_set', 'note_set', 'checklist_set__checklistitem_set', 'lodging_set',
+        ],
+    ),
+    'notes': _search_owned('notes', Note, NoteSerializer, select=['user_id']),
+    'checklists': _search_owned('checklists', Checklist, ChecklistSerializer, select=['user_id'], prefetch=['checklistitem_set']),
+    'lodging': _search_owned('lodging', Lodging, LodgingSerializer, select=['user_id']),
+    'transportations': _search_owned('transportations', Transportation, TransportationSerializer, select=['user_id']),
+    'users': _search_users,
+    'countries': _search_countries,
+    'regions': _search_regions,
+    'cities': _search_cities,
+}
+
+
+def global_search(user, text, types=None, limit=DEFAULT_LIMIT, offset=0, context=None):
+    """
+    Runs the search for every requested result type, one after another on the request's
+    connection. Returns {key: [serialized rows]} and {key: has_more}.
+    """
+    term = SearchTerm(text)
+    results, has_more = {}, {}
+    for name, search in SEARCHES.items():
+        if types is not None and name not in types:
+            continue
+        for key, (rows, more) in search(user, term, limit, offset, context).items():
+            results[key] = rows
+            has_more[key] = more
+    return results, has_more
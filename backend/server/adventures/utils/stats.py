@@ -0,0 +1,79 @@
+from django.core.cache import cache
+from django.db.models import Count, F, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+
+from adventures.models import Adventure, Collection, TravelStats
+from worldtravel.models import City, Country, Region, VisitedCity, VisitedRegion, WorldDataImport
+
+# Sent after a user's counters were recomputed from scratch, e.g. after an import
+travel_stats_refreshed = Signal()
+
+STAT_FIELDS = ['adventure_count', 'collection_count', 'visited_region_count', 'visited_city_count', 'visited_country_count']
+
+
+def world_totals_cache_key():
+    # The world data only changes when download-countries records an import. The cache is per
+    # process, so the key changes instead of the command deleting it
+    latest = WorldDataImport.objects.order_by('-id').values_list('id', flat=True).first()
+    return f'worldtravel-totals:{latest}'
+
+
+def get_world_totals():
+    key = world_totals_cache_key()
+    totals = cache.get(key)
+    if totals is None:
+        totals = {
+            'total_cities': City.objects.count(),
+            'total_regions': Region.objects.count(),
+            'total_countries': Country.objects.count(),
+        }
+        # Don't remember an empty database, the countries may not have been downloaded yet
+        if totals['total_countries']:
+            cache.set(key, totals, None)
+    return totals
+
+
+def refresh_travel_stats(user_id):
+    """
+    Recomputes every counter of a user. Used when the stats row does not exist yet and after
+    bulk operations that bypass model signals (bulk_create, QuerySet.update).
+    """
+    values = {
+        'adventure_count': Adventure.objects.filter(user_id=user_id).count(),
+        'collection_count': Collection.objects.filter(user_id=user_id).count(),
+        'visited_region_count': VisitedRegion.objects.filter(user_id=user_id).count(),
+        'visited_city_count': VisitedCity.objects.filter(user_id=user_id).count(),
+        'visited_country_count': VisitedRegion.objects.filter(user_id=user_id).values('region__country').distinct().count(),
+    }
+    stats, _ = TravelStats.objects.update_or_create(user_id=user_id, defaults=values)
+    travel_stats_refreshed.send(sender=TravelStats, user_id=user_id, stats=stats)
+    return stats
+
+
+def get_travel_stats(user_id):
+    stats = TravelStats.objects.filter(user_id=user_id).first()
+    return stats or refresh_travel_stats(user_id)
+
+
+def recount_visited_countries(user_id):
+    """
+    Recomputes visited_country_count in a single UPDATE. Whether a visited region adds or removes
+    a country depends on the user's other visits, which deltas computed beforehand can miss when
+    they change concurrently.
+    """
+    countries = (
+        VisitedRegion.objects.filter(user_id=user_id).order_by().values('user_id')
+        .annotate(count=Count('region__country', distinct=True)).values('count')
+    )
+    TravelStats.objects.filter(user_id=user_id).update(visited_country_count=Coalesce(Subquery(countries), 0))
+
+
+def adjust_travel_stats(user_id, **deltas):
+    """
+    Applies increments/decrements in a single UPDATE. When the user has no stats row yet nothing
+    happens: the row is computed from scratch the next time it is read.
+    """
+    updates = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items() if delta}
+    if updates:
+        TravelStats.objects.filter(user_id=user_id).update(**updates)
@@ -0,0 +1,28 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+# Small in-process pool for work that should not hold up the request that triggered it.
+# Anything lost when a worker restarts is picked up again by the matching management command.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='adventurelog-tasks')
+
+
+def _run(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        # Each pool thread gets its own database connection, don't leave it open
+        connection.close()
+
+
+def run_in_background(func, *args):
+    """
+    Runs `func(*args)` on the background pool once the current transaction commits,
+    so the task always sees the rows the request created.
+    """
+    transaction.on_commit(lambda: _executor.submit(_run, func, *args))
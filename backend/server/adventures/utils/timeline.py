@@ -0,0 +1,179 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import connection
+
+from adventures.models import Adventure, Category, Lodging, Transportation, Visit
+from worldtravel.models import Region, VisitedCity, VisitedRegion
+
+PERIODS = {'year': '%Y', 'month': '%Y-%m'}
+TIMELINE_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Visits and visited adventures per period, once per category and once for all of them.
+# Adventures whose category was deleted are counted under UNCATEGORIZED.
+UNCATEGORIZED = {'name': 'uncategorized', 'display_name': 'Uncategorized', 'icon': '❔'}
+
+VISITS_SQL = f"""
+    SELECT period, GROUPING(category_id) = 1, name, display_name, icon, count(DISTINCT adventure_id), count(*)
+    FROM (
+        SELECT date_trunc(%(period)s, v.start_date) AS period, a.id AS adventure_id,
+               c.id AS category_id, COALESCE(c.name, %(uncategorized_name)s) AS name,
+               COALESCE(c.display_name, %(uncategorized_display_name)s) AS display_name,
+               COALESCE(c.icon, %(uncategorized_icon)s) AS icon
+        FROM {Visit._meta.db_table} v
+        JOIN {Adventure._meta.db_table} a ON a.id = v.adventure_id
+        LEFT JOIN {Category._meta.db_table} c ON c.id = a.category_id
+        WHERE a.user_id_id = %(user)s AND v.start_date IS NOT NULL AND (a.is_public OR NOT %(public_only)s)
+    ) visits
+    GROUP BY GROUPING SETS ((period), (period, category_id, name, display_name, icon))
+"""
+
+# New regions, countries and cities per period with running totals. A country is new in the
+# period its first region was marked. Rows without a date sort first so they count towards
+# the totals without belonging to a period.
+PLACES_SQL = f"""
+    SELECT kind, period, count(*), count(*) FILTER (WHERE first_in_country),
+           sum(count(*)) OVER w, sum(count(*) FILTER (WHERE first_in_country)) OVER w
+    FROM (
+        SELECT 'region' AS kind, date_trunc(%(period)s, vr.created_at) AS period,
+               row_number() OVER (PARTITION BY r.country_id ORDER BY vr.created_at NULLS FIRST, vr.id) = 1 AS first_in_country
+        FROM {VisitedRegion._meta.db_table} vr
+        JOIN {Region._meta.db_table} r ON r.id = vr.region_id
+        WHERE vr.user_id_id = %(user)s
+        UNION ALL
+        SELECT 'city', date_trunc(%(period)s, created_at), false
+        FROM {VisitedCity._meta.db_table} WHERE user_id_id = %(user)s
+    ) places
+    GROUP BY kind, period
+    WINDOW w AS (PARTITION BY kind ORDER BY period NULLS FIRST)
+"""
+
+# Nights in lodging by check-in and straight line distance of transportation by departure
+TRAVEL_SQL = f"""
+    SELECT 'lodging', date_trunc(%(period)s, check_in) AS period, count(*),
+           sum(GREATEST(check_out::date - check_in::date, 0))
+    FROM {Lodging._meta.db_table}
+    WHERE user_id_id = %(user)s AND check_in IS NOT NULL AND (is_public OR NOT %(public_only)s)
+    GROUP BY period
+    UNION ALL
+    SELECT 'transportation', date_trunc(%(period)s, date) AS period, count(*),
+           sum(ST_DistanceSphere(
+               ST_MakePoint(origin_longitude, origin_latitude),
+               ST_MakePoint(destination_longitude, destination_latitude)
+           )) / 1000
+    FROM {Transportation._meta.db_table}
+    WHERE user_id_id = %(user)s AND date IS NOT NULL AND (is_public OR NOT %(public_only)s)
+    GROUP BY period
+"""
+
+VERSION_SQL = f"""
+    SELECT count(*), max(changed_at) FROM (
+        SELECT v.updated_at AS changed_at FROM {Visit._meta.db_table} v
+            JOIN {Adventure._meta.db_table} a ON a.id = v.adventure_id WHERE a.user_id_id = %(user)s
+        UNION ALL SELECT updated_at FROM {Adventure._meta.db_table} WHERE user_id_id = %(user)s
+        UNION ALL SELECT updated_at FROM {Lodging._meta.db_table} WHERE user_id_id = %(user)s
+        UNION ALL SELECT updated_at FROM {Transportation._meta.db_table} WHERE user_id_id = %(user)s
+        UNION ALL SELECT created_at FROM {VisitedRegion._meta.db_table} WHERE user_id_id = %(user)s
+        UNION ALL SELECT created_at FROM {VisitedCity._meta.db_table} WHERE user_id_id = %(user)s
+    ) rows
+"""
+
+
+def timeline_version(user_id):
+    """
+    Changes whenever a row the timeline is computed from is added, removed or updated.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(VERSION_SQL, {'user': user_id})
+        count, last_changed = cursor.fetchone()
+    return hashlib.sha1(f'{user_id}:{count}:{last_changed}'.encode()).hexdigest()
+
+
+def _empty_entry(label):
+    return {
+        'period': label,
+        'adventures': 0,
+        'visits': 0,
+        'categories': [],
+        'new_regions': 0,
+        'new_countries': 0,
+        'new_cities': 0,
+        'total_regions': 0,
+        'total_countries': 0,
+        'total_cities': 0,
+        'lodging_stays': 0,
+        'lodging_nights': 0,
+        'transportations': 0,
+        'distance_km': 0.0,
+    }
+
+
+def compute_timeline(user_id, period='year', public_only=False):
+    """
+    Per-period breakdown of a user's travels, oldest period first. Everything is aggregated by
+    PostgreSQL in three statements, nothing is loaded row by row.
+    """
+    params = {
+        'period': period, 'user': user_id, 'public_only': public_only,
+        **{f'uncategorized_{field}': value for field, value in UNCATEGORIZED.items()},
+    }
+    entries = {}
+    # Running totals start from the places marked before their date was recorded
+    totals = {'total_regions': 0, 'total_countries': 0, 'total_cities': 0}
+
+    def entry(start):
+        if start not in entries:
+            entries[start] = _empty_entry(start.strftime(PERIODS[period]))
+        return entries[start]
+
+    with connection.cursor() as cursor:
+        cursor.execute(VISITS_SQL, params)
+        for start, total, name, display_name, icon, adventures, visits in cursor.fetchall():
+            if total:
+                entry(start).update(adventures=adventures, visits=visits)
+            else:
+                entry(start)['categories'].append({
+                    'name': name, 'display_name': display_name, 'icon': icon,
+                    'adventures': adventures, 'visits': visits,
+                })
+
+        cursor.execute(PLACES_SQL, params)
+        for kind, start, new, new_countries, total, total_countries in cursor.fetchall():
+            if start is None:
+                if kind == 'region':
+                    totals.update(total_regions=int(total), total_countries=int(total_countries))
+                else:
+                    totals['total_cities'] = int(total)
+                continue
+            current = entry(start)
+            if kind == 'region':
+                current.update(
+                    new_regions=new, new_countries=new_countries,
+                    total_regions=int(total), total_countries=int(total_countries),
+                )
+            else:
+                current.update(new_cities=new, total_cities=int(total))
+
+        cursor.execute(TRAVEL_SQL, params)
+        for kind, start, count, amount in cursor.fetchall():
+            if kind == 'lodging':
+                entry(start).update(lodging_stays=count, lodging_nights=int(amount or 0))
+            else:
+                entry(start).update(transportations=count, distance_km=round(float(amount or 0), 1))
+
+    timeline = [entries[start] for start in sorted(entries)]
+    # Periods without newly visited places carry the running totals of the period before
+    for current in timeline:
+        for field in totals:
+            totals[field] = current[field] = max(current[field], totals[field])
+        current['categories'].sort(key=lambda category: -category['visits'])
+    return timeline
+
+
+def get_timeline(user_id, period='year', public_only=False):
+    cache_key = f'stats-timeline:{user_id}:{period}:{int(public_only)}:{timeline_version(user_id)}'
+    timeline = cache.get(cache_key)
+    if timeline is None:
+        timeline = compute_timeline(user_id, period, public_only)
+        cache.set(cache_key, timeline, TIMELINE_CACHE_TIMEOUT)
+    return timeline
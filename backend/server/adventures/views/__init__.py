@@ -13,4 +13,7 @@ from .stats_view import *
 from .transportation_view import *
 from .global_search_view import *
 from .attachment_view import *
-from .lodging_view import *
\ No newline at end of file
+from .lodging_view import *
+from .track_view import *
+from .export_view import *
+from .import_view import *
@@ -2,14 +2,22 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import transaction
 from django.db.models import Q
 from adventures.models import Adventure, AdventureImage
 from adventures.serializers import AdventureImageSerializer
+from adventures.signals import delete_blob_if_unreferenced
+from adventures.utils.image_processing import process_image_by_id
+from adventures.utils.tasks import run_in_background
+from adventures.views.resumable_upload_mixin import ResumableUploadMixin
+from integrations.utils.immich import fetch_asset_preview, get_user_integration
+import requests
 import uuid
 
-class AdventureImageViewSet(viewsets.ModelViewSet):
+class AdventureImageViewSet(ResumableUploadMixin, viewsets.ModelViewSet):
     serializer_class = AdventureImageSerializer
     permission_classes = [IsAuthenticated]
+    upload_kind = 'image'
 
     @action(detail=True, methods=['post'])
     def image_delete(self, request, *args, **kwargs):
@@ -55,6 +63,25 @@ class AdventureImageViewSet(viewsets.ModelViewSet):
                     return Response({"error": "User does not have permission to access this adventure"}, status=status.HTTP_403_FORBIDDEN)
             else:
                 return Response({"error": "User does not own this adventure"}, status=status.HTTP_403_FORBIDDEN)
+
+        # Images linked from Immich are not uploaded, only a preview is copied from the user's Immich server
+        self.immich_preview = None
+        immich_id = request.data.get('immich_id')
+        if immich_id:
+            try:
+                immich_id = str(uuid.UUID(str(immich_id)))
+            except ValueError:
+                return Response({"error": "Invalid Immich asset ID"}, status=status.HTTP_400_BAD_REQUEST)
+        if immich_id and not request.data.get('image'):
+            integration = get_user_integration(request)
+            if integration is None:
+                return Response({"error": "You need to have an active Immich integration to link images"}, status=status.HTTP_403_FORBIDDEN)
+            try:
+                self.immich_preview = fetch_asset_preview(integration, immich_id)
+            except requests.exceptions.RequestException:
+                return Response({"error": "The Immich server is currently down or unreachable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            if self.immich_preview is None:
+                return Response({"error": "Immich asset not found"}, status=status.HTTP_404_NOT_FOUND)
         
         return super().create(request, *args, **kwargs)
     
@@ -121,4 +148,25 @@ class AdventureImageViewSet(viewsets.ModelViewSet):
         return AdventureImage.objects.filter(user_id=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user_id=self.request.user)
\ No newline at end of file
+        if getattr(self, 'immich_preview', None):
+            instance = serializer.save(user_id=self.request.user, image=self.immich_preview)
+        else:
+            instance = serializer.save(user_id=self.request.user)
+        # Resized renditions are generated after the response has been sent
+        run_in_background(process_image_by_id, instance.id)
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.image.name
+        if 'image' not in serializer.validated_data:
+            serializer.save()
+            return
+        # The renditions, size and placeholder of the previous file no longer apply
+        instance = serializer.save(
+            renditions={}, is_processed=False, width=None, height=None, placeholder=None, processing_started_at=None,
+        )
+        if previous and previous != instance.image.name:
+            transaction.on_commit(lambda: delete_blob_if_unreferenced(previous))
+        run_in_background(process_image_by_id, instance.id)
+
+    def get_upload_data(self, upload, file):
+        return {'adventure': upload.adventure_id, 'image': file}
@@ -10,6 +10,7 @@ from adventures.models import Adventure, Category, Transportation, Lodging
 from adventures.permissions import IsOwnerOrSharedWithFullAccess
 from adventures.serializers import AdventureSerializer, TransportationSerializer, LodgingSerializer
 from adventures.utils import pagination
+from adventures.utils.gpx import preview_tracks
 
 class AdventureViewSet(viewsets.ModelViewSet):
     serializer_class = AdventureSerializer
@@ -62,7 +63,7 @@ class AdventureViewSet(viewsets.ModelViewSet):
         if not user.is_authenticated:
             # Unauthenticated users can only access public adventures for retrieval
             if self.action == 'retrieve':
-                return Adventure.objects.retrieve_adventures(user, include_public=True).order_by('-updated_at')
+                return Adventure.objects.retrieve_adventures(user, include_public=True).prefetch_related(preview_tracks()).order_by('-updated_at')
             return Adventure.objects.none()
 
         # Authenticated users: Handle retrieval separately
@@ -72,7 +73,7 @@ class AdventureViewSet(viewsets.ModelViewSet):
             include_public=include_public,
             include_owned=True,
             include_shared=True
-        ).order_by('-updated_at')
+        ).prefetch_related(preview_tracks()).order_by('-updated_at')
 
     def perform_update(self, serializer):
         adventure = serializer.save()
@@ -96,7 +97,7 @@ class AdventureViewSet(viewsets.ModelViewSet):
         queryset = Adventure.objects.filter(
             category__in=Category.objects.filter(name__in=types, user_id=request.user),
             user_id=request.user.id
-        )
+        ).prefetch_related(preview_tracks())
 
         is_visited_param = request.query_params.get('is_visited')
         if is_visited_param is not None:
@@ -127,7 +128,7 @@ class AdventureViewSet(viewsets.ModelViewSet):
         queryset = Adventure.objects.filter(
             Q(is_public=True) | Q(user_id=request.user.id),
             collection=None if not include_collections else Q()
-        )
+        ).prefetch_related(preview_tracks())
 
         queryset = self.apply_sorting(queryset)
         serializer = self.get_serializer(queryset, many=True)
@@ -4,10 +4,14 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from adventures.models import Adventure, Attachment
 from adventures.serializers import AttachmentSerializer
+from adventures.utils.gpx import is_gpx, process_gpx_attachment
+from adventures.utils.tasks import run_in_background
+from adventures.views.resumable_upload_mixin import ResumableUploadMixin
 
-class AttachmentViewSet(viewsets.ModelViewSet):
+class AttachmentViewSet(ResumableUploadMixin, viewsets.ModelViewSet):
     serializer_class = AttachmentSerializer
     permission_classes = [IsAuthenticated]
+    upload_kind = 'attachment'
 
     def get_queryset(self):
         return Attachment.objects.filter(user_id=self.request.user)
@@ -37,4 +41,15 @@ class AttachmentViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
     
     def perform_create(self, serializer):
-        serializer.save(user_id=self.request.user)
\ No newline at end of file
+        instance = serializer.save(user_id=self.request.user)
+        if is_gpx(instance.file.name):
+            # Tracks are parsed after the response has been sent
+            run_in_background(process_gpx_attachment, instance.id)
+
+    def perform_update(self, serializer):
+        instance = serializer.save()
+        if is_gpx(instance.file.name):
+            run_in_background(process_gpx_attachment, instance.id)
+
+    def get_upload_data(self, upload, file):
+        return {'adventure': upload.adventure_id, 'name': upload.name, 'file': file}
@@ -9,6 +9,7 @@ from adventures.permissions import CollectionShared
 from adventures.serializers import CollectionSerializer
 from users.models import CustomUser as User
 from adventures.utils import pagination
+from adventures.utils.gpx import preview_tracks
 
 class CollectionViewSet(viewsets.ModelViewSet):
     serializer_class = CollectionSerializer
@@ -55,7 +56,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
         # make sure the user is authenticated
         if not request.user.is_authenticated:
             return Response({"error": "User is not authenticated"}, status=400)
-        queryset = Collection.objects.filter(user_id=request.user.id)
+        queryset = Collection.objects.filter(user_id=request.user.id).prefetch_related(preview_tracks('adventure_set__attachments__tracks'))
         queryset = self.apply_sorting(queryset)
         collections = self.paginate_and_respond(queryset, request)
         return collections
@@ -67,7 +68,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
        
         queryset = Collection.objects.filter(
             Q(user_id=request.user.id)
-        )
+        ).prefetch_related(preview_tracks('adventure_set__attachments__tracks'))
         
         queryset = self.apply_sorting(queryset)
         serializer = self.get_serializer(queryset, many=True)
@@ -81,7 +82,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
        
         queryset = Collection.objects.filter(
             Q(user_id=request.user.id) & Q(is_archived=True)
-        )
+        ).prefetch_related(preview_tracks('adventure_set__attachments__tracks'))
         
         queryset = self.apply_sorting(queryset)
         serializer = self.get_serializer(queryset, many=True)
@@ -198,11 +199,12 @@ class CollectionViewSet(viewsets.ModelViewSet):
             ).distinct()
         
         if self.action == 'retrieve':
+            tracks = preview_tracks('adventure_set__attachments__tracks')
             if not self.request.user.is_authenticated:
-                return Collection.objects.filter(is_public=True)
+                return Collection.objects.filter(is_public=True).prefetch_related(tracks)
             return Collection.objects.filter(
                 Q(is_public=True) | Q(user_id=self.request.user.id) | Q(shared_with=self.request.user)
-            ).distinct()
+            ).distinct().prefetch_related(tracks)
         
         # For list action, include collections owned by the user or shared with the user, that are not archived
         return Collection.objects.filter(
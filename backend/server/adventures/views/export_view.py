@@ -0,0 +1,52 @@
+import os
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from adventures.utils.export import build_account_export, export_filename, export_status
+from adventures.utils.tasks import run_in_background
+
+class ExportViewSet(viewsets.ViewSet):
+    """
+    ZIP exports of the current user's account (see adventures.utils.export). Archives can be
+    larger than a worker could stream before it times out, so they are built in the background
+    and sent by NGINX:
+
+    - POST /api/export/           starts building the archive
+    - GET  /api/export/           {status: null, 'building' or 'ready', size, created_at}
+    - GET  /api/export/download/  the archive once it is ready
+    """
+    permission_classes = [IsAuthenticated]
+
+    def list(self, request):
+        export, path = export_status(request.user)
+        data = {'status': export, 'size': None, 'created_at': None}
+        if path:
+            stat = os.stat(path)
+            data['size'] = stat.st_size
+            data['created_at'] = datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc)
+        return Response(data)
+
+    def create(self, request):
+        if export_status(request.user)[0] != 'building':
+            run_in_background(build_account_export, request.user)
+        return Response({'status': 'building'}, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['get'])
+    def download(self, request):
+        export, path = export_status(request.user)
+        if export != 'ready':
+            return Response({"error": "No export is ready, start one first"}, status=status.HTTP_404_NOT_FOUND)
+
+        filename = export_filename(request.user)
+        if settings.DEBUG:
+            return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='application/zip')
+        # In production, let Nginx send the archive
+        response = HttpResponse(content_type='application/zip')
+        response['X-Accel-Redirect'] = '/protectedExports/' + os.path.basename(path)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'no-store'
+        return response
@@ -1,67 +1,75 @@
-from django.http import HttpResponse
-from rest_framework import viewsets
+import os
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
-from icalendar import Calendar, Event, vText, vCalAddress
-from datetime import datetime, timedelta
-from adventures.models import Adventure
-from adventures.serializers import AdventureSerializer
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from adventures.utils.ics import calendar_version, iter_calendar, regenerate_subscription_token, subscription_token, user_for_token
+
+# Rendered calendars are cached per data version, so a new version simply misses the cache
+ICS_CACHE_TIMEOUT = 24 * 60 * 60
+
 
 class IcsCalendarGeneratorViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     @action(detail=False, methods=['get'])
     def generate(self, request):
-        adventures = Adventure.objects.filter(user_id=request.user)
-        serializer = AdventureSerializer(adventures, many=True)
-        user = request.user
-        name = f"{user.first_name} {user.last_name}"
-        print(serializer.data)
-        
-        cal = Calendar()
-        cal.add('prodid', '-//My Adventure Calendar//example.com//')
-        cal.add('version', '2.0')
+        response = self._calendar_response(request, request.user)
+        response['Content-Disposition'] = 'attachment; filename=adventures.ics'
+        return response
 
-        for adventure in serializer.data:
-            if adventure['visits']:
-                for visit in adventure['visits']:
-                    # Skip if start_date is missing
-                    if not visit.get('start_date'):
-                        continue
+    @action(detail=False, methods=['get'])
+    def subscription(self, request):
+        """
+        Returns the URL calendar apps can subscribe to without logging in.
+        """
+        return Response({'url': self._subscription_url(subscription_token(request.user))})
 
-                    # Parse start_date and handle end_date
-                    try:
-                        start_date = datetime.strptime(visit['start_date'], '%Y-%m-%d').date()
-                    except ValueError:
-                        continue  # Skip if the start_date is invalid
+    @action(detail=False, methods=['post'], url_path='subscription/regenerate')
+    def regenerate_subscription(self, request):
+        """
+        Replaces the subscription URL, e.g. after it leaked. Calendar apps using the old one stop updating.
+        """
+        return Response({'url': self._subscription_url(regenerate_subscription_token(request.user))})
 
-                    end_date = (
-                        datetime.strptime(visit['end_date'], '%Y-%m-%d').date() + timedelta(days=1)
-                        if visit.get('end_date') else start_date + timedelta(days=1)
-                    )
-                    
-                    # Create event
-                    event = Event()
-                    event.add('summary', adventure['name'])
-                    event.add('dtstart', start_date)
-                    event.add('dtend', end_date)
-                    event.add('dtstamp', datetime.now())
-                    event.add('transp', 'TRANSPARENT')
-                    event.add('class', 'PUBLIC')
-                    event.add('created', datetime.now())
-                    event.add('last-modified', datetime.now())
-                    event.add('description', adventure['description'])
-                    if adventure.get('location'):
-                        event.add('location', adventure['location'])
-                    if adventure.get('link'):
-                        event.add('url', adventure['link'])
-                    
-                    organizer = vCalAddress(f'MAILTO:{user.email}')
-                    organizer.params['cn'] = vText(name)
-                    event.add('organizer', organizer)
-                
-                    cal.add_component(event)
-        
-        response = HttpResponse(cal.to_ical(), content_type='text/calendar')
-        response['Content-Disposition'] = 'attachment; filename=adventures.ics'
-        return response
\ No newline at end of file
+    def _subscription_url(self, token):
+        public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
+        # remove any  ' from the url
+        public_url = public_url.replace("'", "")
+        return f"{public_url}/api/ics-calendar/feed/{token}/"
+
+    @action(detail=False, methods=['get'], url_path='feed/(?P<token>[^/]+)', permission_classes=[AllowAny], authentication_classes=[])
+    def feed(self, request, token=None):
+        user = user_for_token(token)
+        if user is None:
+            return Response({"error": "Invalid calendar token"}, status=status.HTTP_404_NOT_FOUND)
+        return self._calendar_response(request, user)
+
+    def _calendar_response(self, request, user):
+        version = calendar_version(user)
+        etag = f'"{version}"'
+        cache_control = 'private, no-cache'
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            response['Cache-Control'] = cache_control
+            return response
+
+        cache_key = f'ics:{user.pk}:{version}'
+        content = cache.get(cache_key)
+        if content is not None:
+            response = HttpResponse(content, content_type='text/calendar')
+        else:
+            response = StreamingHttpResponse(self._stream_and_cache(user, cache_key), content_type='text/calendar')
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        return response
+
+    def _stream_and_cache(self, user, cache_key):
+        chunks = []
+        for chunk in iter_calendar(user):
+            chunks.append(chunk)
+            yield chunk
+        cache.set(cache_key, b''.join(chunks), ICS_CACHE_TIMEOUT)
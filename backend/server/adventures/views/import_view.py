@@ -0,0 +1,34 @@
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from adventures.utils.importer import AdventureImporter, ImportFormatError
+from adventures.utils.location_history import LocationHistoryImporter
+
+class ImportViewSet(viewsets.ViewSet):
+    """
+    Imports an account export (.zip), a CSV file or a GeoJSON FeatureCollection into the
+    current user's account, or a Google Takeout / Polarsteps location history with
+    location-history/. Pass dry_run=true to only validate the file and get the report.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request):
+        return self._run_import(request, AdventureImporter)
+
+    @action(detail=False, methods=['post'], url_path='location-history')
+    def location_history(self, request):
+        return self._run_import(request, LocationHistoryImporter)
+
+    def _run_import(self, request, importer_class):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+
+        importer = importer_class(request.user, dry_run=dry_run)
+        try:
+            report = importer.run(upload, upload.name)
+        except ImportFormatError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report)
@@ -0,0 +1,236 @@
+import abc
+import fcntl
+import hashlib
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from adventures.models import Adventure, UploadSession
+
+UPLOAD_READ_SIZE = 1024 * 1024
+
+
+class AssembledUpload(File):
+    """
+    A finished upload on disk. Exposing the path lets the storage move the file into place
+    and lets image validation read it from disk instead of loading it into memory.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def upload_path(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, str(upload.id))
+
+
+def delete_upload(upload):
+    if os.path.exists(upload_path(upload)):
+        os.remove(upload_path(upload))
+    upload.delete()
+
+
+def delete_stale_uploads():
+    """
+    Deletes uploads that were not touched for UPLOAD_SESSION_TTL seconds, and temporary files
+    without an upload (e.g. left behind by a crash). Returns the number of uploads deleted.
+    Run periodically by the cleanup-uploads command.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+    deleted = 0
+    for upload in UploadSession.objects.filter(updated_at__lt=stale):
+        delete_upload(upload)
+        deleted += 1
+    if os.path.isdir(settings.UPLOAD_TEMP_DIR):
+        known = {str(upload_id) for upload_id in UploadSession.objects.values_list('id', flat=True)}
+        for entry in os.scandir(settings.UPLOAD_TEMP_DIR):
+            if entry.name not in known and entry.stat().st_mtime < time.time() - settings.UPLOAD_SESSION_TTL:
+                os.remove(entry.path)
+    return deleted
+
+
+class ResumableUploadMixin(abc.ABC):
+    """
+    Resumable uploads for viewsets that store a file, in the spirit of the tus protocol:
+
+    - POST   <prefix>/uploads/                 {adventure, filename, size, checksum?, name?} starts an upload
+    - HEAD   <prefix>/uploads/<id>/            returns the current offset in the Upload-Offset header
+    - PATCH  <prefix>/uploads/<id>/            appends the raw request body at the Upload-Offset header
+    - POST   <prefix>/uploads/<id>/complete/   verifies the checksum and creates the object
+    - DELETE <prefix>/uploads/<id>/            aborts the upload
+
+    Chunks are streamed straight from the request to the temporary file. A chunk that is cut
+    off is kept up to where it was received, the client asks for the offset and resumes from there.
+    """
+    upload_kind = None
+
+    @abc.abstractmethod
+    def get_upload_data(self, upload, file):
+        """
+        Serializer data used to create the object once the upload is complete.
+        """
+
+    def _get_upload(self, request, upload_id):
+        return UploadSession.objects.filter(id=upload_id, user_id=request.user, kind=self.upload_kind).first()
+
+    def _upload_response(self, upload, status_code=status.HTTP_200_OK, error=None):
+        data = {
+            'id': upload.id,
+            'offset': upload.offset,
+            'size': upload.size,
+            'max_chunk_size': settings.UPLOAD_CHUNK_MAX_BYTES,
+        }
+        if error:
+            data['error'] = error
+        response = Response(data, status=status_code)
+        response['Upload-Offset'] = str(upload.offset)
+        response['Upload-Length'] = str(upload.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='uploads')
+    def start_upload(self, request):
+        adventure_id = request.data.get('adventure')
+        try:
+            adventure = Adventure.objects.get(id=adventure_id)
+        except (Adventure.DoesNotExist, ValueError, TypeError):
+            return Response({"error": "Adventure not found"}, status=status.HTTP_404_NOT_FOUND)
+        if adventure.user_id != request.user:
+            if not adventure.collection or not adventure.collection.shared_with.filter(id=request.user.id).exists():
+                return Response({"error": "User does not have permission to access this adventure"}, status=status.HTTP_403_FORBIDDEN)
+
+        filename = os.path.basename(str(request.data.get('filename') or ''))
+        if not filename:
+            return Response({"error": "A filename is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = int(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "The upload size is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if size <= 0 or size > settings.UPLOAD_MAX_BYTES:
+            return Response({"error": f"Uploads must be between 1 byte and {settings.UPLOAD_MAX_BYTES} bytes"}, status=status.HTTP_400_BAD_REQUEST)
+        checksum = (request.data.get('checksum') or '').lower() or None
+        if checksum and len(checksum) != 64:
+            return Response({"error": "The checksum must be a SHA-256 hex digest"}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = UploadSession.objects.create(
+            user_id=request.user,
+            kind=self.upload_kind,
+            adventure=adventure,
+            filename=filename,
+            name=request.data.get('name'),
+            size=size,
+            checksum=checksum,
+        )
+        os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+        open(upload_path(upload), 'wb').close()
+        response = self._upload_response(upload, status.HTTP_201_CREATED)
+        response['Location'] = request.build_absolute_uri(f'{upload.id}/')
+        return response
+
+    @action(detail=False, methods=['get', 'patch', 'delete'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)')
+    def resume_upload(self, request, upload_id=None):
+        if request.method == 'GET':
+            upload = self._get_upload(request, upload_id)
+            if upload is None:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+            return self._upload_response(upload)
+
+        if request.method == 'DELETE':
+            upload = self._get_upload(request, upload_id)
+            if upload is None:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+            delete_upload(upload)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        try:
+            offset = int(request.headers.get('Upload-Offset'))
+        except (TypeError, ValueError):
+            return Response({"error": "The Upload-Offset header is required"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            length = int(request.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+        if length > settings.UPLOAD_CHUNK_MAX_BYTES:
+            return Response({"error": f"Chunks must not be larger than {settings.UPLOAD_CHUNK_MAX_BYTES} bytes"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        upload = self._get_upload(request, upload_id)
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            f = open(upload_path(upload), 'r+b')
+        except FileNotFoundError:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        with f:
+            # An exclusive lock on the file keeps two requests from appending to the same upload at
+            # once. No database transaction is held while the body streams in; the lock is
+            # released by the kernel if the worker dies.
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return self._upload_response(upload, status.HTTP_409_CONFLICT, "Another chunk of this upload is being written")
+            # Read again under the lock, the previous chunk may have finished meanwhile
+            try:
+                upload.refresh_from_db(fields=['offset'])
+            except UploadSession.DoesNotExist:
+                return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+            if offset != upload.offset:
+                return self._upload_response(upload, status.HTTP_409_CONFLICT, "Upload-Offset does not match the current offset")
+            if upload.offset + length > upload.size:
+                return Response({"error": "The chunk goes past the end of the upload"}, status=status.HTTP_400_BAD_REQUEST)
+
+            # Read the raw body in small pieces instead of letting a parser buffer it. Anything
+            # past the recorded offset is left over from an interrupted request and overwritten.
+            remaining = length
+            f.seek(upload.offset)
+            f.truncate()
+            try:
+                while remaining > 0:
+                    chunk = request.stream.read(min(UPLOAD_READ_SIZE, remaining))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            except OSError:
+                # The client went away, keep what was received
+                pass
+            f.flush()
+            upload.offset = f.tell()
+            # Only the offset is written, in a single UPDATE
+            UploadSession.objects.filter(id=upload.id).update(offset=upload.offset, updated_at=timezone.now())
+        return self._upload_response(upload)
+
+    @action(detail=False, methods=['post'], url_path=r'uploads/(?P<upload_id>[0-9a-f-]+)/complete')
+    def complete_upload(self, request, upload_id=None):
+        upload = self._get_upload(request, upload_id)
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        if upload.offset != upload.size:
+            return self._upload_response(upload, status.HTTP_409_CONFLICT, "The upload is not complete yet")
+
+        path = upload_path(upload)
+        checksum = upload.checksum or (request.data.get('checksum') or '').lower()
+        if checksum:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(UPLOAD_READ_SIZE), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != checksum:
+                # The data is corrupt, the client has to start over
+                delete_upload(upload)
+                return Response({"error": "Checksum mismatch, the upload has been discarded"}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        with open(path, 'rb') as f:
+            serializer = self.get_serializer(data=self.get_upload_data(upload, AssembledUpload(f, name=upload.filename)))
+            if not serializer.is_valid():
+                delete_upload(upload)
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            self.perform_create(serializer)
+
+        delete_upload(upload)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -1,10 +1,10 @@
-from rest_framework import viewsets
+from rest_framework import status, viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.shortcuts import get_object_or_404
-from worldtravel.models import City, Region, Country, VisitedCity, VisitedRegion
-from adventures.models import Adventure, Collection
+from adventures.utils.stats import get_travel_stats, get_world_totals
+from adventures.utils.timeline import PERIODS, get_timeline
 from users.serializers import CustomUserDetailsSerializer as PublicUserSerializer
 from django.contrib.auth import get_user_model
 
@@ -25,27 +25,34 @@ class StatsViewSet(viewsets.ViewSet):
         # remove the email address from the response
         user.email = None
 
-        # get the counts for the user
-        adventure_count = Adventure.objects.filter(
-            user_id=user.id).count()
-        trips_count = Collection.objects.filter(
-            user_id=user.id).count()
-        visited_city_count = VisitedCity.objects.filter(
-            user_id=user.id).count()
-        total_cities = City.objects.count()
-        visited_region_count = VisitedRegion.objects.filter(
-            user_id=user.id).count()
-        total_regions = Region.objects.count()
-        visited_country_count = VisitedRegion.objects.filter(
-            user_id=user.id).values('region__country').distinct().count()
-        total_countries = Country.objects.count()
+        # Counters are maintained by adventures.signals, world totals are cached per data version
+        stats = get_travel_stats(user.id)
         return Response({
-            'adventure_count': adventure_count,
-            'trips_count': trips_count,
-            'visited_city_count': visited_city_count,
-            'total_cities': total_cities,
-            'visited_region_count': visited_region_count,
-            'total_regions': total_regions,
-            'visited_country_count': visited_country_count,
-            'total_countries': total_countries
-        })
\ No newline at end of file
+            'adventure_count': stats.adventure_count,
+            'trips_count': stats.collection_count,
+            'visited_city_count': stats.visited_city_count,
+            'visited_region_count': stats.visited_region_count,
+            'visited_country_count': stats.visited_country_count,
+            **get_world_totals(),
+        })
+
+    @action(detail=False, methods=['get'], url_path='timeline/(?P<username>[\w.@+-]+)')
+    def timeline(self, request, username):
+        """
+        Per-year (or ?period=month) breakdown of visits, newly visited places, lodging nights
+        and distance travelled. Other users only see what they made public.
+        """
+        own_profile = request.user.username == username
+        if own_profile:
+            user = get_object_or_404(User, username=username)
+        else:
+            user = get_object_or_404(User, username=username, public_profile=True)
+
+        period = request.query_params.get('period', 'year')
+        if period not in PERIODS:
+            return Response({"error": f"Invalid period, use one of: {', '.join(PERIODS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'period': period,
+            'timeline': get_timeline(user.id, period, public_only=not own_profile),
+        })
@@ -0,0 +1,44 @@
+import uuid
+
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from django.db.models import Q
+from adventures.models import GpxTrack
+from adventures.serializers import GpxTrackSerializer, GPX_TRACK_RESOLUTIONS
+
+class GpxTrackViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Tracks parsed from GPX attachments. Adventure payloads only carry a simplified preview,
+    the geometry is served here at ?resolution=full (default), medium or low.
+    Filter by attachment with ?attachment=<id>.
+    """
+    serializer_class = GpxTrackSerializer
+
+    def get_resolution(self):
+        resolution = self.request.query_params.get('resolution', 'full')
+        return resolution if resolution in GPX_TRACK_RESOLUTIONS else 'full'
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['resolution'] = self.get_resolution()
+        return context
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_authenticated:
+            visible = Q(attachment__adventure__is_public=True) | Q(attachment__adventure__user_id=user) | Q(attachment__adventure__collection__shared_with=user)
+        else:
+            visible = Q(attachment__adventure__is_public=True)
+        queryset = GpxTrack.objects.filter(visible).distinct().order_by('start_time', 'id')
+
+        attachment_id = self.request.query_params.get('attachment')
+        if attachment_id:
+            try:
+                attachment_id = uuid.UUID(attachment_id)
+            except ValueError:
+                raise ValidationError({'attachment': 'Invalid attachment ID.'})
+            queryset = queryset.filter(attachment_id=attachment_id)
+
+        # Only load the geometry that is going to be returned
+        unused = [field for field in GPX_TRACK_RESOLUTIONS.values() if field != GPX_TRACK_RESOLUTIONS[self.get_resolution()]]
+        return queryset.defer(*unused)
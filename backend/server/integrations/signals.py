@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from integrations.models import ImmichIntegration
+from integrations.utils.immich import invalidate_user_integration
+
+
+@receiver([post_save, post_delete], sender=ImmichIntegration)
+def invalidate_integration_cache(sender, instance, **kwargs):
+    invalidate_user_integration(instance.user_id)
@@ -0,0 +1,95 @@
+import threading
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from requests.adapters import HTTPAdapter
+
+from integrations.models import ImmichIntegration
+
+# Integrations are looked up on every Immich request (including each thumbnail), so they are
+# cached per user. The default cache is per process, so the timeout is kept short to bound how
+# long other workers can keep using an integration that was changed or removed.
+INTEGRATION_CACHE_TIMEOUT = 60
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def integration_cache_key(user_id):
+    return f'immich_integration:{user_id}'
+
+
+def get_user_integration(request):
+    """
+    Returns the requesting user's Immich integration, or None if they don't have one.
+    The result is resolved once per request and cached per user between requests.
+    """
+    if hasattr(request, '_immich_integration'):
+        return request._immich_integration
+
+    integration = get_integration_for_user(request.user.id)
+    request._immich_integration = integration
+    return integration
+
+
+def get_integration_for_user(user_id):
+    key = integration_cache_key(user_id)
+    integration = cache.get(key)
+    if integration is None:
+        integration = ImmichIntegration.objects.filter(user_id=user_id).first()
+        # Only cache hits, so a newly created integration is picked up right away
+        if integration is not None:
+            cache.set(key, integration, INTEGRATION_CACHE_TIMEOUT)
+    return integration
+
+
+def invalidate_user_integration(user_id):
+    cache.delete(integration_cache_key(user_id))
+
+
+def get_session(server_url):
+    """
+    Returns a pooled HTTP session for an Immich server so that keep-alive connections
+    (and their TLS handshakes) are reused across requests and users of the same server.
+    The API key is not stored on the session and must be sent with each request. The session
+    accepts no cookies, otherwise a cookie set for one user's API key would be sent along with
+    the requests of every other user of the server.
+    """
+    with _sessions_lock:
+        session = _sessions.get(server_url)
+        if session is None:
+            session = requests.Session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[server_url] = session
+        return session
+
+
+def fetch_asset_preview(integration, asset_id):
+    """
+    Downloads the preview rendition of an Immich asset (a JPEG of at most 1440px) so it
+    can be stored locally in place of the full-resolution original. Returns None if
+    Immich does not return the asset.
+    """
+    immich_fetch = get_session(integration.server_url).get(
+        f'{integration.server_url}/assets/{asset_id}/thumbnail?size=preview',
+        headers={'x-api-key': integration.api_key},
+        timeout=30
+    )
+    if immich_fetch.status_code != 200:
+        return None
+    return ContentFile(immich_fetch.content, name=f'{asset_id}.jpg')
+
+
+def iter_upstream(upstream, chunk_size=64 * 1024):
+    """
+    Yields the body of a streamed Immich response and releases the connection afterwards.
+    """
+    try:
+        yield from upstream.iter_content(chunk_size)
+    finally:
+        upstream.close()
@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+
+from integrations.utils.immich import get_session
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# At most this many thumbnails of one result page are warmed in the background
+MAX_PREFETCH = 50
+
+# Magic bytes of the formats Immich produces for thumbnails and previews
+CONTENT_TYPE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG', 'image/png'),
+    (b'GIF8', 'image/gif'),
+]
+
+
+class ThumbnailCache:
+    """
+    Size-bounded on-disk cache for Immich thumbnails.
+
+    Entries are stored under a hash of (integration, server_url, asset id, size) and evicted
+    least-recently-used first once the cache grows past `max_bytes`. A cache hit
+    refreshes the file's mtime, which is what the eviction order is based on.
+
+    Entries are scoped to the integration that fetched them: a hit is served without asking
+    Immich, so sharing entries between users of one server would bypass Immich's permissions.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = str(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_size = None
+        self._inflight = set()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='immich-prefetch')
+
+    def key(self, integration, asset_id, size):
+        return hashlib.sha256(f'{integration.id}|{integration.server_url}|{asset_id}|{size}'.encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def relative_path(self, key):
+        return f'{key[:2]}/{key}'
+
+    def get(self, key):
+        """
+        Returns the path of a cached entry (and marks it as recently used) or None.
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def content_type(self, path):
+        with open(path, 'rb') as f:
+            head = f.read(12)
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'image/webp'
+        for signature, content_type in CONTENT_TYPE_SIGNATURES:
+            if head.startswith(signature):
+                return content_type
+        return 'application/octet-stream'
+
+    def stream_and_store(self, key, upstream):
+        """
+        Yields the upstream body chunk by chunk while writing it to the cache.
+        The entry only becomes visible once the body has been received completely.
+        """
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.tmp-', delete=False)
+        written = 0
+        complete = False
+        try:
+            for chunk in upstream.iter_content(CHUNK_SIZE):
+                tmp.write(chunk)
+                written += len(chunk)
+                yield chunk
+            complete = True
+        finally:
+            tmp.close()
+            upstream.close()
+            if complete:
+                os.replace(tmp.name, path)
+                self._account(written)
+            else:
+                os.unlink(tmp.name)
+
+    def prefetch(self, integration, asset_ids, size='preview'):
+        """
+        Warms the cache for the given assets in the background so the thumbnails
+        of a result page are already on disk when the browser asks for them. Only the
+        first MAX_PREFETCH assets are fetched, however large the page is.
+        """
+        for asset_id in asset_ids[:MAX_PREFETCH]:
+            key = self.key(integration, asset_id, size)
+            with self._lock:
+                if key in self._inflight or os.path.exists(self.path(key)):
+                    continue
+                self._inflight.add(key)
+            self._executor.submit(self._fetch, key, integration.server_url, integration.api_key, asset_id, size)
+
+    def _fetch(self, key, server_url, api_key, asset_id, size):
+        try:
+            upstream = get_session(server_url).get(
+                f'{server_url}/assets/{asset_id}/thumbnail?size={size}',
+                headers={'x-api-key': api_key},
+                stream=True,
+                timeout=10,
+            )
+            if upstream.status_code != 200:
+                upstream.close()
+                return
+            for _ in self.stream_and_store(key, upstream):
+                pass
+        except requests.exceptions.RequestException as e:
+            logger.debug('Prefetching Immich asset %s failed: %s', asset_id, e)
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+
+    def _entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.startswith('.tmp-'):
+                    yield entry
+
+    def _account(self, added):
+        with self._lock:
+            if self._approx_size is None:
+                self._approx_size = sum(entry.stat().st_size for entry in self._entries())
+            else:
+                self._approx_size += added
+            if self._approx_size <= self.max_bytes:
+                return
+            self._evict()
+
+    def _evict(self):
+        # Trim down to 90% of the limit so we don't rescan the cache on every write
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        total = sum(entry.stat().st_size for entry in entries)
+        target = self.max_bytes * 0.9
+        for entry in entries:
+            if total <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+                total -= size
+            except FileNotFoundError:
+                continue
+        self._approx_size = total
+
+
+thumbnail_cache = ThumbnailCache(settings.IMMICH_THUMBNAIL_CACHE_DIR, settings.IMMICH_THUMBNAIL_CACHE_MAX_BYTES)
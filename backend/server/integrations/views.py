@@ -1,13 +1,22 @@
 import os
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import viewsets, status
 
 from .serializers import ImmichIntegrationSerializer
 from .models import ImmichIntegration
+from adventures.models import AdventureImage
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAuthenticated
 import requests
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from integrations.utils.immich import get_integration_for_user, get_session, get_user_integration, iter_upstream
+from integrations.utils.thumbnail_cache import thumbnail_cache
 
 class IntegrationView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
@@ -15,11 +24,9 @@ class IntegrationView(viewsets.ViewSet):
         """
         RESTful GET method for listing all integrations.
         """
-        immich_integrations = ImmichIntegration.objects.filter(user=request.user)
-
         return Response(
             {
-                'immich': immich_integrations.exists()
+                'immich': get_user_integration(request) is not None
             },
             status=status.HTTP_200_OK
         )
@@ -30,9 +37,93 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 1000
 
+class UpstreamResultsSetPagination(StandardResultsSetPagination):
+    """
+    Pagination for results that are already paged by Immich (or sliced out of a cached
+    list), so only the requested window is ever materialized. Responses keep the same
+    shape as PageNumberPagination.
+    """
+    def get_requested_page(self, request):
+        try:
+            return max(int(request.query_params.get(self.page_query_param, 1)), 1)
+        except (TypeError, ValueError):
+            return 1
+
+    def get_window_response(self, request, results, count, has_next):
+        page_number = self.get_requested_page(request)
+        url = request.build_absolute_uri()
+        next_url = replace_query_param(url, self.page_query_param, page_number + 1) if has_next else None
+        if page_number == 1:
+            previous_url = None
+        elif page_number == 2:
+            previous_url = remove_query_param(url, self.page_query_param)
+        else:
+            previous_url = replace_query_param(url, self.page_query_param, page_number - 1)
+        return Response({
+            'count': count,
+            'next': next_url,
+            'previous': previous_url,
+            'results': results
+        })
+
+# Album asset lists are served from the cache for this many seconds before they are revalidated with Immich
+ALBUM_CACHE_TTL = 60
+ALBUM_CACHE_TIMEOUT = 60 * 60
+# Only these asset fields are kept for cached album listings
+ALBUM_ASSET_FIELDS = ['id', 'type', 'originalFileName', 'fileCreatedAt', 'localDateTime', 'isFavorite', 'thumbhash']
+
 class ImmichIntegrationView(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    pagination_class = UpstreamResultsSetPagination
+
+    def get_image_url(self, asset_id):
+        public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
+        public_url = public_url.replace("'", "")
+        return f'{public_url}/api/integrations/immich/get/{asset_id}'
+
+    def get_album_assets(self, integration, albumid):
+        """
+        Returns the asset list of an album, cached per album for ALBUM_CACHE_TTL seconds.
+        Once stale, the list is revalidated with the ETag of the last Immich response so an
+        unchanged album is not downloaded again. Returns None if the album has no assets.
+        """
+        cache_key = f'immich_album_assets:{integration.id}:{albumid}'
+        cached = cache.get(cache_key)
+        if cached and time.time() - cached['fetched_at'] < ALBUM_CACHE_TTL:
+            return cached['assets']
+
+        headers = {'x-api-key': integration.api_key}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        immich_fetch = get_session(integration.server_url).get(f'{integration.server_url}/albums/{albumid}', headers=headers, timeout=30)
+
+        if immich_fetch.status_code == 304 and cached:
+            cached['fetched_at'] = time.time()
+            cache.set(cache_key, cached, ALBUM_CACHE_TIMEOUT)
+            return cached['assets']
+
+        # Raises ValueError when the response is not JSON, handled by the caller
+        res = immich_fetch.json()
+        if not isinstance(res, dict) or 'assets' not in res:
+            return None
+        assets = [{field: asset.get(field) for field in ALBUM_ASSET_FIELDS} for asset in res['assets']]
+        cache.set(cache_key, {
+            'etag': immich_fetch.headers.get('ETag'),
+            'fetched_at': time.time(),
+            'assets': assets
+        }, ALBUM_CACHE_TIMEOUT)
+        return assets
+
+    def invalid_response(self):
+        return Response(
+            {
+                'message': 'The Immich server returned an invalid response.',
+                'error': True,
+                'code': 'immich.invalid_response'
+            },
+            status=status.HTTP_502_BAD_GATEWAY
+        )
+
     def check_integration(self, request):
         """
         Checks if the user has an active Immich integration.
@@ -40,8 +131,8 @@ class ImmichIntegrationView(viewsets.ViewSet):
             - None if the integration exists.
             - A Response with an error message if the integration is missing.
         """
-        user_integrations = ImmichIntegration.objects.filter(user=request.user)
-        if not user_integrations.exists():
+        integration = get_user_integration(request)
+        if integration is None:
             return Response(
                 {
                     'message': 'You need to have an active Immich integration to use this feature.',
@@ -50,7 +141,7 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 },
                 status=status.HTTP_403_FORBIDDEN
             )
-        return ImmichIntegration.objects.first()
+        return integration
 
     @action(detail=False, methods=['get'], url_path='search')
     def search(self, request):
@@ -75,7 +166,15 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        arguments = {}
+        paginator = self.pagination_class()
+        page_number = paginator.get_requested_page(request)
+        page_size = paginator.get_page_size(request)
+
+        # Let Immich do the paging so only the requested page is transferred
+        arguments = {
+            'page': page_number,
+            'size': page_size
+        }
         if query:
             arguments['query'] = query
         if date:
@@ -84,13 +183,17 @@ class ImmichIntegrationView(viewsets.ViewSet):
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
             url = f'{integration.server_url}/search/{"smart" if query else "metadata"}'
-            immich_fetch = requests.post(url, headers={
+            immich_fetch = get_session(integration.server_url).post(url, headers={
                 'x-api-key': integration.api_key
             },
-            json = arguments
+            json = arguments,
+            timeout=30
             )
             res = immich_fetch.json()
-        except requests.exceptions.ConnectionError:
+        except ValueError:
+            # Not JSON, e.g. an error page of a proxy in front of Immich
+            return self.invalid_response()
+        except requests.exceptions.RequestException:
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -100,15 +203,19 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
         
-        if 'assets' in res and 'items' in res['assets']:
-            paginator = self.pagination_class()
+        if isinstance(res, dict) and isinstance(res.get('assets'), dict) and 'items' in res['assets']:
+            result_page = res['assets']['items']
             # for each item in the items, we need to add the image url to the item so we can display it in the frontend
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
-            for item in res['assets']['items']:
-                item['image_url'] = f'{public_url}/api/integrations/immich/get/{item["id"]}'
-            result_page = paginator.paginate_queryset(res['assets']['items'], request)
-            return paginator.get_paginated_response(result_page)
+            for item in result_page:
+                item['image_url'] = self.get_image_url(item['id'])
+            thumbnail_cache.prefetch(integration, [item['id'] for item in result_page])
+            return paginator.get_window_response(
+                request,
+                result_page,
+                # Immich's total is the size of this page, the number of matches is not known
+                count=None,
+                has_next=bool(res['assets'].get('nextPage'))
+            )
         else:
             return Response(
                 {
@@ -139,15 +246,110 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        # Thumbnails never change for a given asset, so the cache key doubles as the ETag. The key
+        # includes the integration, so a hit only ever serves what this user's API key fetched.
+        key = thumbnail_cache.key(integration, imageid, 'preview')
+        etag = f'"{key}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        elif cached_path := thumbnail_cache.get(key):
+            content_type = thumbnail_cache.content_type(cached_path)
+            if settings.DEBUG:
+                response = FileResponse(open(cached_path, 'rb'), content_type=content_type)
+            else:
+                # In production, let Nginx send the cached file
+                response = HttpResponse(content_type=content_type)
+                response['X-Accel-Redirect'] = '/protectedImmichCache/' + thumbnail_cache.relative_path(key)
+        else:
+            # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
+            try:
+                immich_fetch = get_session(integration.server_url).get(f'{integration.server_url}/assets/{imageid}/thumbnail?size=preview', headers={
+                    'x-api-key': integration.api_key
+                }, stream=True, timeout=10)
+            except requests.exceptions.RequestException:
+                return Response(
+                    {
+                        'message': 'The Immich server is currently down or unreachable.',
+                        'error': True,
+                        'code': 'immich.server_down'
+                    },
+                    status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+
+            if immich_fetch.status_code != 200:
+                immich_fetch.close()
+                return Response(
+                    {
+                        'message': 'The image could not be fetched from Immich.',
+                        'error': True,
+                        'code': 'immich.image_fetch_error'
+                    },
+                    status=status.HTTP_502_BAD_GATEWAY
+                )
+
+            # Stream the image to the client while it is written to the cache
+            response = StreamingHttpResponse(
+                thumbnail_cache.stream_and_store(key, immich_fetch),
+                content_type=immich_fetch.headers.get('Content-Type', 'image/jpeg')
+            )
+
+        response['Cache-Control'] = 'private, max-age=86400'
+        response['ETag'] = etag
+        return response
+        
+    @action(detail=False, methods=['get'], url_path='original/(?P<imageid>[^/.]+)', permission_classes=[AllowAny])
+    def original(self, request, imageid=None):
+        """
+        Streams the full-resolution original of an adventure image linked from Immich.
+        The image owner's integration is used, so anyone who can see the adventure can view it.
+        """
+        try:
+            image = AdventureImage.objects.select_related('adventure__collection').filter(
+                id=uuid.UUID(imageid), immich_id__isnull=False
+            ).first()
+        except ValueError:
+            image = None
+
+        # Rows written before asset ids were validated are never interpolated into a URL
+        try:
+            immich_id = str(uuid.UUID(image.immich_id)) if image else None
+        except ValueError:
+            image = None
+
+        adventure = image.adventure if image else None
+        has_access = adventure is not None and (
+            adventure.is_public or
+            adventure.user_id_id == request.user.id or
+            (adventure.collection is not None and request.user.is_authenticated and
+             adventure.collection.shared_with.filter(id=request.user.id).exists())
+        )
+        if not has_access:
+            return Response(
+                {
+                    'message': 'Image not found.',
+                    'error': True,
+                    'code': 'immich.image_not_found'
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        integration = get_integration_for_user(image.user_id_id)
+        if integration is None:
+            return Response(
+                {
+                    'message': 'The owner of this image no longer has an active Immich integration.',
+                    'error': True,
+                    'code': 'immich.integration_missing'
+                },
+                status=status.HTTP_404_NOT_FOUND
+            )
+
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/assets/{imageid}/thumbnail?size=preview', headers={
+            immich_fetch = get_session(integration.server_url).get(f'{integration.server_url}/assets/{immich_id}/original', headers={
                 'x-api-key': integration.api_key
-            })
-            # should return the image file
-            from django.http import HttpResponse
-            return HttpResponse(immich_fetch.content, content_type='image/jpeg', status=status.HTTP_200_OK)
-        except requests.exceptions.ConnectionError:
+            }, stream=True, timeout=30)
+        except requests.exceptions.RequestException:
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -156,7 +358,27 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 },
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
-        
+
+        if immich_fetch.status_code != 200:
+            immich_fetch.close()
+            return Response(
+                {
+                    'message': 'The image could not be fetched from Immich.',
+                    'error': True,
+                    'code': 'immich.image_fetch_error'
+                },
+                status=status.HTTP_502_BAD_GATEWAY
+            )
+
+        response = StreamingHttpResponse(
+            iter_upstream(immich_fetch),
+            content_type=immich_fetch.headers.get('Content-Type', 'application/octet-stream')
+        )
+        if 'Content-Length' in immich_fetch.headers:
+            response['Content-Length'] = immich_fetch.headers['Content-Length']
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
     @action(detail=False, methods=['get'])
     def albums(self, request):
         """
@@ -169,11 +391,14 @@ class ImmichIntegrationView(viewsets.ViewSet):
 
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/albums', headers={
+            immich_fetch = get_session(integration.server_url).get(f'{integration.server_url}/albums', headers={
                 'x-api-key': integration.api_key
-            })
+            }, timeout=30)
             res = immich_fetch.json()
-        except requests.exceptions.ConnectionError:
+        except ValueError:
+            # Not JSON, e.g. an error page of a proxy in front of Immich
+            return self.invalid_response()
+        except requests.exceptions.RequestException:
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -210,11 +435,11 @@ class ImmichIntegrationView(viewsets.ViewSet):
         
         # check so if the server is down, it does not tweak out like a madman and crash the server with a 500 error code
         try:
-            immich_fetch = requests.get(f'{integration.server_url}/albums/{albumid}', headers={
-                'x-api-key': integration.api_key
-            })
-            res = immich_fetch.json()
-        except requests.exceptions.ConnectionError:
+            assets = self.get_album_assets(integration, albumid)
+        except ValueError:
+            # Not JSON, e.g. an error page of a proxy in front of Immich
+            return self.invalid_response()
+        except requests.exceptions.RequestException:
             return Response(
                 {
                     'message': 'The Immich server is currently down or unreachable.',
@@ -224,15 +449,20 @@ class ImmichIntegrationView(viewsets.ViewSet):
                 status=status.HTTP_503_SERVICE_UNAVAILABLE
             )
         
-        if 'assets' in res:
+        if assets is not None:
             paginator = self.pagination_class()
-            # for each item in the items, we need to add the image url to the item so we can display it in the frontend
-            public_url = os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/')
-            public_url = public_url.replace("'", "")
-            for item in res['assets']:
-                item['image_url'] = f'{public_url}/api/integrations/immich/get/{item["id"]}'
-            result_page = paginator.paginate_queryset(res['assets'], request)
-            return paginator.get_paginated_response(result_page)
+            page_number = paginator.get_requested_page(request)
+            page_size = paginator.get_page_size(request)
+            start = (page_number - 1) * page_size
+            # Only copy and decorate the requested window of the (cached) asset list
+            result_page = [dict(item, image_url=self.get_image_url(item['id'])) for item in assets[start:start + page_size]]
+            thumbnail_cache.prefetch(integration, [item['id'] for item in result_page])
+            return paginator.get_window_response(
+                request,
+                result_page,
+                count=len(assets),
+                has_next=start + page_size < len(assets)
+            )
         else:
             return Response(
                 {
@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/1.7/ref/settings/
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import os
+import hashlib
 from dotenv import load_dotenv
 from os import getenv
 from pathlib import Path
@@ -61,7 +62,8 @@ INSTALLED_APPS = (
     'users',
     'integrations',
     'django.contrib.gis',
-    # 'achievements', # Not done yet, will be added later in a future update
+    'django.contrib.postgres',
+    'achievements',
     # 'widget_tweaks',
     # 'slippers',
 
@@ -172,6 +174,33 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'  # This path must match the NGINX root
 STATICFILES_DIRS = [BASE_DIR / 'static']
 
+# Protected media URLs are signed so NGINX can serve them without a round trip through Django.
+# NGINX gets the same secret from entrypoint.sh.
+MEDIA_SIGNING_SECRET = hashlib.sha256(f"media-signing:{getenv('MEDIA_SIGNING_SECRET', SECRET_KEY or '')}".encode()).hexdigest()
+MEDIA_URL_TTL = int(getenv('MEDIA_URL_TTL', 7 * 24 * 60 * 60))
+MEDIA_URL_TTL_BUCKET = 24 * 60 * 60
+
+# On-disk cache for thumbnails proxied from Immich, served by NGINX via X-Accel-Redirect in production
+IMMICH_THUMBNAIL_CACHE_DIR = BASE_DIR / 'cache' / 'immich'
+IMMICH_THUMBNAIL_CACHE_MAX_BYTES = int(getenv('IMMICH_THUMBNAIL_CACHE_MAX_MB', '512')) * 1024 * 1024
+
+# Memory-mapped autocomplete index over countries, regions and cities (worldtravel.utils.prefix_index),
+# rebuilt by download-countries. Shared by all workers on a host.
+PREFIX_INDEX_DIR = BASE_DIR / 'cache' / 'prefix-index'
+
+# Resumable uploads (adventures.views.resumable_upload_mixin) are assembled here before being stored.
+# Keep it on the same filesystem as MEDIA_ROOT so finished uploads are moved rather than copied.
+UPLOAD_TEMP_DIR = BASE_DIR / 'uploads'
+UPLOAD_MAX_BYTES = int(getenv('UPLOAD_MAX_MB', '2048')) * 1024 * 1024
+# Must stay below NGINX's client_max_body_size
+UPLOAD_CHUNK_MAX_BYTES = 50 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60
+
+# Account exports (adventures.utils.export) are built here in the background and served by NGINX
+# via X-Accel-Redirect, they are deleted by cleanup-exports EXPORT_TTL seconds after being built
+EXPORT_DIR = BASE_DIR / 'cache' / 'exports'
+EXPORT_TTL = 24 * 60 * 60
+
 STORAGES = {
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -1,3 +1,4 @@
+from django.db.models import Func, TextField
 from rest_framework import serializers
 
 def get_user_uuid(user):
@@ -7,4 +8,15 @@ class CustomModelSerializer(serializers.ModelSerializer):
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         representation['user_id'] = get_user_uuid(instance.user_id)
-        return representation
\ No newline at end of file
+        return representation
+
+class SearchName(Func):
+    """
+    Lowercased, unaccented text of one or more columns joined by spaces. The trigram indexes on
+    names are built on this expression, so queries have to use it unchanged to hit them.
+    immutable_unaccent is created by adventures migration 0033.
+    """
+    function = 'immutable_unaccent'
+    template = "%(function)s(lower(%(expressions)s))"
+    arg_joiner = " || ' ' || "
+    output_field = TextField()
@@ -5,6 +5,7 @@ from django.conf import settings
 from django.http import HttpResponse, HttpResponseForbidden
 from django.views.static import serve
 from adventures.utils.file_permissions import checkFilePermission
+from adventures.utils.signed_media import check_media_signature
 
 def get_csrf_token(request):
     csrf_token = get_token(request)
@@ -17,10 +18,12 @@ protected_paths = ['images/', 'attachments/']
 
 def serve_protected_media(request, path):
     if any([path.startswith(protected_path) for protected_path in protected_paths]):
-        image_id = path.split('/')[1]
+        image_id = path.split('/', 1)[1]
         user = request.user
         media_type =  path.split('/')[0] + '/'
-        if checkFilePermission(image_id, user, media_type):
+        # A valid signed URL was issued to someone allowed to see the file, so skip the permission lookup
+        signed = check_media_signature(path, request.GET.get('exp'), request.GET.get('sig'))
+        if signed or checkFilePermission(image_id, user, media_type):
             if settings.DEBUG:
                 # In debug mode, serve the file directly
                 return serve(request, path, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:24
+
+import django.contrib.postgres.indexes
+import main.utils
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0004_customuser_disable_password'),
+        # pg_trgm and immutable_unaccent
+        ('adventures', '0033_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(main.utils.SearchName('username', 'first_name', 'last_name'), name='gin_trgm_ops'), name='user_name_trgm'),
+        ),
+    ]
@@ -1,7 +1,9 @@
 import uuid
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
 from django_resized import ResizedImageField
+from main.utils import SearchName
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)  # Override the email field with unique constraint
@@ -9,6 +11,11 @@ class CustomUser(AbstractUser):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     public_profile = models.BooleanField(default=False)
     disable_password = models.BooleanField(default=False)
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            GinIndex(OpClass(SearchName('username', 'first_name', 'last_name'), name='gin_trgm_ops'), name='user_name_trgm'),
+        ]
     
     def __str__(self):
         return self.username
\ No newline at end of file
@@ -1,39 +1,109 @@
+import hashlib
+import io
 import os
 from django.core.management.base import BaseCommand
 import requests
-from worldtravel.models import Country, Region, City
-from django.db import transaction
+from worldtravel.models import Country, Region, City, WorldDataImport
+from django.db import connection, transaction
+from django.db.models.expressions import RawSQL
 from tqdm import tqdm
 import ijson
 
 from django.conf import settings
+from worldtravel.utils.flags import build_flag_sprite, download_flags, get_flag_sprite
+from worldtravel.utils.prefix_index import build_prefix_index
 
 COUNTRY_REGION_JSON_VERSION = settings.COUNTRY_REGION_JSON_VERSION
         
 media_root = settings.MEDIA_ROOT
 
-def saveCountryFlag(country_code):
-    # For standards, use the lowercase country_code
-    country_code = country_code.lower()
-    flags_dir = os.path.join(media_root, 'flags')
-
-    # Check if the flags directory exists, if not, create it
-    if not os.path.exists(flags_dir):
-        os.makedirs(flags_dir)
-
-    # Check if the flag already exists in the media folder
-    flag_path = os.path.join(flags_dir, f'{country_code}.png')
-    if os.path.exists(flag_path):
-        print(f'Flag for {country_code} already exists')
-        return
-
-    res = requests.get(f'https://flagcdn.com/h240/{country_code}.png'.lower())
-    if res.status_code == 200:
-        with open(flag_path, 'wb') as f:
-            f.write(res.content)
-        print(f'Flag for {country_code} downloaded')
-    else:
-        print(f'Error downloading flag for {country_code}')
+DATA_URL = 'https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/{version}/json/countries%2Bstates%2Bcities.json'
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+COPY_BATCH_SIZE = 5000
+
+# Rows are COPYed into temporary tables first and merged set-based at the end. seq keeps the
+# file order so the first of duplicate ids wins, as it always did.
+STAGING_TABLES = {
+    'staging_country': ['country_code', 'name', 'subregion', 'capital', 'longitude', 'latitude'],
+    'staging_region': ['id', 'name', 'country_code', 'longitude', 'latitude'],
+    'staging_city': ['id', 'name', 'region_id', 'longitude', 'latitude'],
+}
+STAGING_SQL = """
+CREATE TEMPORARY TABLE staging_country (
+    seq bigserial, country_code varchar(2), name varchar(100), subregion varchar(100), capital varchar(100),
+    longitude numeric(9, 6), latitude numeric(9, 6)
+) ON COMMIT DROP;
+CREATE TEMPORARY TABLE staging_region (
+    seq bigserial, id varchar, name varchar(100), country_code varchar(2), longitude numeric(9, 6), latitude numeric(9, 6)
+) ON COMMIT DROP;
+CREATE TEMPORARY TABLE staging_city (
+    seq bigserial, id varchar, name varchar(100), region_id varchar, longitude numeric(9, 6), latitude numeric(9, 6)
+) ON COMMIT DROP;
+"""
+STAGING_INDEX_SQL = """
+CREATE INDEX ON staging_country (country_code);
+CREATE INDEX ON staging_region (id);
+CREATE INDEX ON staging_city (id);
+ANALYZE staging_country;
+ANALYZE staging_region;
+ANALYZE staging_city;
+"""
+
+# Each merge returns how many rows were inserted and how many updated. Rows whose values did not
+# change are left alone (IS DISTINCT FROM), so a new version only rewrites what changed in it.
+MERGE_SQL = {
+    'countries': f"""
+        WITH merged AS (
+            INSERT INTO {Country._meta.db_table} AS t (country_code, name, subregion, capital, longitude, latitude)
+            SELECT DISTINCT ON (country_code) country_code, name, subregion, capital, longitude, latitude
+            FROM staging_country ORDER BY country_code, seq
+            ON CONFLICT (country_code) DO UPDATE SET
+                name = EXCLUDED.name, subregion = EXCLUDED.subregion, capital = EXCLUDED.capital,
+                longitude = EXCLUDED.longitude, latitude = EXCLUDED.latitude
+            WHERE (t.name, t.subregion, t.capital, t.longitude, t.latitude)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.subregion, EXCLUDED.capital, EXCLUDED.longitude, EXCLUDED.latitude)
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+    """,
+    'regions': f"""
+        WITH merged AS (
+            INSERT INTO {Region._meta.db_table} AS t (id, name, country_id, longitude, latitude)
+            SELECT DISTINCT ON (s.id) s.id, s.name, c.id, s.longitude, s.latitude
+            FROM staging_region s JOIN {Country._meta.db_table} c ON c.country_code = s.country_code
+            ORDER BY s.id, s.seq
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name, country_id = EXCLUDED.country_id,
+                longitude = EXCLUDED.longitude, latitude = EXCLUDED.latitude
+            WHERE (t.name, t.country_id, t.longitude, t.latitude)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.country_id, EXCLUDED.longitude, EXCLUDED.latitude)
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+    """,
+    'cities': f"""
+        WITH merged AS (
+            INSERT INTO {City._meta.db_table} AS t (id, name, region_id, longitude, latitude)
+            SELECT DISTINCT ON (s.id) s.id, s.name, s.region_id, s.longitude, s.latitude
+            FROM staging_city s JOIN {Region._meta.db_table} r ON r.id = s.region_id
+            ORDER BY s.id, s.seq
+            ON CONFLICT (id) DO UPDATE SET
+                name = EXCLUDED.name, region_id = EXCLUDED.region_id,
+                longitude = EXCLUDED.longitude, latitude = EXCLUDED.latitude
+            WHERE (t.name, t.region_id, t.longitude, t.latitude)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.region_id, EXCLUDED.longitude, EXCLUDED.latitude)
+            RETURNING xmax = 0 AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM merged
+    """,
+}
+
+# Rows that are no longer in the data, found with an anti-join against the staging tables
+REMOVED_SQL = {
+    City: f'SELECT id FROM {City._meta.db_table} t WHERE NOT EXISTS (SELECT 1 FROM staging_city s WHERE s.id = t.id)',
+    Region: f'SELECT id FROM {Region._meta.db_table} t WHERE NOT EXISTS (SELECT 1 FROM staging_region s WHERE s.id = t.id)',
+    Country: f'SELECT id FROM {Country._meta.db_table} t WHERE NOT EXISTS (SELECT 1 FROM staging_country s WHERE s.country_code = t.country_code)',
+}
 
 class Command(BaseCommand):
     help = 'Imports the world travel data'
@@ -43,187 +113,168 @@ class Command(BaseCommand):
 
     def handle(self, **options):
         force = options['force']
-        batch_size = 100
         countries_json_path = os.path.join(settings.MEDIA_ROOT, f'countries+regions+states-{COUNTRY_REGION_JSON_VERSION}.json')
-        if not os.path.exists(countries_json_path) or force:
-            res = requests.get(f'https://raw.githubusercontent.com/dr5hn/countries-states-cities-database/{COUNTRY_REGION_JSON_VERSION}/json/countries%2Bstates%2Bcities.json')
-            if res.status_code == 200:
-                with open(countries_json_path, 'w') as f:
-                    f.write(res.text)
-                    self.stdout.write(self.style.SUCCESS('countries+regions+states.json downloaded successfully'))
-            else:
-                self.stdout.write(self.style.ERROR('Error downloading countries+regions+states.json'))
-                return
-        elif not os.path.isfile(countries_json_path):
+
+        # Fast path for container restarts: one query, the file and the tables are not touched
+        latest = WorldDataImport.objects.order_by('-imported_at').first()
+        if not force and latest and latest.version == COUNTRY_REGION_JSON_VERSION:
+            # Only done when the media or cache volume is new, e.g. after it was recreated
+            self.ensure_flags()
+            build_prefix_index()
+            self.stdout.write(self.style.SUCCESS('Latest country, region, and state data already imported.'))
+            return
+
+        if os.path.exists(countries_json_path) and not os.path.isfile(countries_json_path):
             self.stdout.write(self.style.ERROR('countries+regions+states.json is not a file'))
             return
-        elif os.path.getsize(countries_json_path) == 0:
-            self.stdout.write(self.style.ERROR('countries+regions+states.json is empty'))
-        elif Country.objects.count() == 0 or Region.objects.count() == 0 or City.objects.count() == 0:
-            self.stdout.write(self.style.WARNING('Some region data is missing. Re-importing all data.'))
+        if force or not os.path.exists(countries_json_path) or os.path.getsize(countries_json_path) == 0:
+            sha256 = self.download(countries_json_path)
+            if sha256 is None:
+                self.stdout.write(self.style.ERROR('Error downloading countries+regions+states.json'))
+                return
+            self.stdout.write(self.style.SUCCESS('countries+regions+states.json downloaded successfully'))
         else:
-            self.stdout.write(self.style.SUCCESS('Latest country, region, and state data already downloaded.'))
+            sha256 = _file_sha256(countries_json_path)
+
+        if not force and latest and latest.sha256 == sha256:
+            # The version changed but the data did not
+            WorldDataImport.objects.create(version=COUNTRY_REGION_JSON_VERSION, sha256=sha256)
+            self.ensure_flags()
+            build_prefix_index()
+            self.stdout.write(self.style.SUCCESS('Country, region, and state data is unchanged.'))
             return
-            
-        with open(countries_json_path, 'r') as f:
-            f = open(countries_json_path, 'rb')
-            parser = ijson.items(f, 'item')
 
+        counts = {'created': 0, 'updated': 0, 'deleted': 0}
         with transaction.atomic():
-            existing_countries = {country.country_code: country for country in Country.objects.all()}
-            existing_regions = {region.id: region for region in Region.objects.all()}
-            existing_cities = {city.id: city for city in City.objects.all()}
-
-            countries_to_create = []
-            regions_to_create = []
-            countries_to_update = []
-            regions_to_update = []
-            cities_to_create = []
-            cities_to_update = []
-
-            processed_country_codes = set()
-            processed_region_ids = set()
-            processed_city_ids = set()
-
-            for country in parser:
+            with connection.cursor() as cursor:
+                cursor.execute(STAGING_SQL)
+                country_codes = self.stage(cursor, countries_json_path)
+                cursor.execute(STAGING_INDEX_SQL)
+                for name, sql in MERGE_SQL.items():
+                    cursor.execute(sql)
+                    created, updated = cursor.fetchone()
+                    counts['created'] += created
+                    counts['updated'] += updated
+                    self.stdout.write(f'{name}: {created} created, {updated} updated')
+            # Deleted through the ORM so visits of removed places are deleted (and counted) too
+            for model, sql in REMOVED_SQL.items():
+                deleted, _ = model.objects.filter(pk__in=RawSQL(sql, [])).delete()
+                counts['deleted'] += deleted
+                if deleted:
+                    self.stdout.write(f'{model._meta.verbose_name_plural}: {deleted} rows removed')
+            WorldDataImport.objects.create(version=COUNTRY_REGION_JSON_VERSION, sha256=sha256, **counts)
+
+        self.update_flags(country_codes)
+        build_prefix_index(force=any(counts.values()))
+        self.stdout.write(self.style.SUCCESS('All data imported successfully'))
+
+    def update_flags(self, country_codes):
+        flags = download_flags(country_codes)
+        self.stdout.write(
+            f"Flags: {len(flags['downloaded'])} downloaded, {len(flags['unchanged'])} unchanged, {len(flags['failed'])} failed"
+        )
+        for country_code in flags['failed']:
+            self.stdout.write(self.style.WARNING(f'Error downloading flag for {country_code}'))
+        if flags['downloaded'] or get_flag_sprite() is None:
+            build_flag_sprite()
+
+    def ensure_flags(self):
+        # When the import is skipped the flags are only fetched if the sprite is missing
+        if get_flag_sprite() is None:
+            self.update_flags(list(Country.objects.values_list('country_code', flat=True)))
+
+    def download(self, path):
+        """
+        Streams the file to disk (it is a few hundred MB) and returns its sha256, None when the
+        download failed.
+        """
+        temporary_path = f'{path}.part'
+        url = DATA_URL.format(version=COUNTRY_REGION_JSON_VERSION)
+        digest = hashlib.sha256()
+        with requests.get(url, stream=True, timeout=60) as res:
+            if res.status_code != 200:
+                return None
+            with open(temporary_path, 'wb') as f:
+                for chunk in res.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+        os.replace(temporary_path, path)
+        return digest.hexdigest()
+
+    def stage(self, cursor, path):
+        """
+        Streams the countries out of the JSON file into the staging tables. Only one country is
+        parsed at a time and rows are sent with COPY every COPY_BATCH_SIZE rows, so memory use
+        does not grow with the size of the data. Returns the country codes.
+        """
+        writer = _StagingWriter(cursor)
+        country_codes = []
+        with open(path, 'rb') as f:
+            for country in tqdm(ijson.items(f, 'item'), desc="Staging countries"):
                 country_code = country['iso2']
-                country_name = country['name']
-                country_subregion = country['subregion']
-                country_capital = country['capital']
-                longitude = round(float(country['longitude']), 6) if country['longitude'] else None
-                latitude = round(float(country['latitude']), 6) if country['latitude'] else None
-
-                processed_country_codes.add(country_code)
-
-                if country_code in existing_countries:
-                    country_obj = existing_countries[country_code]
-                    country_obj.name = country_name
-                    country_obj.subregion = country_subregion
-                    country_obj.capital = country_capital
-                    country_obj.longitude = longitude
-                    country_obj.latitude = latitude
-                    countries_to_update.append(country_obj)
-                else:
-                    country_obj = Country(
-                        name=country_name,
-                        country_code=country_code,
-                        subregion=country_subregion,
-                        capital=country_capital,
-                        longitude=longitude,
-                        latitude=latitude
-                    )
-                    countries_to_create.append(country_obj)
-
-                saveCountryFlag(country_code)
-
-                if country['states']:
-                    for state in country['states']:
-                        name = state['name']
-                        state_id = f"{country_code}-{state['state_code']}"
-                        latitude = round(float(state['latitude']), 6) if state['latitude'] else None
-                        longitude = round(float(state['longitude']), 6) if state['longitude'] else None
-
-                        # Check for duplicate regions
-                        if state_id in processed_region_ids:
-                            # self.stdout.write(self.style.ERROR(f'State {state_id} already processed'))
-                            continue
-
-                        processed_region_ids.add(state_id)
-
-                        if state_id in existing_regions:
-                            region_obj = existing_regions[state_id]
-                            region_obj.name = name
-                            region_obj.country = country_obj
-                            region_obj.longitude = longitude
-                            region_obj.latitude = latitude
-                            regions_to_update.append(region_obj)
-                        else:
-                            region_obj = Region(
-                                id=state_id,
-                                name=name,
-                                country=country_obj,
-                                longitude=longitude,
-                                latitude=latitude
-                            )
-                            regions_to_create.append(region_obj)
-                        # self.stdout.write(self.style.SUCCESS(f'State {state_id} prepared'))
-
-                        if 'cities' in state and len(state['cities']) > 0:
-                            for city in state['cities']:
-                                city_id = f"{state_id}-{city['id']}"
-                                city_name = city['name']
-                                latitude = round(float(city['latitude']), 6) if city['latitude'] else None
-                                longitude = round(float(city['longitude']), 6) if city['longitude'] else None
-
-                                # Check for duplicate cities
-                                if city_id in processed_city_ids:
-                                    # self.stdout.write(self.style.ERROR(f'City {city_id} already processed'))
-                                    continue
-
-                                processed_city_ids.add(city_id)
-
-                                if city_id in existing_cities:
-                                    city_obj = existing_cities[city_id]
-                                    city_obj.name = city_name
-                                    city_obj.region = region_obj
-                                    city_obj.longitude = longitude
-                                    city_obj.latitude = latitude
-                                    cities_to_update.append(city_obj)
-                                else:
-                                    city_obj = City(
-                                        id=city_id,
-                                        name=city_name,
-                                        region=region_obj,
-                                        longitude=longitude,
-                                        latitude=latitude
-                                    )
-                                    cities_to_create.append(city_obj)
-                                # self.stdout.write(self.style.SUCCESS(f'City {city_id} prepared'))
-
-                else:
-                    state_id = f"{country_code}-00"
-                    processed_region_ids.add(state_id)
-                    if state_id in existing_regions:
-                        region_obj = existing_regions[state_id]
-                        region_obj.name = country_name
-                        region_obj.country = country_obj
-                        regions_to_update.append(region_obj)
-                    else:
-                        region_obj = Region(
-                            id=state_id,
-                            name=country_name,
-                            country=country_obj
-                        )
-                        regions_to_create.append(region_obj)
-                    # self.stdout.write(self.style.SUCCESS(f'Region {state_id} prepared for {country_name}'))
-            for i in tqdm(range(0, len(countries_to_create), batch_size), desc="Processing countries"):
-                batch = countries_to_create[i:i + batch_size]
-                Country.objects.bulk_create(batch)
-
-            for i in tqdm(range(0, len(regions_to_create), batch_size), desc="Processing regions"):
-                batch = regions_to_create[i:i + batch_size]
-                Region.objects.bulk_create(batch)
-
-            for i in tqdm(range(0, len(cities_to_create), batch_size), desc="Processing cities"):
-                batch = cities_to_create[i:i + batch_size]
-                City.objects.bulk_create(batch)
-
-            # Process updates in batches
-            for i in range(0, len(countries_to_update), batch_size):
-                batch = countries_to_update[i:i + batch_size]
-            for i in tqdm(range(0, len(countries_to_update), batch_size), desc="Updating countries"):
-                batch = countries_to_update[i:i + batch_size]
-                Country.objects.bulk_update(batch, ['name', 'subregion', 'capital', 'longitude', 'latitude'])
-
-            for i in tqdm(range(0, len(regions_to_update), batch_size), desc="Updating regions"):
-                batch = regions_to_update[i:i + batch_size]
-                Region.objects.bulk_update(batch, ['name', 'country', 'longitude', 'latitude'])
-
-            for i in tqdm(range(0, len(cities_to_update), batch_size), desc="Updating cities"):
-                batch = cities_to_update[i:i + batch_size]
-                City.objects.bulk_update(batch, ['name', 'region', 'longitude', 'latitude'])
-            Country.objects.exclude(country_code__in=processed_country_codes).delete()
-            Region.objects.exclude(id__in=processed_region_ids).delete()
-            City.objects.exclude(id__in=processed_city_ids).delete()
-
-        self.stdout.write(self.style.SUCCESS('All data imported successfully'))
\ No newline at end of file
+                country_codes.append(country_code)
+                writer.add('staging_country', [
+                    country_code, country['name'], country['subregion'], country['capital'],
+                    _coordinate(country['longitude']), _coordinate(country['latitude']),
+                ])
+
+                if not country['states']:
+                    writer.add('staging_region', [f"{country_code}-00", country['name'], country_code, None, None])
+                    continue
+                for state in country['states']:
+                    state_id = f"{country_code}-{state['state_code']}"
+                    writer.add('staging_region', [
+                        state_id, state['name'], country_code, _coordinate(state['longitude']), _coordinate(state['latitude']),
+                    ])
+                    for city in state.get('cities') or []:
+                        writer.add('staging_city', [
+                            f"{state_id}-{city['id']}", city['name'], state_id,
+                            _coordinate(city['longitude']), _coordinate(city['latitude']),
+                        ])
+        writer.flush()
+        return country_codes
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _coordinate(value):
+    return round(float(value), 6) if value else None
+
+
+def _copy_value(value):
+    # COPY text format
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class _StagingWriter:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.buffers = {table: io.StringIO() for table in STAGING_TABLES}
+        self.counts = dict.fromkeys(STAGING_TABLES, 0)
+
+    def add(self, table, row):
+        self.buffers[table].write('\t'.join(_copy_value(value) for value in row) + '\n')
+        self.counts[table] += 1
+        if self.counts[table] >= COPY_BATCH_SIZE:
+            self._copy(table)
+
+    def flush(self):
+        for table in STAGING_TABLES:
+            self._copy(table)
+
+    def _copy(self, table):
+        buffer = self.buffers[table]
+        if not self.counts[table]:
+            return
+        buffer.seek(0)
+        self.cursor.copy_expert(f"COPY {table} ({', '.join(STAGING_TABLES[table])}) FROM STDIN", buffer)
+        self.buffers[table] = io.StringIO()
+        self.counts[table] = 0
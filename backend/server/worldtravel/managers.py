@@ -0,0 +1,35 @@
+from django.db import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_subquery(queryset, group_by):
+    # COUNT(*) of a correlated subquery, 0 instead of NULL when it has no rows
+    counts = queryset.order_by().values(group_by).annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+class CountryQuerySet(models.QuerySet):
+    def with_counts(self, user=None):
+        # num_regions and the regions the user visited (num_visits) in the same query as the countries
+        from worldtravel.models import VisitedRegion
+
+        num_visits = Value(0)
+        if user is not None and user.is_authenticated:
+            num_visits = _count_subquery(
+                VisitedRegion.objects.filter(user_id=user.id, region__country=OuterRef('pk')), 'region__country',
+            )
+        return self.annotate(num_regions=Count('region'), num_visits=num_visits)
+
+
+class RegionQuerySet(models.QuerySet):
+    def with_counts(self, num_visits=False):
+        # num_cities and the country (for country_name) in the same query as the regions
+        queryset = self.select_related('country').annotate(num_cities=Count('city'))
+        if num_visits:
+            from worldtravel.models import VisitedRegion
+
+            queryset = queryset.annotate(
+                num_visits=_count_subquery(VisitedRegion.objects.filter(region=OuterRef('pk')), 'region'),
+            )
+        return queryset
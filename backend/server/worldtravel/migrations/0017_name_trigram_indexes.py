@@ -0,0 +1,29 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:24
+
+import django.contrib.postgres.indexes
+import main.utils
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('worldtravel', '0016_visitedcity_created_at_visitedregion_created_at'),
+        # pg_trgm and immutable_unaccent
+        ('adventures', '0033_search_vectors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='city',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(main.utils.SearchName('name'), name='gin_trgm_ops'), name='city_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='country',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(main.utils.SearchName('name'), name='gin_trgm_ops'), name='country_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='region',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(main.utils.SearchName('name'), name='gin_trgm_ops'), name='region_name_trgm'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.0.11 on 2026-10-19 09:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_visits(apps, schema_editor):
+    """
+    Keeps the oldest of every duplicate visit. The stats of the affected users counted the
+    duplicates, their rows are dropped and recomputed the next time they are read.
+    """
+    TravelStats = apps.get_model('adventures', 'TravelStats')
+    users = set()
+    for model_name, field in (('VisitedRegion', 'region'), ('VisitedCity', 'city')):
+        model = apps.get_model('worldtravel', model_name)
+        table = model._meta.db_table
+        column = model._meta.get_field(field).column
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE FROM {table} duplicate USING {table} original
+                WHERE duplicate.user_id_id = original.user_id_id
+                  AND duplicate.{column} = original.{column}
+                  AND duplicate.id > original.id
+                RETURNING duplicate.user_id_id
+            """)
+            users.update(user_id for user_id, in cursor.fetchall())
+    TravelStats.objects.filter(user_id__in=users).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adventures', '0032_travelstats'),
+        ('worldtravel', '0018_worlddataimport'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_visits, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='visitedcity',
+            constraint=models.UniqueConstraint(fields=('user_id', 'city'), name='unique_visited_city'),
+        ),
+        migrations.AddConstraint(
+            model_name='visitedregion',
+            constraint=models.UniqueConstraint(fields=('user_id', 'region'), name='unique_visited_region'),
+        ),
+    ]
@@ -1,7 +1,11 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.contrib.gis.db import models as gis_models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from main.utils import SearchName
+from worldtravel.managers import CountryQuerySet, RegionQuerySet
 
 
 User = get_user_model()
@@ -19,9 +23,12 @@ class Country(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     insert_id = models.UUIDField(unique=False, blank=True, null=True)
 
+    objects = CountryQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Country"
         verbose_name_plural = "Countries"
+        indexes = [GinIndex(OpClass(SearchName('name'), name='gin_trgm_ops'), name='country_name_trgm')]
 
     def __str__(self):
         return self.name
@@ -34,6 +41,11 @@ class Region(models.Model):
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     insert_id = models.UUIDField(unique=False, blank=True, null=True)
 
+    objects = RegionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [GinIndex(OpClass(SearchName('name'), name='gin_trgm_ops'), name='region_name_trgm')]
+
     def __str__(self):
         return self.name
     
@@ -47,6 +59,7 @@ class City(models.Model):
 
     class Meta:
         verbose_name_plural = "Cities"
+        indexes = [GinIndex(OpClass(SearchName('name'), name='gin_trgm_ops'), name='city_name_trgm')]
 
     def __str__(self):
         return self.name
@@ -56,6 +69,8 @@ class VisitedRegion(models.Model):
     user_id = models.ForeignKey(
         User, on_delete=models.CASCADE, default=default_user_id)
     region = models.ForeignKey(Region, on_delete=models.CASCADE)
+    # When the region was marked as visited, null for rows older than this column
+    created_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
 
     def __str__(self):
         return f'{self.region.name} ({self.region.country.country_code}) visited by: {self.user_id.username}'
@@ -65,11 +80,16 @@ class VisitedRegion(models.Model):
             raise ValidationError("Region already visited by user.")
         super().save(*args, **kwargs)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['user_id', 'region'], name='unique_visited_region')]
+
 class VisitedCity(models.Model):
     id = models.AutoField(primary_key=True)
     user_id = models.ForeignKey(
         User, on_delete=models.CASCADE, default=default_user_id)
     city = models.ForeignKey(City, on_delete=models.CASCADE)
+    # When the city was marked as visited, null for rows older than this column
+    created_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
 
     def __str__(self):
         return f'{self.city.name} ({self.city.region.name}) visited by: {self.user_id.username}'
@@ -80,4 +100,24 @@ class VisitedCity(models.Model):
         super().save(*args, **kwargs)
 
     class Meta:
-        verbose_name_plural = "Visited Cities"
\ No newline at end of file
+        verbose_name_plural = "Visited Cities"
+        constraints = [models.UniqueConstraint(fields=['user_id', 'city'], name='unique_visited_city')]
+
+
+class WorldDataImport(models.Model):
+    """
+    A completed download-countries run. The latest one tells which version of the source file
+    is loaded, so restarts can skip the import without reading the file or the tables.
+    """
+    version = models.CharField(max_length=32)
+    sha256 = models.CharField(max_length=64)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    deleted = models.PositiveIntegerField(default=0)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        get_latest_by = 'imported_at'
+
+    def __str__(self):
+        return f'{self.version} imported at {self.imported_at}'
@@ -2,6 +2,7 @@ import os
 from .models import Country, Region, VisitedRegion, City, VisitedCity
 from rest_framework import serializers
 from main.utils import CustomModelSerializer
+from worldtravel.utils.flags import get_flag_sprite
 
 
 class CountrySerializer(serializers.ModelSerializer):
@@ -9,18 +10,38 @@ class CountrySerializer(serializers.ModelSerializer):
         return os.environ.get('PUBLIC_URL', 'http://127.0.0.1:8000').rstrip('/').replace("'", "")
 
     flag_url = serializers.SerializerMethodField()
+    flag_sprite = serializers.SerializerMethodField()
     num_regions = serializers.SerializerMethodField()
     num_visits = serializers.SerializerMethodField()
 
     def get_flag_url(self, obj):
         public_url = self.get_public_url(obj)
         return public_url + '/media/' + 'flags/' + obj.country_code.lower() + '.png'
+
+    def get_flag_sprite(self, obj):
+        # Position of the flag in the shared sprite sheet, every flag of a list comes from one image
+        sprite = get_flag_sprite()
+        flag = sprite and sprite['flags'].get(obj.country_code.lower())
+        if not flag:
+            return None
+        sheet_url = self.get_public_url(obj) + '/media/flags/'
+        return {
+            'url': sheet_url + sprite['files']['webp'],
+            'fallback_url': sheet_url + sprite['files']['png'],
+            'sheet_width': sprite['width'],
+            'sheet_height': sprite['height'],
+            **flag,
+        }
     
     def get_num_regions(self, obj):
-        # get the number of regions in the country
+        # Annotated by Country.objects.with_counts(), counted per row otherwise
+        if hasattr(obj, 'num_regions'):
+            return obj.num_regions
         return Region.objects.filter(country=obj).count()
     
     def get_num_visits(self, obj):
+        if hasattr(obj, 'num_visits'):
+            return obj.num_visits
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
             return VisitedRegion.objects.filter(region__country=obj, user_id=request.user).count()
@@ -29,7 +50,7 @@ class CountrySerializer(serializers.ModelSerializer):
     class Meta:
         model = Country
         fields = '__all__'
-        read_only_fields = ['id', 'name', 'country_code', 'subregion', 'flag_url', 'num_regions', 'num_visits', 'longitude', 'latitude', 'capital']
+        read_only_fields = ['id', 'name', 'country_code', 'subregion', 'flag_url', 'flag_sprite', 'num_regions', 'num_visits', 'longitude', 'latitude', 'capital']
 
 
 class RegionSerializer(serializers.ModelSerializer):
@@ -41,6 +62,9 @@ class RegionSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'name', 'country', 'longitude', 'latitude', 'num_cities', 'country_name']
 
     def get_num_cities(self, obj):
+        # Annotated by Region.objects.with_counts(), counted per row otherwise
+        if hasattr(obj, 'num_cities'):
+            return obj.num_cities
         return City.objects.filter(region=obj).count()
 
 class CitySerializer(serializers.ModelSerializer):
@@ -1,3 +1,240 @@
-from django.test import TestCase
+from importlib import import_module
 
-# Create your tests here.
+from django.apps import apps
+from django.db import connection
+from rest_framework.test import APITestCase
+
+from adventures.models import TravelStats
+from adventures.utils.stats import get_travel_stats
+from users.models import CustomUser
+from .models import City, Country, Region, VisitedCity, VisitedRegion
+
+
+class CountryRegionCountsTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='traveler', email='traveler@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+
+    def add_countries(self, count):
+        # Every country gets two regions with three cities each, one region is visited
+        for _ in range(count):
+            number = Country.objects.count()
+            country = Country.objects.create(name=f'Country {number}', country_code=f'{number:02d}')
+            for region_number in range(2):
+                region = Region.objects.create(id=f'{number}-{region_number}', name=f'Region {region_number}', country=country)
+                City.objects.bulk_create([City(id=f'{region.id}-{i}', name=f'City {i}', region=region) for i in range(3)])
+            VisitedRegion.objects.create(user_id=self.user, region_id=f'{number}-0')
+
+    def test_001_country_list_counts(self):
+        self.add_countries(2)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/countries/')
+        self.assertEqual(response.status_code, 200)
+
+        # Ten times the countries, still one query
+        self.add_countries(18)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/countries/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data), 20)
+        for country in data:
+            self.assertEqual(country['num_regions'], 2)
+            self.assertEqual(country['num_visits'], 1)
+
+    def test_002_region_list_counts(self):
+        self.add_countries(10)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/regions/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 20)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/05/regions/')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([region['num_cities'] for region in data], [3, 3])
+        self.assertEqual({region['country_name'] for region in data}, {'Country 5'})
+
+
+class CityListingTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='traveler', email='traveler@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        country = Country.objects.create(name='Germany', country_code='DE')
+        self.region = Region.objects.create(id='DE-NW', name='North Rhine-Westphalia', country=country)
+        names = ['Aachen', 'Bonn', 'Bielefeld', 'Cologne', 'Düsseldorf']
+        City.objects.bulk_create([
+            City(id=f'DE-NW-{i}', name=name, region=self.region, latitude=50 + i, longitude=6 + i) for i, name in enumerate(names)
+        ])
+        VisitedCity.objects.create(user_id=self.user, city_id='DE-NW-1')
+
+    def test_001_unpaginated(self):
+        response = self.client.get('/api/regions/DE-NW/cities/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([city['name'] for city in response.json()], ['Aachen', 'Bielefeld', 'Bonn', 'Cologne', 'Düsseldorf'])
+
+    def test_002_pagination(self):
+        response = self.client.get('/api/regions/DE-NW/cities/', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([city['name'] for city in data['results']], ['Aachen', 'Bielefeld'])
+        self.assertTrue(data['has_more'])
+
+        data = self.client.get('/api/regions/DE-NW/cities/', {'limit': 2, 'offset': 4}).json()
+        self.assertEqual([city['name'] for city in data['results']], ['Düsseldorf'])
+        self.assertFalse(data['has_more'])
+
+        response = self.client.get('/api/regions/DE-NW/cities/', {'limit': 'ten'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_003_prefix(self):
+        response = self.client.get('/api/regions/DE-NW/cities/', {'q': 'b'})
+        self.assertEqual([city['name'] for city in response.json()], ['Bielefeld', 'Bonn'])
+
+        # A region without matching cities is not a missing region
+        response = self.client.get('/api/regions/DE-NW/cities/', {'q': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+
+    def test_004_compact(self):
+        response = self.client.get('/api/regions/DE-NW/cities/', {'compact': 'true', 'q': 'b', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'id': ['DE-NW-2'], 'name': ['Bielefeld'], 'latitude': [52.0], 'longitude': [8.0], 'visited': [False], 'has_more': True,
+        })
+
+        data = self.client.get('/api/regions/DE-NW/cities/', {'compact': 'true'}).json()
+        self.assertEqual(dict(zip(data['name'], data['visited']))['Bonn'], True)
+
+    def test_005_visits(self):
+        response = self.client.get('/api/regions/DE-NW/cities/visits/', {'compact': 'true'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['city'], ['DE-NW-1'])
+        self.assertEqual(data['name'], ['Bonn'])
+
+        response = self.client.get('/api/regions/DE-NW/cities/visits/', {'q': 'a'})
+        self.assertEqual(response.json(), [])
+
+    def test_006_unknown_region(self):
+        for url in ('/api/regions/XX-YY/cities/', '/api/regions/XX-YY/cities/visits/'):
+            response = self.client.get(url, {'compact': 'true'})
+            self.assertEqual(response.status_code, 404)
+
+
+class BulkVisitsTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='traveler', email='traveler@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        # Two countries with two regions of two cities each
+        for country_code in ('AA', 'BB'):
+            country = Country.objects.create(name=f'Country {country_code}', country_code=country_code)
+            for region_number in range(2):
+                region = Region.objects.create(id=f'{country_code}-{region_number}', name=f'Region {region_number}', country=country)
+                City.objects.bulk_create([City(id=f'{region.id}-{i}', name=f'City {i}', region=region) for i in range(2)])
+
+    def visited_regions(self):
+        return set(VisitedRegion.objects.filter(user_id=self.user).values_list('region_id', flat=True))
+
+    def visited_cities(self):
+        return set(VisitedCity.objects.filter(user_id=self.user).values_list('city_id', flat=True))
+
+    def test_001_mark_regions(self):
+        VisitedRegion.objects.create(user_id=self.user, region_id='AA-0')
+        # Already visited and repeated regions are skipped
+        response = self.client.post('/api/visitedregion/bulk_mark/', {'regions': ['AA-0', 'AA-1', 'AA-1', 'BB-0']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'regions_created': 2})
+        self.assertEqual(self.visited_regions(), {'AA-0', 'AA-1', 'BB-0'})
+
+        response = self.client.post('/api/visitedregion/bulk_mark/', {'country': 'bb'}, format='json')
+        self.assertEqual(response.json(), {'regions_created': 1})
+        self.assertEqual(self.visited_regions(), {'AA-0', 'AA-1', 'BB-0', 'BB-1'})
+
+    def test_002_unmark_regions(self):
+        self.client.post('/api/visitedregion/bulk_mark/', {'country': 'AA'}, format='json')
+        response = self.client.post('/api/visitedregion/bulk_unmark/', {'regions': ['AA-0', 'BB-0']}, format='json')
+        self.assertEqual(response.json(), {'regions_deleted': 1})
+        self.assertEqual(self.visited_regions(), {'AA-1'})
+
+    def test_003_mark_cities(self):
+        VisitedCity.objects.create(user_id=self.user, city_id='AA-0-0')
+        response = self.client.post('/api/visitedcity/bulk_mark/', {'cities': ['AA-0-0', 'AA-0-1', 'BB-1-0', 'BB-1-0']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # The regions of the cities are marked too, AA-0 once although it has two cities
+        self.assertEqual(response.json(), {'cities_created': 2, 'regions_created': 2})
+        self.assertEqual(self.visited_cities(), {'AA-0-0', 'AA-0-1', 'BB-1-0'})
+        self.assertEqual(self.visited_regions(), {'AA-0', 'BB-1'})
+
+        response = self.client.post('/api/visitedcity/bulk_mark/', {'region': 'BB-1'}, format='json')
+        self.assertEqual(response.json(), {'cities_created': 1, 'regions_created': 0})
+
+    def test_004_unmark_cities(self):
+        self.client.post('/api/visitedcity/bulk_mark/', {'region': 'AA-0'}, format='json')
+        response = self.client.post('/api/visitedcity/bulk_unmark/', {'region': 'AA-0'}, format='json')
+        self.assertEqual(response.json(), {'cities_deleted': 2})
+        self.assertEqual(self.visited_cities(), set())
+        # Unmarking cities leaves their regions visited
+        self.assertEqual(self.visited_regions(), {'AA-0'})
+
+    def test_005_travel_stats(self):
+        stats = get_travel_stats(self.user.id)
+        self.assertEqual(stats.visited_region_count, 0)
+
+        self.client.post('/api/visitedcity/bulk_mark/', {'cities': ['AA-0-0', 'AA-1-0', 'BB-0-0']}, format='json')
+        stats.refresh_from_db()
+        self.assertEqual((stats.visited_city_count, stats.visited_region_count, stats.visited_country_count), (3, 3, 2))
+
+        self.client.post('/api/visitedregion/bulk_unmark/', {'country': 'BB'}, format='json')
+        stats.refresh_from_db()
+        self.assertEqual((stats.visited_city_count, stats.visited_region_count, stats.visited_country_count), (3, 2, 1))
+
+    def test_006_invalid(self):
+        response = self.client.post('/api/visitedregion/bulk_mark/', {'regions': 'AA-0'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/visitedcity/bulk_mark/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class DuplicateVisitsMigrationTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='traveler', email='traveler@example.com', password='testpassword')
+        self.other = CustomUser.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        country = Country.objects.create(name='Country', country_code='AA')
+        region = Region.objects.create(id='AA-0', name='Region', country=country)
+        City.objects.create(id='AA-0-0', name='City', region=region)
+
+    def test_001_remove_duplicate_visits(self):
+        migration = import_module('worldtravel.migrations.0019_visit_unique_constraints')
+        constraints = [(VisitedRegion, 'unique_visited_region'), (VisitedCity, 'unique_visited_city')]
+        with connection.schema_editor() as editor:
+            # The duplicates the migration cleans up can only exist without the constraints
+            for model, name in constraints:
+                editor.remove_constraint(model, next(c for c in model._meta.constraints if c.name == name))
+            VisitedRegion.objects.bulk_create([VisitedRegion(user_id=self.user, region_id='AA-0') for _ in range(3)])
+            VisitedCity.objects.bulk_create([VisitedCity(user_id=self.user, city_id='AA-0-0') for _ in range(2)])
+            VisitedRegion.objects.create(user_id=self.other, region_id='AA-0')
+            first_region = VisitedRegion.objects.filter(user_id=self.user).order_by('id').first()
+            get_travel_stats(self.user.id)
+            get_travel_stats(self.other.id)
+
+            migration.remove_duplicate_visits(apps, editor)
+
+            # Runs the deferred foreign key checks, PostgreSQL refuses to alter tables with pending ones
+            connection.check_constraints()
+            # Adding the constraints again fails if any duplicate is left
+            for model, name in constraints:
+                editor.add_constraint(model, next(c for c in model._meta.constraints if c.name == name))
+
+        self.assertEqual(list(VisitedRegion.objects.filter(user_id=self.user)), [first_region])
+        self.assertEqual(VisitedCity.objects.filter(user_id=self.user).count(), 1)
+        self.assertEqual(VisitedRegion.objects.filter(user_id=self.other).count(), 1)
+        # Stats that counted the duplicates are dropped and computed again when read
+        self.assertFalse(TravelStats.objects.filter(user=self.user).exists())
+        self.assertTrue(TravelStats.objects.filter(user=self.other).exists())
+        self.assertEqual(get_travel_stats(self.user.id).visited_region_count, 1)
@@ -2,7 +2,7 @@
 
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
-from .views import CountryViewSet, RegionViewSet, VisitedRegionViewSet, regions_by_country, visits_by_country, cities_by_region, VisitedCityViewSet, visits_by_region
+from .views import CountryViewSet, RegionViewSet, VisitedRegionViewSet, regions_by_country, visits_by_country, cities_by_region, VisitedCityViewSet, visits_by_region, autocomplete
 router = DefaultRouter()
 router.register(r'countries', CountryViewSet, basename='countries')
 router.register(r'regions', RegionViewSet, basename='regions')
@@ -11,6 +11,7 @@ router.register(r'visitedcity', VisitedCityViewSet, basename='visitedcity')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('autocomplete/', autocomplete, name='autocomplete'),
     path('<str:country_code>/regions/', regions_by_country, name='regions-by-country'),
     path('<str:country_code>/visits/', visits_by_country, name='visits-by-country'),
     path('regions/<str:region_id>/cities/', cities_by_region, name='cities-by-region'),
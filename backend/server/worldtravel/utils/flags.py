@@ -0,0 +1,185 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from PIL import Image
+
+FLAG_URL = 'https://flagcdn.com/h240/{code}.png'
+FLAG_WORKERS = 8
+FLAG_TIMEOUT = 30
+# Flags are scaled to this height in the sprite, the widths keep the aspect ratio
+SPRITE_HEIGHT = 120
+SPRITE_MAX_WIDTH = 4096
+SPRITE_FORMATS = {'webp': {'quality': 90, 'method': 6}, 'png': {'optimize': True}}
+SPRITE_MAP_FILE = 'sprite.json'
+# ETag and Last-Modified of every downloaded flag, sent back so unchanged flags are a 304
+VALIDATORS_FILE = '.validators.json'
+# How often a worker looks for a newer sprite map
+RELOAD_CHECK_INTERVAL = 60
+
+
+def flags_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'flags')
+
+
+def _write_atomic(path, content):
+    temporary = f'{path}.{uuid.uuid4().hex}.part'
+    with open(temporary, 'wb') as file:
+        file.write(content)
+    os.replace(temporary, path)
+
+
+def _load_validators(directory):
+    try:
+        with open(os.path.join(directory, VALIDATORS_FILE)) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _download_flag(session, directory, code, validators):
+    """Returns 'downloaded', 'unchanged' or 'failed' and the new validators of the flag."""
+    path = os.path.join(directory, f'{code}.png')
+    headers = {}
+    # Validators are only worth sending when the file they describe is still there
+    if os.path.exists(path):
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    try:
+        res = session.get(FLAG_URL.format(code=code), headers=headers, timeout=FLAG_TIMEOUT)
+    except requests.RequestException:
+        return 'failed', validators
+    if res.status_code == 304:
+        return 'unchanged', validators
+    if res.status_code != 200:
+        return 'failed', validators
+    _write_atomic(path, res.content)
+    return 'downloaded', {'etag': res.headers.get('ETag'), 'last_modified': res.headers.get('Last-Modified')}
+
+
+def download_flags(country_codes, workers=FLAG_WORKERS):
+    """
+    Downloads the flags of the given countries to MEDIA_ROOT/flags, a few at a time. Flags that
+    are already there are only downloaded again when flagcdn reports a change. Returns
+    {status: [country codes]}.
+    """
+    directory = flags_dir()
+    os.makedirs(directory, exist_ok=True)
+    validators = _load_validators(directory)
+    codes = sorted({code.lower() for code in country_codes if code})
+
+    results = {'downloaded': [], 'unchanged': [], 'failed': []}
+    with requests.Session() as session:
+        # One pooled connection per worker, flagcdn is a single host
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount('https://', adapter)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='flags') as executor:
+            futures = {
+                code: executor.submit(_download_flag, session, directory, code, validators.get(code, {}))
+                for code in codes
+            }
+            for code, future in futures.items():
+                status, validators[code] = future.result()
+                results[status].append(code)
+
+    _write_atomic(os.path.join(directory, VALIDATORS_FILE), json.dumps(validators, indent=2).encode())
+    return results
+
+
+def _pack(sizes):
+    """Shelf packing of same height images: left to right, a new row when the row is full."""
+    positions, x, y = {}, 0, 0
+    for code, (width, height) in sizes.items():
+        if x and x + width > SPRITE_MAX_WIDTH:
+            x, y = 0, y + height
+        positions[code] = (x, y)
+        x += width
+    sheet_width = max((positions[code][0] + sizes[code][0] for code in sizes), default=0)
+    return positions, sheet_width, y + SPRITE_HEIGHT if sizes else 0
+
+
+def build_flag_sprite():
+    """
+    Packs every downloaded flag into one image, written as WebP and PNG with a content hash in
+    the file name, and writes sprite.json with the position of every flag in it. Returns the
+    map, None when there are no flags.
+    """
+    directory = flags_dir()
+    flags = {}
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else ():
+        code, extension = os.path.splitext(name)
+        if extension != '.png' or code.startswith('sprite-'):
+            continue
+        with Image.open(os.path.join(directory, name)) as image:
+            image = image.convert('RGBA')
+            width = max(1, round(image.width * SPRITE_HEIGHT / image.height))
+            flags[code] = image.resize((width, SPRITE_HEIGHT), Image.LANCZOS)
+    if not flags:
+        return None
+
+    positions, sheet_width, sheet_height = _pack({code: image.size for code, image in flags.items()})
+    sheet = Image.new('RGBA', (sheet_width, sheet_height), (0, 0, 0, 0))
+    for code, image in flags.items():
+        sheet.paste(image, positions[code])
+
+    encoded = {}
+    for extension, options in SPRITE_FORMATS.items():
+        buffer = io.BytesIO()
+        sheet.save(buffer, format=extension.upper(), **options)
+        encoded[extension] = buffer.getvalue()
+    digest = hashlib.sha256(encoded['png']).hexdigest()[:16]
+    files = {extension: f'sprite-{digest}.{extension}' for extension in encoded}
+    for extension, content in encoded.items():
+        _write_atomic(os.path.join(directory, files[extension]), content)
+
+    sprite = {
+        'files': files,
+        'width': sheet_width,
+        'height': sheet_height,
+        'flags': {
+            code: {'x': positions[code][0], 'y': positions[code][1], 'width': image.width, 'height': image.height}
+            for code, image in flags.items()
+        },
+    }
+    _write_atomic(os.path.join(directory, SPRITE_MAP_FILE), json.dumps(sprite).encode())
+
+    # Sheets of older builds are no longer referenced by the map
+    for name in os.listdir(directory):
+        if name.startswith('sprite-') and name not in files.values():
+            os.remove(os.path.join(directory, name))
+    return sprite
+
+
+_lock = threading.Lock()
+_sprite = None
+_sprite_mtime = None
+_checked_at = None
+
+
+def get_flag_sprite():
+    """The sprite map of this worker, reloaded when the importer wrote a new one."""
+    global _sprite, _sprite_mtime, _checked_at
+    if _checked_at is not None and time.monotonic() - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _sprite
+    with _lock:
+        path = os.path.join(flags_dir(), SPRITE_MAP_FILE)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            if mtime != _sprite_mtime:
+                with open(path) as file:
+                    _sprite = json.load(file)
+                _sprite_mtime = mtime
+        except (FileNotFoundError, ValueError):
+            _sprite, _sprite_mtime = None, None
+        _checked_at = time.monotonic()
+    return _sprite
@@ -0,0 +1,224 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import unicodedata
+import uuid
+from bisect import bisect_left
+
+import numpy as np
+from django.conf import settings
+
+from worldtravel.models import City, Country, Region
+
+KINDS = ['country', 'region', 'city']
+# Countries before regions before cities when names match equally well
+KIND_SCORES = {'country': 200, 'region': 100, 'city': 0}
+FULL_NAME_SCORE = 1000
+EXACT_MATCH_SCORE = 2000
+MAX_NAME_SCORE = 100
+# How often a worker looks for a newer build of the index
+RELOAD_CHECK_INTERVAL = 60
+
+ARRAYS = ['keys', 'key_offsets', 'entry_records', 'entry_kinds', 'entry_scores', 'records', 'record_offsets']
+CURRENT_FILE = 'current'
+LOCK_FILE = '.lock'
+
+
+def normalize(text):
+    """Lowercase, accents removed, anything but letters and digits collapsed to single spaces."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    return ' '.join(''.join(char if char.isalnum() else ' ' for char in stripped).split())
+
+
+class _Keys:
+    """Sequence view of the sorted keys for bisect, reading from the memory-mapped blob."""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.blob[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+
+class PrefixIndex:
+    """
+    Sorted array of normalized names over countries, regions and cities, searched with binary
+    search. Every word suffix of a name is a key, so "york" finds "New York". The arrays are
+    numpy files opened with mmap, so all workers on a host share one copy in the page cache.
+
+    Keys are UTF-8 bytes, whose order is the code point order: the keys starting with a prefix
+    are the contiguous range [prefix, prefix + 0xFF), and 0xFF never occurs in UTF-8.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        arrays = {name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r') for name in ARRAYS}
+        self.keys = _Keys(arrays['keys'], arrays['key_offsets'])
+        self.entry_records = arrays['entry_records']
+        self.entry_kinds = arrays['entry_kinds']
+        self.entry_scores = arrays['entry_scores']
+        self.records = arrays['records']
+        self.record_offsets = arrays['record_offsets']
+
+    def record(self, index):
+        return json.loads(self.records[self.record_offsets[index]:self.record_offsets[index + 1]].tobytes())
+
+    def search(self, text, kinds=None, limit=10):
+        prefix = normalize(text).encode()
+        if not prefix:
+            return []
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + b'\xff', start)
+        if start == end:
+            return []
+        # Keys equal to the prefix sort before the longer ones
+        exact_end = bisect_left(self.keys, prefix + b'\x00', start, end)
+
+        scores = np.array(self.entry_scores[start:end], dtype=np.int32)
+        scores[:exact_end - start] += EXACT_MATCH_SCORE
+        if kinds:
+            allowed = np.isin(self.entry_kinds[start:end], [KINDS.index(kind) for kind in kinds])
+            scores[~allowed] = -1
+        # A name can match through several of its words, take enough candidates to dedupe
+        count = min(len(scores), limit * 3)
+        best = np.argpartition(-scores, count - 1)[:count]
+        best = best[np.argsort(-scores[best], kind='stable')]
+
+        results, seen = [], set()
+        for position in best.tolist():
+            if scores[position] < 0:
+                break
+            record_index = int(self.entry_records[start + position])
+            if record_index in seen:
+                continue
+            seen.add(record_index)
+            results.append(self.record(record_index))
+            if len(results) == limit:
+                break
+        return results
+
+
+def _records():
+    """Yields (kind, name, record) for every country, region and city."""
+    countries = {}
+    for country_id, name, country_code in Country.objects.values_list('id', 'name', 'country_code').iterator():
+        countries[country_id] = (name, country_code)
+        yield 'country', name, {'id': country_id, 'name': name, 'country_code': country_code}
+    regions = {}
+    for region_id, name, country_id in Region.objects.values_list('id', 'name', 'country_id').iterator():
+        country_name, country_code = countries[country_id]
+        regions[region_id] = name
+        yield 'region', name, {'id': region_id, 'name': name, 'country': country_name, 'country_code': country_code}
+    cities = City.objects.values_list('id', 'name', 'region_id', 'region__country_id')
+    for city_id, name, region_id, country_id in cities.iterator(chunk_size=5000):
+        country_name, country_code = countries[country_id]
+        yield 'city', name, {
+            'id': city_id, 'name': name, 'region': regions[region_id], 'country': country_name, 'country_code': country_code,
+        }
+
+
+def _write_index(directory):
+    entries = []
+    records, record_offsets = bytearray(), [0]
+    for kind, name, record in _records():
+        record_index = len(record_offsets) - 1
+        records += json.dumps({'type': kind, **record}, ensure_ascii=False).encode()
+        record_offsets.append(len(records))
+        # Shorter names rank higher, they are more likely the one meant
+        score = KIND_SCORES[kind] + MAX_NAME_SCORE - min(len(name), MAX_NAME_SCORE)
+        words = normalize(name).split(' ')
+        for position in range(len(words)):
+            key = ' '.join(words[position:]).encode()
+            if key:
+                entries.append((key, record_index, KINDS.index(kind), score + (FULL_NAME_SCORE if position == 0 else 0)))
+    entries.sort(key=lambda entry: entry[0])
+
+    keys = b''.join(entry[0] for entry in entries)
+    arrays = {
+        'keys': np.frombuffer(keys, dtype=np.uint8),
+        'key_offsets': np.concatenate([[0], np.cumsum([len(entry[0]) for entry in entries])]).astype(np.int64),
+        'entry_records': np.array([entry[1] for entry in entries], dtype=np.int32),
+        'entry_kinds': np.array([entry[2] for entry in entries], dtype=np.uint8),
+        'entry_scores': np.array([entry[3] for entry in entries], dtype=np.int32),
+        'records': np.frombuffer(bytes(records), dtype=np.uint8),
+        'record_offsets': np.array(record_offsets, dtype=np.int64),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f'{name}.npy'), array)
+
+
+def _current_build(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as file:
+            return file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def build_prefix_index(force=False):
+    """
+    Builds the index for the current COUNTRY_REGION_JSON_VERSION unless it exists already, and
+    returns the name of the build directory. Run by download-countries, which the entrypoint
+    starts before the workers. A file lock keeps concurrent builds from racing.
+    """
+    root = str(settings.PREFIX_INDEX_DIR)
+    os.makedirs(root, exist_ok=True)
+    version = settings.COUNTRY_REGION_JSON_VERSION
+    with open(os.path.join(root, LOCK_FILE), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        current = _current_build(root)
+        if not force and current and current.startswith(f'{version}-'):
+            return current
+
+        build = f'{version}-{int(time.time())}-{uuid.uuid4().hex[:8]}'
+        temporary = os.path.join(root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(temporary)
+        try:
+            _write_index(temporary)
+            os.rename(temporary, os.path.join(root, build))
+        except BaseException:
+            shutil.rmtree(temporary, ignore_errors=True)
+            raise
+        pointer = os.path.join(root, f'.{CURRENT_FILE}-{uuid.uuid4().hex}')
+        with open(pointer, 'w') as file:
+            file.write(build)
+        os.replace(pointer, os.path.join(root, CURRENT_FILE))
+
+        # Keep the previous build for workers that read the old pointer a moment ago. Mapped
+        # files of deleted builds stay readable until the workers reload.
+        for name in os.listdir(root):
+            if name not in (build, current, CURRENT_FILE, LOCK_FILE):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+        return build
+
+
+_lock = threading.Lock()
+_index = None
+_checked_at = 0
+
+
+def get_prefix_index():
+    """
+    The index of this worker, loaded lazily and swapped when a newer build appears. Building
+    takes too long for a request, so this is None until download-countries has built one.
+    """
+    global _index, _checked_at
+    if _index is not None and time.monotonic() - _checked_at < RELOAD_CHECK_INTERVAL:
+        return _index
+    with _lock:
+        root = str(settings.PREFIX_INDEX_DIR)
+        build = _current_build(root)
+        if build is not None:
+            directory = os.path.join(root, build)
+            if _index is None or _index.directory != directory:
+                _index = PrefixIndex(directory)
+        _checked_at = time.monotonic()
+    return _index
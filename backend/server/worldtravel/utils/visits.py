@@ -0,0 +1,90 @@
+from django.db import connection, transaction
+
+from adventures.utils.stats import refresh_travel_stats
+from worldtravel.models import City, Country, Region, VisitedCity, VisitedRegion
+
+# Regions picked by id or all regions of a country (by country code)
+REGIONS_SQL = f"""
+    SELECT id FROM {Region._meta.db_table}
+    WHERE id = ANY(%(regions)s::text[])
+       OR country_id = (SELECT id FROM {Country._meta.db_table} WHERE country_code = upper(%(country)s))
+"""
+
+# Cities picked by id or all cities of a region
+CITIES_SQL = f"""
+    SELECT id, region_id FROM {City._meta.db_table}
+    WHERE id = ANY(%(cities)s::text[]) OR region_id = %(region)s
+"""
+
+# The unique constraints on (user_id, region) and (user_id, city) turn already visited places
+# into no-ops, so nothing has to be checked first
+MARK_REGIONS_SQL = f"""
+    INSERT INTO {VisitedRegion._meta.db_table} (user_id_id, region_id, created_at)
+    SELECT %(user)s, id, now() FROM ({REGIONS_SQL}) regions
+    ON CONFLICT (user_id_id, region_id) DO NOTHING
+"""
+
+# The regions of the cities are marked as visited by the same statement
+MARK_CITIES_SQL = f"""
+    WITH cities AS ({CITIES_SQL}),
+    new_cities AS (
+        INSERT INTO {VisitedCity._meta.db_table} (user_id_id, city_id, created_at)
+        SELECT %(user)s, id, now() FROM cities
+        ON CONFLICT (user_id_id, city_id) DO NOTHING
+        RETURNING 1
+    ),
+    new_regions AS (
+        INSERT INTO {VisitedRegion._meta.db_table} (user_id_id, region_id, created_at)
+        SELECT DISTINCT %(user)s, region_id, now() FROM cities
+        ON CONFLICT (user_id_id, region_id) DO NOTHING
+        RETURNING 1
+    )
+    SELECT (SELECT count(*) FROM new_cities), (SELECT count(*) FROM new_regions)
+"""
+
+UNMARK_REGIONS_SQL = f"""
+    DELETE FROM {VisitedRegion._meta.db_table}
+    WHERE user_id_id = %(user)s AND region_id IN (SELECT id FROM ({REGIONS_SQL}) regions)
+"""
+
+UNMARK_CITIES_SQL = f"""
+    DELETE FROM {VisitedCity._meta.db_table}
+    WHERE user_id_id = %(user)s AND city_id IN (SELECT id FROM ({CITIES_SQL}) cities)
+"""
+
+
+def _execute(sql, params):
+    """
+    Runs a bulk change as a single statement and recomputes the user's stats once. The model
+    signals would cost a few queries per row.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            result = cursor.fetchone() if cursor.description else (cursor.rowcount,)
+        refresh_travel_stats(params['user'])
+    return result
+
+
+def mark_regions(user_id, region_ids=(), country_code=None):
+    """Marks the regions and/or every region of a country as visited, returns how many were new."""
+    created, = _execute(MARK_REGIONS_SQL, {'user': user_id, 'regions': list(region_ids), 'country': country_code})
+    return created
+
+
+def unmark_regions(user_id, region_ids=(), country_code=None):
+    deleted, = _execute(UNMARK_REGIONS_SQL, {'user': user_id, 'regions': list(region_ids), 'country': country_code})
+    return deleted
+
+
+def mark_cities(user_id, city_ids=(), region_id=None):
+    """
+    Marks the cities and/or every city of a region as visited together with their regions,
+    returns how many cities and regions were new.
+    """
+    return _execute(MARK_CITIES_SQL, {'user': user_id, 'cities': list(city_ids), 'region': region_id})
+
+
+def unmark_cities(user_id, city_ids=(), region_id=None):
+    deleted, = _execute(UNMARK_CITIES_SQL, {'user': user_id, 'cities': list(city_ids), 'region': region_id})
+    return deleted
@@ -11,16 +11,23 @@ import json
 from django.http import JsonResponse
 from django.contrib.gis.geos import Point
 from django.conf import settings
+from django.db.models import Exists, OuterRef
 from rest_framework.decorators import action
 from django.contrib.staticfiles import finders
 from adventures.models import Adventure
+from worldtravel.utils.prefix_index import KINDS, get_prefix_index
+from worldtravel.utils.visits import mark_cities, mark_regions, unmark_cities, unmark_regions
+
+AUTOCOMPLETE_MAX_LIMIT = 25
+CITY_LISTING_MAX_LIMIT = 1000
+BULK_VISIT_MAX_IDS = 5000
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def regions_by_country(request, country_code):
     # require authentication
     country = get_object_or_404(Country, country_code=country_code)
-    regions = Region.objects.filter(country=country).order_by('name')
+    regions = Region.objects.with_counts().filter(country=country).order_by('name')
     serializer = RegionSerializer(regions, many=True)
     return Response(serializer.data)
 
@@ -33,28 +40,113 @@ def visits_by_country(request, country_code):
     serializer = VisitedRegionSerializer(visits, many=True)
     return Response(serializer.data)
 
+def _parse_city_listing(request):
+    # ?q= name prefix, ?limit=&offset= opt-in pagination, ?compact=true parallel arrays
+    params = request.query_params
+    try:
+        limit = params.get('limit')
+        limit = min(max(int(limit), 1), CITY_LISTING_MAX_LIMIT) if limit is not None else None
+        offset = max(int(params.get('offset', 0)), 0)
+    except ValueError:
+        return None, Response({"error": "limit and offset must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+    return {
+        'prefix': params.get('q', '').strip(),
+        'limit': limit,
+        'offset': offset,
+        'compact': params.get('compact', '').lower() in ('1', 'true'),
+    }, None
+
+def _city_listing(region_id, queryset, listing, name_field, serialize, compact_columns):
+    """
+    Runs the listing as one query. The region is only looked up when there are no rows, to tell
+    an empty result from a region that does not exist.
+    """
+    if listing['prefix']:
+        queryset = queryset.filter(**{f'{name_field}__istartswith': listing['prefix']})
+    offset, limit = listing['offset'], listing['limit']
+    if limit is not None:
+        # One row more than asked for tells whether there is a next page without a COUNT
+        rows = list(queryset[offset:offset + limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    else:
+        rows = list(queryset[offset:] if offset else queryset)
+        has_more = False
+    if not rows and not Region.objects.filter(id=region_id).exists():
+        return Response({"error": "Region not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    if listing['compact']:
+        data = {column: [row[position] for row in rows] for position, column in enumerate(compact_columns)}
+        for column in ('latitude', 'longitude'):
+            data[column] = [float(value) if value is not None else None for value in data[column]]
+    else:
+        data = serialize(rows)
+    if limit is None:
+        return Response(data)
+    if listing['compact']:
+        return Response({**data, 'has_more': has_more})
+    return Response({'results': data, 'has_more': has_more})
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def cities_by_region(request, region_id):
-    region = get_object_or_404(Region, id=region_id)
-    cities = City.objects.filter(region=region).order_by('name')
-    serializer = CitySerializer(cities, many=True)
-    return Response(serializer.data)
+    listing, error = _parse_city_listing(request)
+    if error:
+        return error
+    cities = City.objects.filter(region_id=region_id).order_by('name', 'id')
+    if listing['compact']:
+        visited = VisitedCity.objects.filter(user_id=request.user.id, city=OuterRef('pk'))
+        cities = cities.annotate(visited=Exists(visited)).values_list('id', 'name', 'latitude', 'longitude', 'visited')
+    else:
+        cities = cities.select_related('region__country')
+    return _city_listing(
+        region_id, cities, listing, 'name',
+        lambda rows: CitySerializer(rows, many=True).data,
+        ['id', 'name', 'latitude', 'longitude', 'visited'],
+    )
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def visits_by_region(request, region_id):
-    region = get_object_or_404(Region, id=region_id)
-    visits = VisitedCity.objects.filter(city__region=region, user_id=request.user.id)
+def autocomplete(request):
+    # ?q=par&types=city,region&limit=10, answered from the in-memory prefix index without a query
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response({"error": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+    kinds = [kind for kind in request.query_params.get('types', '').split(',') if kind in KINDS]
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), AUTOCOMPLETE_MAX_LIMIT)
+    except ValueError:
+        return Response({"error": "limit must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+    index = get_prefix_index()
+    if index is None:
+        return Response({"error": "The search index is not built yet, try again later"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    return Response({'results': index.search(text, kinds=kinds, limit=limit)})
 
-    serializer = VisitedCitySerializer(visits, many=True)
-    return Response(serializer.data)
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def visits_by_region(request, region_id):
+    listing, error = _parse_city_listing(request)
+    if error:
+        return error
+    visits = VisitedCity.objects.filter(city__region_id=region_id, user_id=request.user.id).order_by('city__name', 'id')
+    if listing['compact']:
+        visits = visits.values_list('id', 'city_id', 'city__name', 'city__latitude', 'city__longitude')
+    else:
+        visits = visits.select_related('city', 'user_id')
+    return _city_listing(
+        region_id, visits, listing, 'city__name',
+        lambda rows: VisitedCitySerializer(rows, many=True).data,
+        ['id', 'city', 'name', 'latitude', 'longitude'],
+    )
 
 class CountryViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Country.objects.all().order_by('name')
     serializer_class = CountrySerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Country.objects.with_counts(self.request.user).order_by('name')
+
     @action(detail=False, methods=['get'])
     def check_point_in_region(self, request):
         lat = float(request.query_params.get('lat'))
@@ -92,6 +184,21 @@ class RegionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = RegionSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        return Region.objects.with_counts()
+
+def _parse_bulk_visits(request, ids_key, parent_key):
+    # {"regions": [...]} and/or {"country": "US"}, {"cities": [...]} and/or {"region": "..."}
+    ids = request.data.get(ids_key, [])
+    parent = request.data.get(parent_key)
+    if not isinstance(ids, list) or len(ids) > BULK_VISIT_MAX_IDS:
+        return None, None, Response(
+            {"error": f"{ids_key} must be a list of at most {BULK_VISIT_MAX_IDS} ids"}, status=status.HTTP_400_BAD_REQUEST,
+        )
+    if not ids and not parent:
+        return None, None, Response({"error": f"{ids_key} or {parent_key} is required"}, status=status.HTTP_400_BAD_REQUEST)
+    return [str(id) for id in ids], str(parent) if parent else None, None
+
 class VisitedRegionViewSet(viewsets.ModelViewSet):
     serializer_class = VisitedRegionSerializer
     permission_classes = [IsAuthenticated]
@@ -121,6 +228,22 @@ class VisitedRegionViewSet(viewsets.ModelViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return Response({"error": "Visited region not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'])
+    def bulk_mark(self, request):
+        region_ids, country_code, error = _parse_bulk_visits(request, 'regions', 'country')
+        if error:
+            return error
+        created = mark_regions(request.user.id, region_ids, country_code)
+        return Response({'regions_created': created})
+
+    @action(detail=False, methods=['post'])
+    def bulk_unmark(self, request):
+        region_ids, country_code, error = _parse_bulk_visits(request, 'regions', 'country')
+        if error:
+            return error
+        deleted = unmark_regions(request.user.id, region_ids, country_code)
+        return Response({'regions_deleted': deleted})
     
 class VisitedCityViewSet(viewsets.ModelViewSet):
     serializer_class = VisitedCitySerializer
@@ -152,4 +275,20 @@ class VisitedCityViewSet(viewsets.ModelViewSet):
             visited_city.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
-            return Response({"error": "Visited city not found."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({"error": "Visited city not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['post'])
+    def bulk_mark(self, request):
+        city_ids, region_id, error = _parse_bulk_visits(request, 'cities', 'region')
+        if error:
+            return error
+        cities_created, regions_created = mark_cities(request.user.id, city_ids, region_id)
+        return Response({'cities_created': cities_created, 'regions_created': regions_created})
+
+    @action(detail=False, methods=['post'])
+    def bulk_unmark(self, request):
+        city_ids, region_id, error = _parse_bulk_visits(request, 'cities', 'region')
+        if error:
+            return error
+        deleted = unmark_cities(request.user.id, city_ids, region_id)
+        return Response({'cities_deleted': deleted})
@@ -1,6 +1,8 @@
 import requests
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 # The version of the CDN, this should be updated when the CDN data is updated so the client can check if it has the latest version
 ADVENTURELOG_CDN_VERSION = 'v0.0.1'
@@ -8,6 +10,9 @@ ADVENTURELOG_CDN_VERSION = 'v0.0.1'
 # https://github.com/dr5hn/countries-states-cities-database/tags
 COUNTRY_REGION_JSON_VERSION = 'v2.5' # Test on past and latest versions to ensure that the data schema is consistent before updating
 
+# Number of flags downloaded at the same time
+FLAG_WORKERS = 8
+
 def makeDataDir():
     """
     Creates the data directory if it doesn't exist
@@ -37,46 +42,43 @@ def downloadCountriesStateCities():
         f.write(res.text)
         print('Countries, states and cities data downloaded successfully')
 
-def saveCountryFlag(country_code, name):
+def saveCountryFlag(session, country_code, name):
     """
     Downloads the flag of a country and saves it in the data/flags directory
     """
     # For standards, use the lowercase country_code
     country_code = country_code.lower()
-    # Save the flag in the data/flags directory
-    flags_dir = os.path.join(os.path.dirname(__file__), 'data', 'flags')
-
-    # Check if the flags directory exists, if not, create it
-    if not os.path.exists(flags_dir):
-        os.makedirs(flags_dir)
-
-    # Check if the flag already exists in the media folder
-    flag_path = os.path.join(flags_dir, f'{country_code}.png')
-    if os.path.exists(flag_path):
-        # remove the flag if it already exists
-        os.remove(flag_path)
-        print(f'Flag for {country_code} ({name}) removed')
+    flag_path = os.path.join(os.path.dirname(__file__), 'data', 'flags', f'{country_code}.png')
 
-    res = requests.get(f'https://flagcdn.com/h240/{country_code}.png'.lower())
-    if res.status_code == 200:
-        with open(flag_path, 'wb') as f:
+    try:
+        res = session.get(f'https://flagcdn.com/h240/{country_code}.png', timeout=30)
+    except requests.RequestException:
+        res = None
+    if res is not None and res.status_code == 200:
+        # Written next to the old flag and moved over it, so a failed download keeps the old one
+        with open(f'{flag_path}.part', 'wb') as f:
             f.write(res.content)
+        os.replace(f'{flag_path}.part', flag_path)
         print(f'Flag for {country_code} downloaded')
     else:
         print(f'Error downloading flag for {country_code} ({name})')
 
 def saveCountryFlags():
     """
-    Downloads the flags of all countries and saves them in the data/flags directory
+    Downloads the flags of all countries and saves them in the data/flags directory, a few at a time
     """
     # Load the countries data
     with open(os.path.join(os.path.dirname(__file__), 'data', f'countries_states_cities.json')) as f:
         data = json.load(f)
 
-    for country in data:
-        country_code = country['iso2']
-        name = country['name']
-        saveCountryFlag(country_code, name)
+    os.makedirs(os.path.join(os.path.dirname(__file__), 'data', 'flags'), exist_ok=True)
+    with requests.Session() as session:
+        session.mount('https://', HTTPAdapter(pool_maxsize=FLAG_WORKERS))
+        with ThreadPoolExecutor(max_workers=FLAG_WORKERS) as executor:
+            futures = [executor.submit(saveCountryFlag, session, country['iso2'], country['name']) for country in data]
+            # Raises the first error of a worker (e.g. a failed write) instead of dropping it
+            for future in futures:
+                future.result()
 
 # Run the functions
 print('Starting CDN update')
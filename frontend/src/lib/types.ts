@@ -50,6 +50,16 @@ export type Country = {
 	country_code: string;
 	subregion: string;
 	flag_url: string;
+	flag_sprite: {
+		url: string;
+		fallback_url: string;
+		sheet_width: number;
+		sheet_height: number;
+		x: number;
+		y: number;
+		width: number;
+		height: number;
+	} | null;
 	capital: string;
 	num_regions: number;
 	num_visits: number;